@@ -1,23 +1,55 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g
 import sqlite3
 import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import urllib.parse
-from database import get_db_connection, init_database, hash_password, check_password
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup
+from database import (get_db, get_pool, init_app, init_database, ejecutar_escritura,
+                      estadisticas_contencion)
+from catalogo import cache_catalogo, cache_fragmentos
+from busqueda import POR_PAGINA, buscar_productos, sugerencias
+from paginacion import pagina_keyset, tamano_pagina
+from estadisticas import resumen as resumen_estadisticas
+import reportes
+from exportar import ExportacionInvalida, exportar
+from estados import CambioInvalido, cambiar_estado, condicion_estado, historial
+from importar import ImportacionInvalida, formato_de, importar
+from carrito import contar_carrito, fusionar_carrito
+from pedidos import (CarritoVacio, ClaveEnUso, StockInsuficiente, iniciar_migracion_detalles,
+                     registrar_pedido, unidades_vendidas)
+from contrasenas import ContrasenasSaturadas, get_pool_contrasenas, necesita_rehash
+from imagenes import encolar_derivados, init_app as init_imagenes
+from subidas import SubidaRechazada, leer_formulario, init_app as init_subidas
+from estaticos import init_app as init_estaticos
+from compresion import condicional, init_app as init_compresion
 import os
 import re
-from werkzeug.utils import secure_filename
+import time
 
 app = Flask(__name__)
 app.secret_key = 'tu_clave_secreta_muy_segura_2024'
 
 # Configuración para subida de archivos
 UPLOAD_FOLDER = 'static/images/productos'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB máximo
+MAX_IMPORTACION = int(os.environ.get('TIENDA_IMPORTAR_MAX_MB', 512)) * 1024 * 1024
+
+COMENTARIOS_POR_PAGINA = 10
+
+# Pool de conexiones: una conexión por petición, liberada en el teardown
+init_app(app)
+# Filtros |derivados y |srcset, y caché inmutable para el almacén de imágenes
+init_imagenes(app)
+# Borrar temporales de subidas rechazadas al terminar cada petición
+init_subidas(app)
+# CSS/JS compilados (python estaticos.py): url_for con hash y variantes .br/.gz
+init_estaticos(app)
+# gzip/brotli, ETag débil y 304 para HTML y JSON
+init_compresion(app)
 
 # Crear carpetas de imágenes si no existen
 def create_upload_folders():
@@ -34,10 +66,6 @@ def create_upload_folders():
 # Crear carpetas al iniciar
 create_upload_folders()
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
 # Inicializar base de datos al iniciar
 def initialize():
     init_database()
@@ -46,6 +74,10 @@ def initialize():
         populate_database()
     except Exception as e:
         pass  # Si ya está poblada
+    # Órdenes con el JSON detalles de antes de orden_items
+    iniciar_migracion_detalles()
+    # Agregados de ventas de las órdenes que llegaron con la app detenida
+    reportes.iniciar_acumulacion()
 
 # Registrar la función de inicialización para que se ejecute antes de la primera petición
 with app.app_context():
@@ -92,62 +124,33 @@ def validar_nombre(nombre):
 # ========== RUTAS ORIGINALES (SIN CAMBIOS) ==========
 
 @app.route('/')
+@condicional('catalogo', 'resenas')
 def index():
-    conn = get_db_connection()
+    conn = get_db()
     
-    # Consulta de productos (código existente)
-    query = '''
-        SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
-        FROM productos p
-        JOIN categorias c ON p.categoria_id = c.id
-        WHERE p.activo = 1
-        ORDER BY c.tipo, c.nombre, p.nombre
-    '''
-    productos = conn.execute(query).fetchall()
-    
-    # Organizar productos (código existente)
-    productos_organizados = {
-        'hombres': [],
-        'mujeres': [],
-        'ninos': [],
-        'ofertas': []
-    }
-    for producto in productos:
-        productos_organizados[producto['categoria_tipo']].append(producto)
+    # Catálogo y reseñas desde la caché del worker (se invalida por versión);
+    # @condicional ya leyó las versiones para el ETag
+    versiones = g.versiones
+    catalogo = cache_catalogo.catalogo(conn, versiones)
+    comentarios_aprobados = cache_catalogo.resenas_tienda(conn, versiones)
     
-    # Obtener categorías (código existente)
-    categorias = conn.execute('SELECT * FROM categorias ORDER BY tipo, nombre').fetchall()
+    # ?orden=calificacion|popularidad ordena las grillas con los puntajes ya guardados
+    orden = request.args.get('orden') if request.args.get('orden') in ('calificacion', 'popularidad') else None
     
-    # ✅ Obtener comentarios aprobados con nombres de columna CORRECTOS
-    comentarios_rows = conn.execute('''
-    SELECT c.*, u.nombre as usuario_nombre
-    FROM comentarios c
-    JOIN usuarios u ON c.usuario_id = u.id
-    WHERE c.aprobado = 1 AND c.producto_id IS NULL
-    ORDER BY c.fecha DESC
-    LIMIT 5
-''').fetchall()
-    
-    # ✅ Convertir Row objects a diccionarios - usando "calificacion" no "puntuacion"
-    comentarios_aprobados = []
-    for row in comentarios_rows:
-        comentarios_aprobados.append({
-            'id': row['id'],
-            'usuario_id': row['usuario_id'],
-            'producto_id': row['producto_id'],
-            'puntuacion': row['calificacion'],  # ✅ AQUÍ ESTÁ EL CAMBIO: calificacion -> puntuacion para el frontend
-            'comentario': row['comentario'],
-            'fecha': row['fecha'],
-            'aprobado': row['aprobado'],
-            'usuario_nombre': row['usuario_nombre'],
-        })
-    
-    conn.close()
+    # Las partes anónimas se renderizan una vez por versión; navbar y carrito no entran en la caché
+    grilla_html = cache_fragmentos.obtener(
+        ('grilla', catalogo.version, orden),
+        lambda: render_template('_grilla_catalogo.html', productos_organizados=catalogo.productos_organizados(orden)))
+    resenas_json = cache_fragmentos.obtener(
+        ('resenas_tienda', versiones.get('resenas', 0)),
+        lambda: htmlsafe_json_dumps(comentarios_aprobados, dumps=app.json.dumps))
     
     return render_template('index.html', 
-                         productos_organizados=productos_organizados,
-                         categorias=categorias,
-                         comentarios_aprobados=comentarios_aprobados)
+                         productos_organizados=catalogo.productos_organizados(),
+                         categorias=catalogo.categorias,
+                         orden=orden,
+                         grilla_html=grilla_html,
+                         resenas_json=resenas_json)
 
 @app.route('/agregar_comentario_tienda', methods=['POST'])
 def agregar_comentario_tienda():
@@ -160,107 +163,141 @@ def agregar_comentario_tienda():
     if not calificacion or not comentario:
         return jsonify({'success': False, 'message': 'Faltan datos'})
     
-    conn = get_db_connection()
-    conn.execute('''
+    conn = get_db()
+    ejecutar_escritura(conn, lambda conn: conn.execute('''
         INSERT INTO comentarios (usuario_id, producto_id, calificacion, comentario, aprobado)
         VALUES (?, NULL, ?, ?, ?)
-    ''', (session['user_id'], calificacion, comentario, 1 if int(calificacion) >= 4 else 0))
-    conn.commit()
-    conn.close()
+    ''', (session['user_id'], calificacion, comentario, 1 if int(calificacion) >= 4 else 0)))
     
     return jsonify({'success': True, 'message': 'Comentario sobre la tienda enviado'})  
 
 @app.route('/producto/<int:producto_id>')
 def detalle_producto(producto_id):
-    conn = get_db_connection()
-    producto = conn.execute('''
-        SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
-        FROM productos p
-        JOIN categorias c ON p.categoria_id = c.id
-        WHERE p.id = ? AND p.activo = 1
-    ''', (producto_id,)).fetchone()
+    conn = get_db()
+    versiones = cache_catalogo.versiones(conn)
+    catalogo = cache_catalogo.catalogo(conn, versiones)
+    producto = catalogo.por_id.get(producto_id)
     
     if not producto:
         flash('Producto no encontrado', 'error')
         return redirect(url_for('index'))
     
-    # Mostrar comentarios aprobados y, si el usuario está logueado, también mostrar
-    # los comentarios propios del usuario aunque estén pendientes de aprobación.
+    # Página de comentarios aprobados por índice (producto_id, aprobado, fecha) y
+    # promedio/cantidad ya acumulados en productos: el costo no crece con las reseñas
+    cursor = request.args.get('comentarios')
+    comentarios, siguiente = pagina_keyset(
+        conn, 'comentarios', 'fecha', ['producto_id = ?', 'aprobado = 1'], [producto_id],
+        cursor=cursor, tamano=COMENTARIOS_POR_PAGINA,
+        columnas='comentarios.*, (SELECT nombre FROM usuarios WHERE id = comentarios.usuario_id) AS usuario_nombre')
+    # La foto del catálogo ya trae los acumulados: la migración 9 sube su versión cuando cambian
+    calificacion = {
+        'cantidad': producto['calificacion_cantidad'],
+        'promedio': (producto['calificacion_suma'] / producto['calificacion_cantidad']
+                     if producto['calificacion_cantidad'] else 0),
+    }
+
+    # Si el usuario está logueado también ve sus comentarios pendientes de aprobación
     usuario_id = session.get('user_id')
-    if usuario_id:
-        comentarios = conn.execute('''
+    pendientes = []
+    if usuario_id and not cursor:
+        pendientes = conn.execute('''
             SELECT c.*, u.nombre as usuario_nombre
             FROM comentarios c
             JOIN usuarios u ON c.usuario_id = u.id
-            WHERE c.producto_id = ? AND (c.aprobado = 1 OR c.usuario_id = ?)
+            WHERE c.producto_id = ? AND c.aprobado = 0 AND c.usuario_id = ?
             ORDER BY c.fecha DESC
         ''', (producto_id, usuario_id)).fetchall()
-    else:
-        comentarios = conn.execute('''
-            SELECT c.*, u.nombre as usuario_nombre
-            FROM comentarios c
-            JOIN usuarios u ON c.usuario_id = u.id
-            WHERE c.producto_id = ? AND c.aprobado = 1
-            ORDER BY c.fecha DESC
-        ''', (producto_id,)).fetchall()
-    
-    relacionados = conn.execute('''
-        SELECT * FROM productos
-        WHERE categoria_id = ? AND id != ? AND activo = 1
-        LIMIT 4
-    ''', (producto['categoria_id'], producto_id)).fetchall()
     
-    conn.close()
+    relacionados_html = cache_fragmentos.obtener(
+        ('relacionados', producto_id, catalogo.version),
+        lambda: render_template('_relacionados.html', relacionados=catalogo.relacionados(producto)))
+    # La lista con pendientes propios es personal: no se comparte en la caché
+    if pendientes:
+        comentarios_html = Markup(render_template('_comentarios_producto.html', comentarios=pendientes + comentarios))
+    elif comentarios:
+        comentarios_html = cache_fragmentos.obtener(
+            ('comentarios', producto_id, versiones.get('resenas', 0), cursor),
+            lambda: render_template('_comentarios_producto.html', comentarios=comentarios))
+    else:
+        comentarios_html = ''
     
     return render_template('producto.html', 
                          producto=producto,
-                         comentarios=comentarios,
-                         relacionados=relacionados)
+                         comentarios=pendientes + comentarios,
+                         calificacion=calificacion,
+                         comentarios_siguiente=siguiente,
+                         comentarios_html=comentarios_html,
+                         relacionados_html=relacionados_html)
 
 @app.route('/buscar')
 def buscar():
     query = request.args.get('q', '')
     categoria = request.args.get('categoria', '')
+    pagina = request.args.get('pagina', 1, type=int)
+    orden = request.args.get('orden', '')
     
-    conn = get_db_connection()
-    sql = '''
-        SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
-        FROM productos p
-        JOIN categorias c ON p.categoria_id = c.id
-        WHERE p.activo = 1
-    '''
-    params = []
+    conn = get_db()
+    catalogo = cache_catalogo.catalogo(conn)
     
     if query:
-        sql += ' AND (p.nombre LIKE ? OR p.descripcion LIKE ?)'
-        params.extend([f'%{query}%', f'%{query}%'])
-    
-    if categoria:
-        sql += ' AND c.tipo = ?'
-        params.append(categoria)
-    
-    sql += ' ORDER BY p.nombre'
-    resultados = conn.execute(sql, params).fetchall()
-    categorias = conn.execute('SELECT DISTINCT tipo FROM categorias').fetchall()
-    conn.close()
+        # Texto completo con FTS5, ordenado por relevancia (BM25) salvo que se pida otro orden
+        resultados, total = buscar_productos(conn, query, categoria, pagina, orden=orden or 'relevancia')
+    else:
+        # Navegación por categoría: sale de la caché sin tocar SQLite (ordenada una vez por versión)
+        productos = catalogo.por_tipo_ordenados(categoria, orden or 'nombre')
+        total = len(productos)
+        inicio = (max(1, pagina) - 1) * POR_PAGINA
+        resultados = productos[inicio:inicio + POR_PAGINA]
+    categorias = [{'tipo': tipo} for tipo in catalogo.tipos]
     
     return render_template('buscar.html',
                          resultados=resultados,
+                         total=total,
+                         pagina=max(1, pagina),
+                         paginas=max(1, -(-total // POR_PAGINA)),
                          categorias=categorias,
                          query=query,
+                         orden=orden,
                          categoria_seleccionada=categoria)
 
+@app.route('/api/buscar/sugerencias')
+def buscar_sugerencias():
+    """Autocompletado de productos para el buscador"""
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        return jsonify({'success': True, 'sugerencias': []})
+    
+    return jsonify({
+        'success': True,
+        'sugerencias': sugerencias(get_db(), query)
+    })
+
 def get_session_id():
     if 'session_id' not in session:
         session['session_id'] = str(uuid.uuid4())
     return session['session_id']
 
+def contador_carrito():
+    """Unidades en el carrito, guardadas en la sesión firmada.
+
+    Solo se consulta SQLite la primera vez en la sesión o después de que una
+    escritura del carrito descartó el valor; las demás lo leen de la cookie.
+    """
+    if 'carrito_count' not in session:
+        session['carrito_count'] = contar_carrito(get_db(), session.get('user_id'), get_session_id())
+    return session['carrito_count']
+
+@app.context_processor
+def inyectar_contador_carrito():
+    # El badge del navbar se pinta con el valor ya conocido, sin pedir /api/carrito/count
+    return {'carrito_count': contador_carrito()}
+
 @app.route('/agregar_carrito', methods=['POST'])
 def agregar_carrito():
     producto_id = request.form.get('producto_id')
     cantidad = int(request.form.get('cantidad', 1))
     
-    conn = get_db_connection()
+    conn = get_db()
     producto = conn.execute('SELECT * FROM productos WHERE id = ? AND activo = 1', 
                            (producto_id,)).fetchone()
     
@@ -270,44 +307,37 @@ def agregar_carrito():
     usuario_id = session.get('user_id')
     session_id = get_session_id()
     
+    # Un solo INSERT atómico: los índices únicos parciales (migración 6) resuelven
+    # el conflicto sumando la cantidad a la línea existente
     if usuario_id:
-        existente = conn.execute(
-            'SELECT * FROM carrito WHERE usuario_id = ? AND producto_id = ?',
-            (usuario_id, producto_id)
-        ).fetchone()
-    else:
-        existente = conn.execute(
-            'SELECT * FROM carrito WHERE session_id = ? AND producto_id = ?',
-            (session_id, producto_id)
-        ).fetchone()
-    
-    if existente:
-        nueva_cantidad = existente['cantidad'] + cantidad
-        conn.execute(
-            'UPDATE carrito SET cantidad = ? WHERE id = ?',
-            (nueva_cantidad, existente['id'])
-        )
+        conflicto = '(usuario_id, producto_id) WHERE usuario_id IS NOT NULL'
     else:
-        conn.execute('''
+        conflicto = '(session_id, producto_id) WHERE usuario_id IS NULL'
+    
+    def escribir(conn):
+        linea = conn.execute(f'''
             INSERT INTO carrito (usuario_id, producto_id, cantidad, precio_unitario, session_id)
             VALUES (?, ?, ?, ?, ?)
-        ''', (usuario_id, producto_id, cantidad, producto['precio'], session_id))
+            ON CONFLICT {conflicto} DO UPDATE SET cantidad = cantidad + excluded.cantidad
+            RETURNING id, producto_id, cantidad, precio_unitario
+        ''', (usuario_id, producto['id'], cantidad, producto['precio'], session_id)).fetchone()
+        return dict(linea), contar_carrito(conn, usuario_id, session_id)
     
-    conn.commit()
-    conn.close()
+    linea, count = ejecutar_escritura(conn, escribir)
+    session['carrito_count'] = count
     
-    return jsonify({'success': True, 'message': 'Producto agregado al carrito'})
+    return jsonify({'success': True, 'message': 'Producto agregado al carrito', 'item': linea, 'count': count})
 
 @app.route('/carrito')
 def carrito():
-    conn = get_db_connection()
+    conn = get_db()
     
     usuario_id = session.get('user_id')
     session_id = get_session_id()
     
     if usuario_id:
         items = conn.execute('''
-            SELECT c.*, p.nombre, p.imagen, p.precio as precio_actual
+            SELECT c.*, p.nombre, p.imagen, p.imagen_derivados, p.precio as precio_actual
             FROM carrito c
             JOIN productos p ON c.producto_id = p.id
             WHERE c.usuario_id = ?
@@ -315,36 +345,25 @@ def carrito():
         ''', (usuario_id,)).fetchall()
     else:
         items = conn.execute('''
-            SELECT c.*, p.nombre, p.imagen, p.precio as precio_actual
+            SELECT c.*, p.nombre, p.imagen, p.imagen_derivados, p.precio as precio_actual
             FROM carrito c
             JOIN productos p ON c.producto_id = p.id
-            WHERE c.session_id = ?
+            WHERE c.session_id = ? AND c.usuario_id IS NULL
             ORDER BY c.fecha DESC
         ''', (session_id,)).fetchall()
     
     total = sum(item['precio_unitario'] * item['cantidad'] for item in items)
     
-    conn.close()
-    
     return render_template('carrito.html', items=items, total=total)
 
 @app.route('/api/carrito/count')
 def get_carrito_count():
-    conn = get_db_connection()
-    usuario_id = session.get('user_id')
-    session_id = get_session_id()
-    
-    if usuario_id:
-        count = conn.execute('''
-            SELECT SUM(cantidad) FROM carrito WHERE usuario_id = ?
-        ''', (usuario_id,)).fetchone()[0]
-    else:
-        count = conn.execute('''
-            SELECT SUM(cantidad) FROM carrito WHERE session_id = ?
-        ''', (session_id,)).fetchone()[0]
-    
-    conn.close()
-    return jsonify({'count': count or 0})
+    count = contador_carrito()
+    respuesta = jsonify({'count': count})
+    # El cuerpo solo depende del número: si coincide con el ETag del cliente, 304
+    respuesta.set_etag(f'carrito-{count}', weak=True)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta.make_conditional(request)
 
 @app.route('/actualizar_carrito', methods=['POST'])
 def actualizar_carrito():
@@ -354,25 +373,25 @@ def actualizar_carrito():
     if cantidad <= 0:
         return redirect(url_for('eliminar_carrito', item_id=item_id))
     
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('UPDATE carrito SET cantidad = ? WHERE id = ?', (cantidad, item_id))
     conn.commit()
-    conn.close()
+    session.pop('carrito_count', None)
     
     return redirect(url_for('carrito'))
 
 @app.route('/eliminar_carrito/<int:item_id>')
 def eliminar_carrito(item_id):
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute('DELETE FROM carrito WHERE id = ?', (item_id,))
     conn.commit()
-    conn.close()
+    session.pop('carrito_count', None)
     
     return redirect(url_for('carrito'))
 
 @app.route('/checkout')
 def checkout():
-    conn = get_db_connection()
+    conn = get_db()
     
     usuario_id = session.get('user_id')
     session_id = get_session_id()
@@ -389,7 +408,7 @@ def checkout():
             SELECT c.*, p.nombre
             FROM carrito c
             JOIN productos p ON c.producto_id = p.id
-            WHERE c.session_id = ?
+            WHERE c.session_id = ? AND c.usuario_id IS NULL
         ''', (session_id,)).fetchall()
     
     if not items:
@@ -402,9 +421,9 @@ def checkout():
     if usuario_id:
         usuario = conn.execute('SELECT * FROM usuarios WHERE id = ?', (usuario_id,)).fetchone()
     
-    conn.close()
-    
-    return render_template('checkout.html', items=items, total=total, usuario=usuario)
+    # Una clave por visita al checkout: si el formulario se envía dos veces, es la misma orden
+    return render_template('checkout.html', items=items, total=total, usuario=usuario,
+                           clave_pedido=uuid.uuid4().hex)
 
 @app.route('/procesar_pedido', methods=['POST'])
 def procesar_pedido():
@@ -433,55 +452,41 @@ def procesar_pedido():
         flash('Método de pago inválido.', 'error')
         return redirect(url_for('checkout'))
 
-    conn = get_db_connection()
+    conn = get_db()
     usuario_id = session.get('user_id')
     session_id = get_session_id()
+    clave = (request.headers.get('Idempotency-Key') or request.form.get('clave_pedido', '')).strip()[:64] or None
 
-    # Depuración: Verificar los items del carrito
-    if usuario_id:
-        items = conn.execute('SELECT c.*, p.nombre, p.imagen FROM carrito c JOIN productos p ON c.producto_id = p.id WHERE c.usuario_id = ?', (usuario_id,)).fetchall()
-    else:
-        items = conn.execute('SELECT c.*, p.nombre, p.imagen FROM carrito c JOIN productos p ON c.producto_id = p.id WHERE c.session_id = ?', (session_id,)).fetchall()
-    print(f"Items en carrito: {items}")  # Depuración
-
-    # Verificar si el carrito está vacío
-    if not items:
+    try:
+        orden = registrar_pedido(
+            conn, usuario_id, session_id,
+            {'nombre': nombre, 'telefono': telefono, 'metodo_pago': metodo_pago},
+            {'metodo': metodo_entrega, 'direccion': direccion, 'ciudad': ciudad},
+            {'nit': nit, 'ci': ci} if facturar else None,
+            clave=clave,
+        )
+    except CarritoVacio:
         flash('Tu carrito está vacío. Agrega productos antes de procesar el pedido.', 'error')
-        conn.close()
         return redirect(url_for('carrito'))
+    except StockInsuficiente as error:
+        flash(f"No hay stock suficiente de: {', '.join(error.productos)}. Ajusta las cantidades.", 'error')
+        return redirect(url_for('carrito'))
+    except ClaveEnUso:
+        flash('No se pudo procesar el pedido. Vuelve a intentarlo desde el checkout.', 'error')
+        return redirect(url_for('checkout'))
+    session['carrito_count'] = 0
 
-    total = sum(item['precio_unitario'] * item['cantidad'] for item in items)
-    envio_costo = 20.0 if metodo_entrega == 'envio' else 0.0
-    total_con_envio = total + envio_costo
-
-    detalles = {
-        'items': [{'producto': item['nombre'], 'cantidad': item['cantidad'], 
-                   'precio_unitario': float(item['precio_unitario']), 
-                   'subtotal': float(item['precio_unitario'] * item['cantidad'])} 
-                  for item in items],
-        'entrega': {'metodo': metodo_entrega, 'direccion': direccion, 'ciudad': ciudad, 'costo': envio_costo},
-        'facturacion': {'facturar': facturar, 'nit': nit, 'ci': ci} if facturar else None
-    }
-
-    cursor = conn.execute('INSERT INTO ordenes (usuario_id, nombre_cliente, telefono_cliente, total, metodo_pago, detalles, estado) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                         (usuario_id, nombre, telefono, total_con_envio, metodo_pago, json.dumps(detalles), 'pendiente'))
-    orden_id = cursor.lastrowid
-
-    if usuario_id:
-        conn.execute('DELETE FROM carrito WHERE usuario_id = ?', (usuario_id,))
-    else:
-        conn.execute('DELETE FROM carrito WHERE session_id = ?', (session_id,))
-
-    conn.commit()
-    conn.close()
+    # Un reenvío devuelve la orden ya registrada con sus datos originales
+    orden_id, detalles, total_con_envio = orden['id'], orden['detalles'], orden['total']
+    nombre, telefono, metodo_pago = orden['nombre_cliente'], orden['telefono_cliente'], orden['metodo_pago']
 
     # Simulación de pago y redirección
     if metodo_pago == 'tigo_money':
         flash('Pago procesado con Tigo Money. Redirigiendo al comprobante...', 'success')
-        return render_template('factura.html', orden_id=orden_id, nombre=nombre, telefono=telefono, total=total_con_envio, metodo_pago=metodo_pago, detalles=detalles, estado='pendiente', tipo_documento='Comprobante', fecha=datetime.now())
+        return render_template('factura.html', orden_id=orden_id, nombre=nombre, telefono=telefono, total=total_con_envio, metodo_pago=metodo_pago, detalles=detalles, estado=orden['estado'], tipo_documento='Comprobante', fecha=datetime.now())
     elif metodo_pago == 'qr_simple':
         flash('Pago simulado con QR Simple. Generando comprobante...', 'success')
-        return render_template('factura.html', orden_id=orden_id, nombre=nombre, telefono=telefono, total=total_con_envio, metodo_pago=metodo_pago, detalles=detalles, estado='pendiente', tipo_documento='Comprobante', fecha=datetime.now())
+        return render_template('factura.html', orden_id=orden_id, nombre=nombre, telefono=telefono, total=total_con_envio, metodo_pago=metodo_pago, detalles=detalles, estado=orden['estado'], tipo_documento='Comprobante', fecha=datetime.now())
     elif metodo_pago == 'whatsapp':
         mensaje = f"¡Hola! Quiero realizar este pedido:\n\n*Orden #{orden_id}*\n"
         for item in detalles['items']:
@@ -489,6 +494,12 @@ def procesar_pedido():
         mensaje += f"\n*Total: Bs. {total_con_envio:.2f}*\nCliente: {nombre}\nTeléfono: {telefono}"
         whatsapp_url = f"https://wa.me/59173138524?text={urllib.parse.quote_plus(mensaje)}"
         return redirect(whatsapp_url)
+@app.errorhandler(ContrasenasSaturadas)
+def contrasenas_saturadas(error):
+    # Demasiados logins/registros a la vez: que el cliente reintente en unos segundos
+    flash('Hay muchas solicitudes en este momento. Intenta nuevamente en unos segundos.', 'error')
+    return render_template('login.html'), 503, {'Retry-After': '2'}
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -499,11 +510,18 @@ def login():
             flash('Correo electrónico inválido', 'error')
             return render_template('login.html')
         
-        conn = get_db_connection()
+        conn = get_db()
         usuario = conn.execute('SELECT * FROM usuarios WHERE correo = ?', (correo,)).fetchone()
-        conn.close()
         
-        if usuario and check_password(password, usuario['contraseña']):
+        contrasenas = get_pool_contrasenas()
+        if usuario and contrasenas.verificar(password, usuario['contraseña']):
+            # Cambió TIENDA_BCRYPT_COSTO: regenerar el hash ahora que tenemos la contraseña
+            if necesita_rehash(usuario['contraseña']):
+                nuevo_hash = contrasenas.hash(password)
+                ejecutar_escritura(conn, lambda conn: conn.execute(
+                    'UPDATE usuarios SET contraseña = ? WHERE id = ?', (nuevo_hash, usuario['id'])))
+                contrasenas.registrar_rehash()
+            
             session['user_id'] = usuario['id']
             session['user_name'] = usuario['nombre']
             session['user_role'] = usuario['rol']
@@ -550,15 +568,14 @@ def registro():
             flash('Las contraseñas no coinciden', 'error')
             return render_template('login.html')
         
-        conn = get_db_connection()
+        conn = get_db()
         
         existente = conn.execute('SELECT id FROM usuarios WHERE correo = ?', (correo,)).fetchone()
         if existente:
             flash('Ya existe una cuenta con este correo electrónico', 'error')
-            conn.close()
             return render_template('login.html')
         
-        hashed_password = hash_password(password)
+        hashed_password = get_pool_contrasenas().hash(password)
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO usuarios (nombre, correo, contraseña, telefono, rol)
@@ -568,7 +585,6 @@ def registro():
         user_id = cursor.lastrowid
         conn.commit()
         cursor.close()
-        conn.close()
         
         session['user_id'] = user_id
         session['user_name'] = nombre
@@ -588,37 +604,12 @@ def logout():
     return redirect(url_for('index'))
 
 def migrar_carrito_sesion_a_usuario(usuario_id):
+    # El contador era del carrito anónimo: se recalcula en la próxima página
+    session.pop('carrito_count', None)
     if 'session_id' not in session:
         return
     
-    conn = get_db_connection()
-    session_id = session['session_id']
-    
-    items_sesion = conn.execute(
-        'SELECT * FROM carrito WHERE session_id = ? AND usuario_id IS NULL',
-        (session_id,)
-    ).fetchall()
-    
-    for item in items_sesion:
-        existente = conn.execute(
-            'SELECT * FROM carrito WHERE usuario_id = ? AND producto_id = ?',
-            (usuario_id, item['producto_id'])
-        ).fetchone()
-        
-        if existente:
-            nueva_cantidad = existente['cantidad'] + item['cantidad']
-            conn.execute(
-                'UPDATE carrito SET cantidad = ? WHERE id = ?',
-                (nueva_cantidad, existente['id'])
-            )
-        else:
-            conn.execute(
-                'UPDATE carrito SET usuario_id = ?, session_id = NULL WHERE id = ?',
-                (usuario_id, item['id'])
-            )
-    
-    conn.commit()
-    conn.close()
+    fusionar_carrito(get_db(), session['session_id'], usuario_id)
 
 @app.route('/admin')
 def admin():
@@ -626,83 +617,86 @@ def admin():
         flash('Acceso denegado. Se requieren permisos de administrador.', 'error')
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = get_db()
     
-    # Estadísticas
-    total_productos = conn.execute('SELECT COUNT(*) FROM productos WHERE activo = 1').fetchone()[0]
-    total_ordenes = conn.execute('SELECT COUNT(*) FROM ordenes').fetchone()[0]
-    comentarios_pendientes = conn.execute('SELECT COUNT(*) FROM comentarios WHERE aprobado = 0').fetchone()[0]
+    # Estadísticas materializadas (mantenidas por triggers, ver estadisticas.py)
+    estadisticas = resumen_estadisticas(conn)
     
-    # Productos recientes
-    rows = conn.execute('''
-        SELECT p.*, c.nombre as categoria_nombre
+    # Productos recientes (la fecha llega formateada desde SQLite)
+    productos_recientes = conn.execute('''
+        SELECT p.*, c.nombre as categoria_nombre,
+               strftime('%d/%m/%Y', p.fecha_creacion) as fecha_creacion_fmt
         FROM productos p
         JOIN categorias c ON p.categoria_id = c.id
         WHERE p.activo = 1
         ORDER BY p.fecha_creacion DESC
         LIMIT 5
     ''').fetchall()
-    productos_recientes = [dict(row) for row in rows]
-    for producto in productos_recientes:
-        if producto['fecha_creacion']:
-            try:
-                producto['fecha_creacion'] = datetime.strptime(producto['fecha_creacion'], '%Y-%m-%d %H:%M:%S')
-            except (ValueError, TypeError):
-                producto['fecha_creacion'] = None
     
     # Órdenes recientes con método de pago
-    rows = conn.execute('''
-        SELECT * FROM ordenes
+    ordenes_recientes = conn.execute('''
+        SELECT *, strftime('%d/%m/%Y %H:%M', fecha) as fecha_fmt FROM ordenes
         ORDER BY fecha DESC
         LIMIT 5
     ''').fetchall()
-    ordenes_recientes = [dict(row) for row in rows]
-    for orden in ordenes_recientes:
-        if orden.get('fecha'):
-            try:
-                orden['fecha'] = datetime.strptime(orden['fecha'], '%Y-%m-%d %H:%M:%S')
-            except (ValueError, TypeError):
-                orden['fecha'] = None
-    
-    conn.close()
     
     return render_template('admin.html',
-                          total_productos=total_productos,
-                          total_ordenes=total_ordenes,
-                          comentarios_pendientes=comentarios_pendientes,
+                          total_productos=estadisticas['total_productos'],
+                          total_ordenes=estadisticas['total_ordenes'],
+                          comentarios_pendientes=estadisticas['comentarios_pendientes'],
+                          estadisticas=estadisticas,
                           productos_recientes=productos_recientes,
                           ordenes_recientes=ordenes_recientes)
 @app.route('/productos')
 def ver_productos():
-    conn = get_db_connection()
-    productos = conn.execute('SELECT * FROM productos WHERE activo = 1 ORDER BY fecha_creacion DESC').fetchall()
-    conn.close()
-    return render_template('productos.html', productos=productos)
+    conn = get_db()
+    productos, siguiente = pagina_keyset(conn, 'productos', 'fecha_creacion', ['activo = 1'],
+                                         cursor=request.args.get('cursor'),
+                                         tamano=tamano_pagina(request.args.get('limite')))
+    return render_template('productos.html', productos=productos, siguiente=siguiente)
+
+def filtros_ordenes(args):
+    """Condiciones SQL y parámetros para los filtros de /ordenes"""
+    condiciones = []
+    params = []
+    if args.get('estado'):
+        condiciones.append('estado = ?')
+        params.append(args.get('estado'))
+    if args.get('fecha_inicio'):
+        condiciones.append('fecha >= ?')
+        params.append(args.get('fecha_inicio'))
+    if args.get('fecha_fin'):
+        condiciones.append('fecha <= ?')
+        params.append(args.get('fecha_fin'))
+    if args.get('metodo_pago'):
+        condiciones.append('metodo_pago = ?')
+        params.append(args.get('metodo_pago'))
+    return condiciones, params
 
 @app.route('/ordenes')
 def ver_ordenes():
-    conn = get_db_connection()
-    query = "SELECT * FROM ordenes"
-    params = []
+    conn = get_db()
     
     # Aplicar filtros desde los parámetros GET
-    if request.args.get('estado'):
-        query += " WHERE estado = ?"
-        params.append(request.args.get('estado'))
-    if request.args.get('fecha_inicio'):
-        query += " WHERE fecha >= ?" if not params else " AND fecha >= ?"
-        params.append(request.args.get('fecha_inicio'))
-    if request.args.get('fecha_fin'):
-        query += " WHERE fecha <= ?" if not params else " AND fecha <= ?"
-        params.append(request.args.get('fecha_fin'))
-    if request.args.get('metodo_pago'):
-        query += " WHERE metodo_pago = ?" if not params else " AND metodo_pago = ?"
-        params.append(request.args.get('metodo_pago'))
-    
-    query += " ORDER BY fecha DESC"
-    ordenes = conn.execute(query, params).fetchall()
-    conn.close()
-    return render_template('ordenes.html', ordenes=ordenes)
+    condiciones, params = filtros_ordenes(request.args)
+    ordenes, siguiente = pagina_keyset(conn, 'ordenes', 'fecha', condiciones, params,
+                                       cursor=request.args.get('cursor'),
+                                       tamano=tamano_pagina(request.args.get('limite')))
+    filtros = {k: v for k, v in request.args.items() if k not in ('cursor',) and v}
+    return render_template('ordenes.html', ordenes=ordenes, siguiente=siguiente, filtros=filtros)
+
+def mensaje_cambio(resultado):
+    """Resumen para flash de un cambio de estado hecho con estados.cambiar_estado"""
+    partes = []
+    if resultado['actualizadas']:
+        partes.append(f"Estado de {resultado['actualizadas']} órdenes actualizado a {resultado['estado']}.")
+    if resultado['sin_cambio']:
+        partes.append(f"{resultado['sin_cambio']} ya estaban en {resultado['estado']}.")
+    for anterior, cantidad in resultado['rechazadas'].items():
+        partes.append(f"{cantidad} no se cambiaron: no se puede pasar de {anterior} a {resultado['estado']}.")
+    if resultado['no_encontradas']:
+        partes.append(f"{resultado['no_encontradas']} no existen.")
+    return ' '.join(partes)
 
 @app.route('/actualizar_ordenes_masa', methods=['POST'])
 def actualizar_ordenes_masa():
@@ -710,27 +704,20 @@ def actualizar_ordenes_masa():
         flash('Acceso denegado', 'error')
         return redirect(url_for('admin'))
     
-    conn = get_db_connection()
-    ordenes_seleccionadas = request.form.getlist('ordenes_seleccionadas')
-    nuevo_estado = request.form.get('nuevo_estado')
-    
-    # Depuración mejorada
-    print(f"Request form: {dict(request.form)}")
-    print(f"Ordenes seleccionadas: {ordenes_seleccionadas}")
-    print(f"Nuevo estado: {nuevo_estado}")
+    try:
+        ids = [int(i) for i in request.form.getlist('ordenes_seleccionadas')]
+    except ValueError:
+        flash('Selección de órdenes inválida', 'error')
+        return redirect(url_for('ver_ordenes'))
     
-    if ordenes_seleccionadas and nuevo_estado:
-        try:
-            conn.executemany('UPDATE ordenes SET estado = ? WHERE id = ?', [(nuevo_estado, id) for id in ordenes_seleccionadas])
-            conn.commit()
-            flash(f'Estado de {len(ordenes_seleccionadas)} órdenes actualizado a {nuevo_estado}.', 'success')
-        except sqlite3.Error as e:
-            flash(f'Error al actualizar: {str(e)}', 'error')
-            conn.rollback()
-    else:
-        flash('Selecciona al menos una orden y un estado.', 'error')
+    try:
+        resultado = cambiar_estado(get_db(), request.form.get('nuevo_estado'), ids,
+                                   usuario_id=session.get('user_id'))
+    except CambioInvalido as e:
+        flash(str(e), 'error')
+        return redirect(url_for('ver_ordenes'))
     
-    conn.close()
+    flash(mensaje_cambio(resultado), 'success' if resultado['actualizadas'] else 'error')
     return redirect(url_for('ver_ordenes'))
 
 @app.route('/actualizar_orden/<int:orden_id>', methods=['POST'])
@@ -739,18 +726,17 @@ def actualizar_orden(orden_id):
         flash('Acceso denegado', 'error')
         return redirect(url_for('admin'))
     
-    estado = request.form.get('estado')
-    # Añadir "pagado" como estado válido
-    if estado not in ['pendiente', 'procesando', 'enviado', 'completado', 'cancelado', 'pagado']:
+    try:
+        resultado = cambiar_estado(get_db(), request.form.get('estado'), [orden_id],
+                                   usuario_id=session.get('user_id'))
+    except CambioInvalido:
         flash('Estado inválido', 'error')
         return redirect(url_for('ver_ordenes'))
     
-    conn = get_db_connection()
-    conn.execute('UPDATE ordenes SET estado = ? WHERE id = ?', (estado, orden_id))
-    conn.commit()
-    conn.close()
-    
-    flash('Estado actualizado', 'success')
+    if resultado['actualizadas'] or resultado['sin_cambio']:
+        flash('Estado actualizado', 'success')
+    else:
+        flash(mensaje_cambio(resultado), 'error')
     return redirect(url_for('admin'))
 @app.route('/editar_producto/<int:producto_id>', methods=['GET', 'POST'])
 def editar_producto(producto_id):
@@ -758,21 +744,27 @@ def editar_producto(producto_id):
         flash('Acceso denegado. Se requieren permisos de administrador.', 'error')
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     producto = conn.execute('SELECT * FROM productos WHERE id = ?', (producto_id,)).fetchone()
 
     if not producto:
         flash('Producto no encontrado', 'error')
-        conn.close()
         return redirect(url_for('ver_productos'))
 
     if request.method == 'POST':
+        # Leer el formulario en streaming: la imagen se valida mientras llega
+        try:
+            form, imagen = leer_formulario()
+        except SubidaRechazada as e:
+            flash(e.mensaje, 'error')
+            return render_template('editar_producto.html', producto=producto), e.status
+
         # Obtener datos del formulario
-        nombre = request.form.get('nombre', '').strip()
-        descripcion = request.form.get('descripcion', '').strip()
-        precio = request.form.get('precio')
-        stock = request.form.get('stock', 100)
-        categoria_id = request.form.get('categoria_id')
+        nombre = form.get('nombre', '').strip()
+        descripcion = form.get('descripcion', '').strip()
+        precio = form.get('precio')
+        stock = form.get('stock', 100)
+        categoria_id = form.get('categoria_id')
 
         # Validaciones
         if not nombre or not precio:
@@ -805,36 +797,25 @@ def editar_producto(producto_id):
         }
 
         # Manejar nueva imagen si se sube
-        if 'imagen' in request.files and request.files['imagen'].filename:
-            file = request.files['imagen']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                import time
-                timestamp = str(int(time.time()))
-                name, ext = os.path.splitext(filename)
-                filename = f"{name}_{timestamp}{ext}"
-                categoria = conn.execute('SELECT tipo FROM categorias WHERE id = ?', (campos['categoria_id'],)).fetchone()
-                subcarpeta = categoria['tipo'] if categoria else 'general'
-                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], subcarpeta)
-                os.makedirs(upload_path, exist_ok=True)
-                file_path = os.path.join(upload_path, filename)
-                file.save(file_path)
-                campos['imagen'] = f"/static/images/productos/{subcarpeta}/{filename}"
+        imagen = imagen.guardar() if imagen else None
+        if imagen:
+            campos['imagen'] = imagen
 
         # Construir y ejecutar query de actualización
         set_clauses = [f"{k} = ?" for k in campos if campos[k] is not None]
+        if imagen:
+            set_clauses.append('imagen_derivados = NULL')
         query = f"UPDATE productos SET {', '.join(set_clauses)} WHERE id = ?"
         values = [v for v in campos.values() if v is not None] + [producto_id]
         conn.execute(query, values)
         conn.commit()
+        encolar_derivados(producto_id, imagen)
 
         flash('Producto actualizado exitosamente', 'success')
-        conn.close()
         return redirect(url_for('editar_producto', producto_id=producto_id))
 
     # Obtener categorías para el formulario
     categorias = conn.execute('SELECT * FROM categorias ORDER BY tipo, nombre').fetchall()
-    conn.close()
     return render_template('editar_producto.html', producto=producto, categorias=categorias)
 
 @app.route('/eliminar_producto/<int:producto_id>', methods=['POST'])
@@ -843,26 +824,23 @@ def eliminar_producto_web(producto_id):
         flash('Acceso denegado. Se requieren permisos de administrador.', 'error')
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     producto = conn.execute('SELECT * FROM productos WHERE id = ?', (producto_id,)).fetchone()
 
     if not producto:
         flash('Producto no encontrado', 'error')
-        conn.close()
         return redirect(url_for('ver_productos'))
 
     conn.execute('UPDATE productos SET activo = 0 WHERE id = ?', (producto_id,))
     conn.commit()
-    conn.close()
 
     flash('Producto eliminado exitosamente', 'success')
     return redirect(url_for('ver_productos'))
 
 @app.route('/moderar')
 def moderar():
-    conn = get_db_connection()
+    conn = get_db()
     comentarios = conn.execute('SELECT * FROM comentarios WHERE aprobado = 0 ORDER BY fecha DESC').fetchall()
-    conn.close()
     return render_template('moderar.html', comentarios=comentarios)
 
 @app.route('/agregar_comentario', methods=['POST'])
@@ -882,7 +860,7 @@ def agregar_comentario():
     
     comentario = re.sub(r'<[^>]*>', '', comentario)
     
-    conn = get_db_connection()
+    conn = get_db()
     
     producto = conn.execute('SELECT id FROM productos WHERE id = ? AND activo = 1', 
                            (producto_id,)).fetchone()
@@ -891,13 +869,10 @@ def agregar_comentario():
     
     aprobado = 1 if calificacion >= 4 else 0
     
-    conn.execute('''
+    ejecutar_escritura(conn, lambda conn: conn.execute('''
         INSERT INTO comentarios (usuario_id, producto_id, calificacion, comentario, aprobado)
         VALUES (?, ?, ?, ?, ?)
-    ''', (session['user_id'], producto_id, calificacion, comentario, aprobado))
-    
-    conn.commit()
-    conn.close()
+    ''', (session['user_id'], producto_id, calificacion, comentario, aprobado)))
     
     mensaje = 'Comentario agregado' if aprobado else 'Comentario enviado para moderación'
     return jsonify({'success': True, 'message': mensaje})
@@ -905,12 +880,11 @@ def agregar_comentario():
 # ========== NUEVOS ENDPOINTS API PARA EL ADMIN ==========
 
 @app.route('/api/categorias', methods=['GET'])
+@condicional('catalogo', por_sesion=False)
 def get_categorias():
     """Obtener todas las categorías"""
     try:
-        conn = get_db_connection()
-        categorias = conn.execute('SELECT * FROM categorias ORDER BY tipo, nombre').fetchall()
-        conn.close()
+        categorias = cache_catalogo.catalogo(get_db(), g.versiones).categorias
         
         categorias_list = []
         for categoria in categorias:
@@ -931,6 +905,149 @@ def get_categorias():
             'error': str(e)
         }), 500
 
+@app.route('/api/admin/metricas', methods=['GET'])
+def get_metricas():
+    """Métricas internas del worker para dimensionar gunicorn"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    return jsonify({
+        'success': True,
+        'pool': get_pool().estadisticas(),
+        'contencion': estadisticas_contencion(),
+        'catalogo': cache_catalogo.estadisticas(),
+        'fragmentos': cache_fragmentos.estadisticas(),
+        'contrasenas': get_pool_contrasenas().estadisticas()
+    })
+
+@app.route('/api/admin/reportes', methods=['GET'])
+def reporte_ventas():
+    """Ventas por día, mes, tipo de categoría, método de pago o estado (agregados de reportes.py)"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    conn = get_db()
+    inicio = time.perf_counter()
+    # Lo no acumulado se incorpora en un hilo; mientras tanto se responde con
+    # lo ya acumulado y pendiente=True
+    pendiente = reportes.iniciar_acumulacion(conn)
+
+    hoy = datetime.utcnow().date()
+    desde = request.args.get('desde') or (hoy - timedelta(days=29)).isoformat()
+    hasta = request.args.get('hasta') or hoy.isoformat()
+    try:
+        filas = reportes.consultar(conn, desde, hasta, request.args.get('agrupar', 'dia'),
+                                   tipo=request.args.get('tipo'),
+                                   metodo_pago=request.args.get('metodo_pago'),
+                                   estado=request.args.get('estado'))
+    except reportes.ReporteInvalido as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'desde': desde,
+        'hasta': hasta,
+        'agrupar': request.args.get('agrupar', 'dia'),
+        'filas': filas,
+        'pendiente': pendiente,
+        'totales': {
+            'ordenes': sum(f['ordenes'] for f in filas) if request.args.get('agrupar') != 'tipo' else None,
+            'unidades': sum(f['unidades'] for f in filas),
+            'ingresos': round(sum(f['ingresos'] for f in filas), 2),
+        },
+        'ms': round((time.perf_counter() - inicio) * 1000, 2)
+    })
+
+@app.route('/api/admin/exportar/<nombre>', methods=['GET'])
+def exportar_admin(nombre):
+    """Descarga en streaming (?formato=csv|ndjson) de ordenes, orden_items o productos.
+
+    ordenes y orden_items aceptan los mismos filtros que /ordenes; productos, ?activos=1.
+    """
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    if nombre == 'productos':
+        condiciones, params = (['p.activo = 1'] if request.args.get('activos') == '1' else []), []
+    else:
+        condiciones, params = filtros_ordenes(request.args)
+    try:
+        return exportar(nombre, request.args.get('formato', 'csv'), condiciones, params)
+    except ExportacionInvalida as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/admin/ordenes/estado', methods=['POST'])
+def cambiar_estado_ordenes():
+    """Cambio de estado en masa: JSON {"estado": ..., "ids": [...]} o {"estado": ..., "filtro": {...}}.
+
+    El filtro acepta los mismos campos que /ordenes (estado, metodo_pago,
+    fecha_inicio, fecha_fin). Responde los conteos y el tiempo empleado.
+    """
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return jsonify({'success': False, 'error': 'Se esperaba un objeto JSON'}), 400
+    ids, condiciones, params = datos.get('ids'), (), ()
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return jsonify({'success': False, 'error': 'ids debe ser una lista de números'}), 400
+    elif isinstance(datos.get('filtro'), dict):
+        filtro = {k: v for k, v in datos['filtro'].items() if isinstance(v, str)}
+        # El estado se filtra como lo lee cambiar_estado: NULL cuenta como pendiente
+        estado_actual = filtro.pop('estado', None)
+        condiciones, params = filtros_ordenes(filtro)
+        if estado_actual:
+            condicion, valores = condicion_estado(estado_actual)
+            condiciones.append(condicion)
+            params += valores
+
+    try:
+        resultado = cambiar_estado(get_db(), datos.get('estado'), ids, condiciones, params,
+                                   usuario_id=session.get('user_id'))
+    except CambioInvalido as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **resultado})
+
+@app.route('/api/admin/ordenes/<int:orden_id>/historial', methods=['GET'])
+def historial_orden(orden_id):
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+    return jsonify({'success': True, 'historial': historial(get_db(), orden_id)})
+
+@app.route('/api/admin/productos', methods=['GET'])
+def listar_productos_admin():
+    """Listado paginado por cursor de productos activos (carga diferida del admin)"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    productos, siguiente = pagina_keyset(get_db(), 'productos', 'fecha_creacion', ['activo = 1'],
+                                         cursor=request.args.get('cursor'),
+                                         tamano=tamano_pagina(request.args.get('limite')))
+    vendidas = unidades_vendidas(get_db(), [p['id'] for p in productos])
+    return jsonify({
+        'success': True,
+        'productos': [dict(p, unidades_vendidas=vendidas.get(p['id'], 0)) for p in productos],
+        'siguiente': siguiente
+    })
+
+@app.route('/api/admin/ordenes', methods=['GET'])
+def listar_ordenes_admin():
+    """Listado paginado por cursor de órdenes con los mismos filtros que /ordenes"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    condiciones, params = filtros_ordenes(request.args)
+    ordenes, siguiente = pagina_keyset(get_db(), 'ordenes', 'fecha', condiciones, params,
+                                       cursor=request.args.get('cursor'),
+                                       tamano=tamano_pagina(request.args.get('limite')))
+    return jsonify({
+        'success': True,
+        'ordenes': [dict(o) for o in ordenes],
+        'siguiente': siguiente
+    })
+
 @app.route('/api/productos', methods=['POST'])
 def crear_producto():
     """Crear un nuevo producto"""
@@ -939,12 +1056,18 @@ def crear_producto():
         if session.get('user_role') != 'admin':
             return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
         
+        # Leer el formulario en streaming: la imagen se valida mientras llega
+        try:
+            form, imagen = leer_formulario()
+        except SubidaRechazada as e:
+            return jsonify({'success': False, 'error': e.mensaje}), e.status
+        
         # Obtener datos del formulario
-        nombre = request.form.get('nombre', '').strip()
-        descripcion = request.form.get('descripcion', '').strip()
-        precio = request.form.get('precio')
-        stock = request.form.get('stock', 100)
-        categoria_id = request.form.get('categoria_id')
+        nombre = form.get('nombre', '').strip()
+        descripcion = form.get('descripcion', '').strip()
+        precio = form.get('precio')
+        stock = form.get('stock', 100)
+        categoria_id = form.get('categoria_id')
         
         # Validaciones
         if not nombre:
@@ -968,40 +1091,10 @@ def crear_producto():
             return jsonify({'success': False, 'error': 'El stock debe ser un número válido'}), 400
 
         # Manejar imagen si se proporciona
-        imagen_path = None
-        if 'imagen' in request.files:
-            file = request.files['imagen']
-            if file and file.filename != '' and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Agregar timestamp para evitar conflictos
-                import time
-                timestamp = str(int(time.time()))
-                name, ext = os.path.splitext(filename)
-                filename = f"{name}_{timestamp}{ext}"
-                
-                # Determinar carpeta según categoría
-                conn = get_db_connection()
-                if categoria_id:
-                    categoria = conn.execute('SELECT tipo FROM categorias WHERE id = ?', (categoria_id,)).fetchone()
-                    if categoria:
-                        subcarpeta = categoria['tipo']
-                    else:
-                        subcarpeta = 'general'
-                else:
-                    subcarpeta = 'general'
-                conn.close()
-                
-                # Crear carpeta si no existe
-                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], subcarpeta)
-                os.makedirs(upload_path, exist_ok=True)
-                
-                # Guardar archivo
-                file_path = os.path.join(upload_path, filename)
-                file.save(file_path)
-                imagen_path = f"/static/images/productos/{subcarpeta}/{filename}"
+        imagen_path = imagen.guardar() if imagen else None
 
         # Insertar en base de datos
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -1018,6 +1111,7 @@ def crear_producto():
         
         producto_id = cursor.lastrowid
         conn.commit()
+        encolar_derivados(producto_id, imagen_path)
         
         # Obtener el producto creado con información de categoría
         producto = conn.execute('''
@@ -1027,8 +1121,6 @@ def crear_producto():
             WHERE p.id = ?
         ''', (producto_id,)).fetchone()
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'message': 'Producto creado exitosamente',
@@ -1052,17 +1144,36 @@ def crear_producto():
             'error': f'Error al crear producto: {str(e)}'
         }), 500
 
+@app.route('/api/productos/importar', methods=['POST'])
+def importar_productos():
+    """Importación masiva: archivo (CSV o JSONL) e imagenes (zip opcional); validar=1 no inserta"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
+
+    # El zip de imágenes de una temporada supera el límite general de 16MB
+    request.max_content_length = MAX_IMPORTACION
+    archivo = request.files.get('archivo')
+    if not archivo:
+        return jsonify({'success': False, 'error': 'Falta el archivo de productos'}), 400
+    formato = request.form.get('formato') or formato_de(archivo.filename)
+    imagenes = request.files.get('imagenes')
+    try:
+        resultado = importar(get_db(), archivo.stream, formato, imagenes.stream if imagenes else None,
+                             solo_validar=request.form.get('validar') == '1')
+    except ImportacionInvalida as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **resultado})
+
 @app.route('/api/productos/<int:producto_id>', methods=['GET'])
 def get_producto_details(producto_id):
     try:
-        conn = get_db_connection()
+        conn = get_db()
         producto = conn.execute('''
             SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
             FROM productos p
             LEFT JOIN categorias c ON p.categoria_id = c.id
             WHERE p.id = ?
         ''', (producto_id,)).fetchone()
-        conn.close()
         
         if producto:
             return jsonify({
@@ -1088,8 +1199,14 @@ def actualizar_producto(producto_id):
         if session.get('user_role') != 'admin':
             return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
         
+        # Leer el formulario en streaming: la imagen se valida mientras llega
+        try:
+            form, imagen = leer_formulario()
+        except SubidaRechazada as e:
+            return jsonify({'success': False, 'error': e.mensaje}), e.status
+        
         # Obtener datos del formulario
-        data = request.form.to_dict()
+        data = form.to_dict()
         if not data.get('nombre') or not data.get('precio'):
             return jsonify({'success': False, 'error': 'Nombre y precio son requeridos'}), 400
         
@@ -1104,10 +1221,9 @@ def actualizar_producto(producto_id):
         # Validar stock
         stock = int(data.get('stock', 100)) if data.get('stock') else 100
         
-        conn = get_db_connection()
+        conn = get_db()
         producto = conn.execute('SELECT * FROM productos WHERE id = ?', (producto_id,)).fetchone()
         if not producto:
-            conn.close()
             return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
         
         # Preparar campos a actualizar
@@ -1120,29 +1236,19 @@ def actualizar_producto(producto_id):
         }
         
         # Manejar nueva imagen si se sube
-        if 'imagen' in request.files and request.files['imagen'].filename:
-            file = request.files['imagen']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                timestamp = str(int(time.time()))
-                name, ext = os.path.splitext(filename)
-                filename = f"{name}_{timestamp}{ext}"
-                # Determinar carpeta según categoría
-                categoria = conn.execute('SELECT tipo FROM categorias WHERE id = ?', (campos['categoria_id'],)).fetchone()
-                subcarpeta = categoria['tipo'] if categoria else 'general'
-                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], subcarpeta)
-                os.makedirs(upload_path, exist_ok=True)
-                file_path = os.path.join(upload_path, filename)
-                file.save(file_path)
-                campos['imagen'] = f"/static/images/productos/{subcarpeta}/{filename}"
+        imagen = imagen.guardar() if imagen else None
+        if imagen:
+            campos['imagen'] = imagen
         
         # Construir y ejecutar query de actualización
         set_clauses = [f"{k} = ?" for k in campos if campos[k] is not None]
+        if imagen:
+            set_clauses.append('imagen_derivados = NULL')
         query = f"UPDATE productos SET {', '.join(set_clauses)} WHERE id = ?"
         values = [v for v in campos.values() if v is not None] + [producto_id]
         conn.execute(query, values)
         conn.commit()
-        conn.close()
+        encolar_derivados(producto_id, imagen)
         
         return jsonify({'success': True, 'message': 'Producto actualizado'})
     except Exception as e:
@@ -1156,18 +1262,16 @@ def eliminar_producto(producto_id):
         if session.get('user_role') != 'admin':
             return jsonify({'success': False, 'error': 'Acceso denegado'}), 403
         
-        conn = get_db_connection()
+        conn = get_db()
         
         # Verificar que el producto existe
         producto = conn.execute('SELECT * FROM productos WHERE id = ?', (producto_id,)).fetchone()
         if not producto:
-            conn.close()
             return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
 
         # Soft delete - solo desactivar
         conn.execute('UPDATE productos SET activo = 0 WHERE id = ?', (producto_id,))
         conn.commit()
-        conn.close()
         
         return jsonify({
             'success': True,
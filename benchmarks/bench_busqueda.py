@@ -0,0 +1,87 @@
+"""Benchmark de la búsqueda FTS5 contra el LIKE '%q%' original.
+
+Genera un catálogo sintético (100k productos por defecto) en una base temporal
+con el esquema y las migraciones reales, y mide ambas rutas de /buscar.
+
+    python benchmarks/bench_busqueda.py --productos 100000 --repeticiones 20
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PRENDAS = ['Camisa', 'Pantalón', 'Polo', 'Chaqueta', 'Vestido', 'Blusa', 'Falda', 'Short',
+           'Gorra', 'Cinturón', 'Mochila', 'Zapatos', 'Camiseta', 'Bolso', 'Aretes']
+ADJETIVOS = ['Clásica', 'Elegante', 'Casual', 'Deportiva', 'Formal', 'Floral', 'Niño', 'Niña',
+             'Algodón', 'Cuero', 'Jean', 'Slim', 'Oversize', 'Vintage', 'Básica']
+COLORES = ['Azul', 'Negro', 'Blanco', 'Rojo', 'Rosa', 'Gris', 'Beige', 'Verde', 'Marrón', 'Celeste']
+
+CONSULTAS = ['pantalon', 'camisa azul', 'chaq', 'niña rosa', 'cuero marron', 'vestido elegante rojo']
+
+SQL_LIKE = '''
+    SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
+    FROM productos p
+    JOIN categorias c ON p.categoria_id = c.id
+    WHERE p.activo = 1 AND (p.nombre LIKE ? OR p.descripcion LIKE ?)
+    ORDER BY p.nombre
+'''
+
+def poblar(conn, cantidad):
+    tipos = ['hombres', 'mujeres', 'ninos', 'ofertas']
+    conn.executemany('INSERT INTO categorias (nombre, tipo) VALUES (?, ?)',
+                     [(f'Categoria {i}', tipos[i % 4]) for i in range(15)])
+    rnd = random.Random(42)
+
+    def filas():
+        for _ in range(cantidad):
+            nombre = f'{rnd.choice(PRENDAS)} {rnd.choice(ADJETIVOS)} {rnd.choice(COLORES)}'
+            descripcion = (f'{nombre} de temporada, ideal para {rnd.choice(ADJETIVOS).lower()} '
+                           f'en Santa Cruz. Color {rnd.choice(COLORES).lower()}.')
+            yield nombre, descripcion, rnd.randint(50, 900), rnd.randint(1, 15)
+
+    conn.executemany('INSERT INTO productos (nombre, descripcion, precio, categoria_id) VALUES (?, ?, ?, ?)',
+                     filas())
+    conn.commit()
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2], tiempos[int(len(tiempos) * 0.95) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--productos', type=int, default=100000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['TIENDA_DB'] = os.path.join(tmp, 'bench.db')
+        import database
+        import busqueda
+
+        database.init_database()
+        conn = database.get_db_connection()
+        inicio = time.perf_counter()
+        poblar(conn, args.productos)
+        print(f'{args.productos} productos generados e indexados en {time.perf_counter() - inicio:.1f}s\n')
+
+        print(f'{"consulta":<24}{"LIKE p50/p95 ms":>20}{"FTS5 p50/p95 ms":>20}{"resultados":>12}')
+        for consulta in CONSULTAS:
+            # El LIKE original busca la frase literal, con acentos
+            like = medir(lambda: conn.execute(SQL_LIKE, (f'%{consulta}%', f'%{consulta}%')).fetchall(),
+                         args.repeticiones)
+            fts = medir(lambda: busqueda.buscar_productos(conn, consulta), args.repeticiones)
+            _, total = busqueda.buscar_productos(conn, consulta)
+            print(f'{consulta:<24}{like[0]:>9.1f} /{like[1]:>8.1f}{fts[0]:>9.1f} /{fts[1]:>8.1f}{total:>12}')
+        conn.close()
+
+if __name__ == '__main__':
+    main()
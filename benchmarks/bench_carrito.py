@@ -0,0 +1,93 @@
+"""Benchmark de la fusión del carrito anónimo al iniciar sesión.
+
+Compara el bucle original (SELECT + UPDATE por línea) con fusionar_carrito(),
+que hace la fusión en tres sentencias dentro de una transacción. La mitad de
+los productos del carrito anónimo ya están en el carrito del usuario.
+
+    python benchmarks/bench_carrito.py --lineas 10 100 1000 5000 --repeticiones 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def fusion_original(conn, session_id, usuario_id):
+    # Lógica previa de migrar_carrito_sesion_a_usuario()
+    items_sesion = conn.execute(
+        'SELECT * FROM carrito WHERE session_id = ? AND usuario_id IS NULL',
+        (session_id,)
+    ).fetchall()
+    for item in items_sesion:
+        existente = conn.execute(
+            'SELECT * FROM carrito WHERE usuario_id = ? AND producto_id = ?',
+            (usuario_id, item['producto_id'])
+        ).fetchone()
+        if existente:
+            conn.execute('UPDATE carrito SET cantidad = ? WHERE id = ?',
+                         (existente['cantidad'] + item['cantidad'], existente['id']))
+            conn.execute('DELETE FROM carrito WHERE id = ?', (item['id'],))
+        else:
+            conn.execute('UPDATE carrito SET usuario_id = ?, session_id = NULL WHERE id = ?',
+                         (usuario_id, item['id']))
+    conn.commit()
+
+def preparar(conn, lineas, ronda):
+    session_id, usuario_id = f'bench-{lineas}-{ronda}', 1000 + ronda
+    conn.execute('DELETE FROM carrito')
+    conn.executemany('''
+        INSERT INTO carrito (usuario_id, producto_id, cantidad, precio_unitario, session_id)
+        VALUES (NULL, ?, 1, 10.0, ?)
+    ''', [(i, session_id) for i in range(1, lineas + 1)])
+    conn.executemany('''
+        INSERT INTO carrito (usuario_id, producto_id, cantidad, precio_unitario, session_id)
+        VALUES (?, ?, 2, 10.0, NULL)
+    ''', [(usuario_id, i) for i in range(1, lineas + 1, 2)])
+    conn.commit()
+    return session_id, usuario_id
+
+def medir(conn, fusionar, lineas, repeticiones):
+    tiempos = []
+    for ronda in range(repeticiones):
+        session_id, usuario_id = preparar(conn, lineas, ronda)
+        inicio = time.perf_counter()
+        fusionar(conn, session_id, usuario_id)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+        total = conn.execute('SELECT COUNT(*), SUM(cantidad) FROM carrito WHERE usuario_id = ?',
+                             (usuario_id,)).fetchone()
+        assert tuple(total) == (lineas, lineas + (lineas + 1) // 2 * 2), tuple(total)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lineas', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['TIENDA_DB'] = os.path.join(tmp, 'bench.db')
+        import database
+        from carrito import fusionar_carrito
+
+        database.init_database()
+        conn = database.get_db_connection()
+        conn.execute('INSERT INTO categorias (nombre, tipo) VALUES (?, ?)', ('Bench', 'hombres'))
+        conn.executemany('INSERT INTO productos (id, nombre, precio, categoria_id) VALUES (?, ?, 10.0, 1)',
+                         [(i, f'Producto {i}') for i in range(1, max(args.lineas) + 1)])
+        conn.executemany('INSERT INTO usuarios (id, nombre, correo, contraseña) VALUES (?, ?, ?, ?)',
+                         [(1000 + i, f'Bench {i}', f'bench{i}@tienda.com', '-') for i in range(args.repeticiones)])
+        conn.commit()
+
+        print(f'{"líneas":>8}{"bucle ms":>12}{"conjuntos ms":>14}{"mejora":>9}')
+        for lineas in args.lineas:
+            original = medir(conn, fusion_original, lineas, args.repeticiones)
+            conjuntos = medir(conn, fusionar_carrito, lineas, args.repeticiones)
+            print(f'{lineas:>8}{original:>12.2f}{conjuntos:>14.2f}{original / conjuntos:>8.1f}x')
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark de lecturas y escrituras concurrentes entre procesos sobre SQLite.
+
+Simula varios workers de gunicorn: unos leen el catálogo (consulta de index())
+y otros escriben en el carrito con ejecutar_escritura(). Compara el perfil de
+almacenamiento por defecto (WAL) contra el journal de rollback original.
+
+    python benchmarks/bench_concurrencia.py --lectores 4 --escritores 4 --segundos 5
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+CONSULTA_CATALOGO = '''
+    SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
+    FROM productos p
+    JOIN categorias c ON p.categoria_id = c.id
+    WHERE p.activo = 1
+    ORDER BY c.tipo, c.nombre, p.nombre
+'''
+
+PERFIL_ROLLBACK = {'journal_mode': 'DELETE', 'busy_timeout': 5000}
+
+def conectar(ruta, perfil):
+    conn = sqlite3.connect(ruta, timeout=0)
+    conn.row_factory = sqlite3.Row
+    database.aplicar_pragmas(conn, perfil)
+    return conn
+
+def lector(ruta, perfil, segundos, resultados):
+    conn = conectar(ruta, perfil)
+    ops = errores = 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        try:
+            conn.execute(CONSULTA_CATALOGO).fetchall()
+            ops += 1
+        except sqlite3.OperationalError:
+            errores += 1
+    resultados.put(('lectura', ops, errores))
+
+def escritor(ruta, perfil, segundos, resultados):
+    conn = conectar(ruta, perfil)
+    ops = errores = 0
+    session_id = f'bench-{os.getpid()}'
+    fin = time.perf_counter() + segundos
+
+    def escribir(conn):
+        conn.execute('''
+            INSERT INTO carrito (usuario_id, producto_id, cantidad, precio_unitario, session_id)
+            VALUES (NULL, 1, 1, 10.0, ?)
+        ''', (session_id,))
+
+    while time.perf_counter() < fin:
+        try:
+            database.ejecutar_escritura(conn, escribir)
+            ops += 1
+        except sqlite3.OperationalError:
+            errores += 1
+    resultados.put(('escritura', ops, errores))
+
+def preparar(ruta, perfil):
+    conn = sqlite3.connect(ruta)
+    database.configurar_almacenamiento(conn, perfil)
+    conn.execute('CREATE TABLE categorias (id INTEGER PRIMARY KEY, nombre TEXT, tipo TEXT)')
+    conn.execute('''CREATE TABLE productos (id INTEGER PRIMARY KEY, nombre TEXT, descripcion TEXT,
+                    precio REAL, stock INTEGER, categoria_id INTEGER, imagen TEXT, activo INTEGER,
+                    fecha_creacion TEXT)''')
+    conn.execute('''CREATE TABLE carrito (id INTEGER PRIMARY KEY, usuario_id INTEGER, producto_id INTEGER,
+                    cantidad INTEGER, precio_unitario REAL, session_id TEXT,
+                    fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    tipos = ['hombres', 'mujeres', 'ninos', 'ofertas']
+    conn.executemany('INSERT INTO categorias VALUES (?, ?, ?)',
+                     [(i, f'Categoria {i}', tipos[i % 4]) for i in range(1, 16)])
+    conn.executemany('INSERT INTO productos VALUES (?, ?, ?, ?, 100, ?, NULL, 1, CURRENT_TIMESTAMP)',
+                     [(i, f'Producto {i}', 'Descripción de prueba', 100.0 + i, 1 + i % 15)
+                      for i in range(1, 501)])
+    conn.commit()
+    conn.close()
+
+def ejecutar(nombre, perfil, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'bench.db')
+        preparar(ruta, perfil)
+        resultados = multiprocessing.Queue()
+        procesos = [multiprocessing.Process(target=lector, args=(ruta, perfil, args.segundos, resultados))
+                    for _ in range(args.lectores)]
+        procesos += [multiprocessing.Process(target=escritor, args=(ruta, perfil, args.segundos, resultados))
+                     for _ in range(args.escritores)]
+        for p in procesos:
+            p.start()
+        totales = {'lectura': [0, 0], 'escritura': [0, 0]}
+        for _ in procesos:
+            tipo, ops, errores = resultados.get()
+            totales[tipo][0] += ops
+            totales[tipo][1] += errores
+        for p in procesos:
+            p.join()
+
+    print(f'{nombre:<10} lecturas/s: {totales["lectura"][0] / args.segundos:>9.0f} '
+          f'(errores {totales["lectura"][1]})  '
+          f'escrituras/s: {totales["escritura"][0] / args.segundos:>8.0f} '
+          f'(errores {totales["escritura"][1]})')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lectores', type=int, default=4)
+    parser.add_argument('--escritores', type=int, default=4)
+    parser.add_argument('--segundos', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f'{args.lectores} lectores + {args.escritores} escritores durante {args.segundos}s')
+    ejecutar('rollback', PERFIL_ROLLBACK, args)
+    ejecutar('wal', database.PERFIL_ALMACENAMIENTO, args)
+
+if __name__ == '__main__':
+    main()
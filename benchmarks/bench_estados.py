@@ -0,0 +1,89 @@
+"""Benchmark del cambio de estado de órdenes en masa.
+
+Genera órdenes sintéticas (bench_reportes.generar, con los agregados de
+ventas ya acumulados) y pasa N órdenes pendientes a pagado de tres maneras:
+
+- legado: el executemany de /actualizar_ordenes_masa, sin validar ni historial;
+- orden a orden: leer el estado, validar, UPDATE e historial con un commit por
+  orden, lo que costaría validar y auditar sin cambiar el enfoque;
+- estados.cambiar_estado() por ids (tabla temporal en una transacción) y por
+  filtro (las mismas órdenes, seleccionadas por fecha).
+
+Antes de cada medición las órdenes vuelven a pendiente (sin medir).
+
+    python benchmarks/bench_estados.py --ordenes 50000 --cambios 1000 10000 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ordenes', type=int, default=50000)
+    parser.add_argument('--cambios', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['TIENDA_DB'] = os.path.join(tmp, 'bench.db')
+        import database
+        import estados
+        import reportes
+        from bench_reportes import generar
+        database.init_database()
+        conn = database.get_db_connection()
+        generar(conn, args.ordenes)
+        reportes.acumular(conn)
+
+        def reiniciar(cantidad):
+            conn.execute("UPDATE ordenes SET estado = 'pendiente'")
+            conn.execute('DELETE FROM ordenes_historial')
+            conn.commit()
+            reportes.acumular(conn)
+            filas = conn.execute('SELECT id, fecha FROM ordenes ORDER BY id LIMIT ?', (cantidad,)).fetchall()
+            return [fila['id'] for fila in filas], filas[-1]['fecha']
+
+        def legado(ids, hasta):
+            conn.executemany('UPDATE ordenes SET estado = ? WHERE id = ?', [('pagado', i) for i in ids])
+            conn.commit()
+            return len(ids)
+
+        def orden_a_orden(ids, hasta):
+            actualizadas = 0
+            for orden_id in ids:
+                anterior = conn.execute('SELECT estado FROM ordenes WHERE id = ?', (orden_id,)).fetchone()[0]
+                if 'pagado' in estados.TRANSICIONES[anterior]:
+                    conn.execute("UPDATE ordenes SET estado = 'pagado' WHERE id = ?", (orden_id,))
+                    conn.execute('''INSERT INTO ordenes_historial (orden_id, anterior, estado)
+                                    VALUES (?, ?, 'pagado')''', (orden_id, anterior))
+                    actualizadas += 1
+                conn.commit()
+            return actualizadas
+
+        def por_ids(ids, hasta):
+            return estados.cambiar_estado(conn, 'pagado', ids)['actualizadas']
+
+        def por_filtro(ids, hasta):
+            return estados.cambiar_estado(conn, 'pagado', condiciones=['fecha <= ?'], params=[hasta])['actualizadas']
+
+        print(f'{args.ordenes} órdenes')
+        print(f'{"cambios":>8}{"modo":>15}{"ms":>10}{"órdenes/s":>12}')
+        for cantidad in args.cambios:
+            for modo, cambiar in (('legado', legado), ('orden a orden', orden_a_orden),
+                                  ('por ids', por_ids), ('por filtro', por_filtro)):
+                ids, hasta = reiniciar(cantidad)
+                inicio = time.perf_counter()
+                actualizadas = cambiar(ids, hasta)
+                segundos = time.perf_counter() - inicio
+                assert actualizadas == len(ids), (modo, actualizadas)
+                if modo != 'legado':
+                    historial = conn.execute('SELECT COUNT(*) FROM ordenes_historial').fetchone()[0]
+                    assert historial == len(ids), (modo, historial)
+                print(f'{cantidad:>8}{modo:>15}{segundos * 1000:>10.1f}{cantidad / segundos:>12.0f}')
+        conn.close()
+
+if __name__ == '__main__':
+    main()
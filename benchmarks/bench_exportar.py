@@ -0,0 +1,81 @@
+"""Benchmark de memoria y primer byte de la exportación de órdenes.
+
+Genera órdenes sintéticas (bench_reportes.generar) y compara:
+
+- fetchall: lo que hacía /ordenes sin paginar, todas las filas en memoria y el
+  CSV armado en un solo string antes de responder;
+- streaming: GET /api/admin/exportar/ordenes, consumiendo la respuesta por partes.
+
+Reporta el tiempo hasta el primer bloque, el tiempo total y el pico de memoria
+asignada por Python (tracemalloc) durante la exportación.
+
+    python benchmarks/bench_exportar.py --ordenes 500000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def medir(exportar):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    primer_bloque, total = None, 0
+    for bloque in exportar():
+        if primer_bloque is None:
+            primer_bloque = time.perf_counter() - inicio
+        total += len(bloque)
+    segundos = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return primer_bloque, segundos, pico, total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ordenes', type=int, default=500000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['TIENDA_DB'] = os.path.join(tmp, 'bench.db')
+        import database
+        from bench_reportes import generar
+        database.init_database()
+        conn = database.get_db_connection()
+        generar(conn, args.ordenes)
+        from app import app
+
+        def fetchall():
+            filas = conn.execute('SELECT * FROM ordenes ORDER BY fecha, id').fetchall()
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(filas[0].keys())
+            escritor.writerows(tuple(fila) for fila in filas)
+            yield buffer.getvalue().encode('utf-8')
+
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['user_role'] = 'admin'
+
+        def streaming(formato):
+            def exportar():
+                respuesta = cliente.get(f'/api/admin/exportar/ordenes?formato={formato}')
+                assert respuesta.status_code == 200, respuesta.status_code
+                yield from respuesta.response
+                respuesta.close()
+            return exportar
+
+        print(f'{args.ordenes} órdenes')
+        print(f'{"modo":>16}{"primer bloque s":>16}{"total s":>10}{"pico MB":>10}{"MB enviados":>13}')
+        for modo, exportar in (('fetchall', fetchall), ('streaming csv', streaming('csv')),
+                               ('streaming ndjson', streaming('ndjson'))):
+            primer, segundos, pico, total = medir(exportar)
+            print(f'{modo:>16}{primer:>16.3f}{segundos:>10.2f}{pico / 2**20:>10.1f}{total / 2**20:>13.1f}')
+        conn.close()
+
+if __name__ == '__main__':
+    main()
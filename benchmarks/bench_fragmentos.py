@@ -0,0 +1,71 @@
+"""Benchmark de la caché de fragmentos HTML en / y /producto/<id>.
+
+Genera un catálogo sintético en una base temporal y mide peticiones por segundo
+de un visitante anónimo con la caché de fragmentos deshabilitada (max_bytes=0,
+se renderiza todo en cada petición) y habilitada.
+
+    python benchmarks/bench_fragmentos.py --productos 300 --segundos 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def poblar(conn, cantidad):
+    tipos = ['hombres', 'mujeres', 'ninos', 'ofertas']
+    conn.executemany('INSERT INTO categorias (nombre, tipo) VALUES (?, ?)',
+                     [(f'Categoria {i}', tipos[i % 4]) for i in range(12)])
+    rnd = random.Random(42)
+    conn.executemany('INSERT INTO productos (nombre, descripcion, precio, categoria_id) VALUES (?, ?, ?, ?)',
+                     [(f'Producto {i}', f'Descripción del producto {i} para la temporada. ' * 3,
+                       rnd.randint(50, 900), rnd.randint(1, 12)) for i in range(cantidad)])
+    conn.execute("INSERT INTO usuarios (id, nombre, correo, contraseña) VALUES (9000, 'Bench', 'bench@tienda.com', '-')")
+    conn.executemany('INSERT INTO comentarios (usuario_id, producto_id, calificacion, comentario, aprobado) VALUES (9000, ?, ?, ?, 1)',
+                     [(1 if i % 2 else None, rnd.randint(3, 5), f'Comentario {i}') for i in range(40)])
+    conn.commit()
+
+def medir(cliente, url, segundos):
+    # Calentar: la primera petición llena la caché del catálogo y la sesión
+    cliente.get(url).close()
+    peticiones, inicio = 0, time.perf_counter()
+    while time.perf_counter() - inicio < segundos:
+        respuesta = cliente.get(url)
+        assert respuesta.status_code == 200, respuesta.status_code
+        respuesta.close()
+        peticiones += 1
+    return peticiones / (time.perf_counter() - inicio)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--productos', type=int, default=300)
+    parser.add_argument('--segundos', type=float, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['TIENDA_DB'] = os.path.join(tmp, 'bench.db')
+        import database
+        database.init_database()
+        from app import app
+        from catalogo import cache_fragmentos
+
+        conn = database.get_db_connection()
+        poblar(conn, args.productos)
+        conn.close()
+
+        cliente = app.test_client()
+        maximo = cache_fragmentos.max_bytes
+        print(f'{"ruta":>14}{"sin caché req/s":>18}{"con caché req/s":>18}{"mejora":>9}')
+        for url in ('/', '/producto/1'):
+            cache_fragmentos.max_bytes = 0
+            sin_cache = medir(cliente, url, args.segundos)
+            cache_fragmentos.max_bytes = maximo
+            con_cache = medir(cliente, url, args.segundos)
+            print(f'{url:>14}{sin_cache:>18.0f}{con_cache:>18.0f}{con_cache / sin_cache:>8.1f}x')
+        print(cache_fragmentos.estadisticas())
+
+if __name__ == '__main__':
+    main()
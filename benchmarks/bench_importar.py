@@ -0,0 +1,116 @@
+"""Benchmark de filas/s de la importación masiva de productos.
+
+Genera un CSV sintético (por defecto 20.000 productos) y un zip con imágenes
+PNG pequeñas compartidas entre filas, y compara:
+
+- fila a fila: lo que costaba cargar un catálogo con /api/productos, una
+  consulta de categoría, una imagen guardada y un INSERT + commit por producto;
+- importar.importar() con distintos tamaños de lote (executemany, una
+  transacción por lote, categorías e imágenes resueltas una sola vez).
+
+El almacén de imágenes va a un temporal y los derivados no se generan (se
+miden aparte con python imagenes.py --backfill).
+
+    python benchmarks/bench_importar.py --filas 20000 --imagenes 200
+"""
+import argparse
+import csv
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TIPOS = ['hombres', 'mujeres', 'ninos', 'ofertas']
+
+def png(ancho, alto, color):
+    def bloque(tipo, datos):
+        return (struct.pack('>I', len(datos)) + tipo + datos +
+                struct.pack('>I', zlib.crc32(tipo + datos) & 0xffffffff))
+
+    filas = (b'\x00' + bytes(color) * ancho) * alto
+    return (b'\x89PNG\r\n\x1a\n' +
+            bloque(b'IHDR', struct.pack('>IIBBBBB', ancho, alto, 8, 2, 0, 0, 0)) +
+            bloque(b'IDAT', zlib.compress(filas)) +
+            bloque(b'IEND', b''))
+
+def generar(directorio, filas, imagenes, semilla=7):
+    """(ruta del CSV, ruta del zip) con filas productos e imagenes archivos distintos"""
+    rnd = random.Random(semilla)
+    ruta_zip = os.path.join(directorio, 'fotos.zip')
+    with zipfile.ZipFile(ruta_zip, 'w') as zf:
+        for i in range(imagenes):
+            zf.writestr(f'fotos/foto{i}.png', png(200, 200, (i % 256, i * 7 % 256, i * 13 % 256)))
+
+    ruta_csv = os.path.join(directorio, 'productos.csv')
+    with open(ruta_csv, 'w', newline='', encoding='utf-8') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(['nombre', 'descripcion', 'precio', 'stock', 'categoria', 'tipo', 'imagen'])
+        for i in range(filas):
+            escritor.writerow([f'Producto importado {i}', f'Descripción del producto {i}',
+                               rnd.randint(40, 600), rnd.randint(0, 50), f'Categoria {i % 12}',
+                               TIPOS[i % 12 % 4], f'foto{rnd.randrange(imagenes)}.png'])
+    return ruta_csv, ruta_zip
+
+def fila_a_fila(conn, ruta_csv, ruta_zip):
+    from imagenes import almacenar
+    with open(ruta_csv, encoding='utf-8') as archivo, zipfile.ZipFile(ruta_zip) as zf:
+        miembros = {os.path.basename(n): n for n in zf.namelist()}
+        for fila in csv.DictReader(archivo):
+            categoria = conn.execute('SELECT id FROM categorias WHERE nombre = ? AND tipo = ?',
+                                     (fila['categoria'], fila['tipo'])).fetchone()
+            with zf.open(miembros[fila['imagen']]) as flujo:
+                imagen = almacenar(flujo, 'png')
+            conn.execute('''
+                INSERT INTO productos (nombre, descripcion, precio, stock, categoria_id, imagen)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (fila['nombre'], fila['descripcion'], float(fila['precio']), int(fila['stock']),
+                  categoria['id'], imagen))
+            conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, default=20000)
+    parser.add_argument('--imagenes', type=int, default=200)
+    parser.add_argument('--lotes', type=int, nargs='+', default=[1, 100, 500, 5000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['TIENDA_DB'] = os.path.join(tmp, 'bench.db')
+        import database
+        import imagenes
+        import importar
+        imagenes.DIRECTORIO_ALMACEN = os.path.join(tmp, 'almacen')
+        importar.encolar_derivados = lambda producto_id, url: None
+        database.init_database()
+        conn = database.get_db_connection()
+        conn.executemany('INSERT INTO categorias (nombre, tipo) VALUES (?, ?)',
+                         [(f'Categoria {i}', TIPOS[i % 4]) for i in range(12)])
+        conn.commit()
+        ruta_csv, ruta_zip = generar(tmp, args.filas, args.imagenes)
+
+        print(f'{args.filas} filas, {args.imagenes} imágenes')
+        print(f'{"modo":>18}{"segundos":>10}{"filas/s":>10}')
+        inicio = time.perf_counter()
+        fila_a_fila(conn, ruta_csv, ruta_zip)
+        base = time.perf_counter() - inicio
+        print(f'{"fila a fila":>18}{base:>10.2f}{args.filas / base:>10.0f}')
+
+        for lote in args.lotes:
+            with open(ruta_csv, 'rb') as flujo:
+                resultado = importar.importar(conn, flujo, 'csv', ruta_zip, lote=lote)
+            assert resultado['importados'] == args.filas, resultado['errores'][:3]
+            print(f'{"lote " + str(lote):>18}{resultado["segundos"]:>10.2f}'
+                  f'{resultado["filas_por_segundo"]:>10}  ({base / resultado["segundos"]:.0f}x)')
+
+        total = conn.execute('SELECT COUNT(*) FROM productos').fetchone()[0]
+        assert total == args.filas * (len(args.lotes) + 1), total
+        conn.close()
+
+if __name__ == '__main__':
+    main()
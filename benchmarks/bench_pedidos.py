@@ -0,0 +1,127 @@
+"""Prueba de carga del registro de pedidos con varios procesos compradores.
+
+Crea una base temporal con pocos productos y poco stock y lanza N procesos que
+compran en bucle (línea de carrito + pedidos.registrar_pedido) hasta agotar el
+stock. Al final comprueba que:
+
+- ningún producto quedó con stock negativo;
+- las unidades vendidas en las órdenes son exactamente el stock descontado;
+- reenviar el mismo pedido con la misma clave de idempotencia, desde varios
+  procesos a la vez, deja una sola orden.
+
+    python benchmarks/bench_pedidos.py --procesos 8 --productos 5 --stock 40
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def poblar(conn, productos, stock):
+    conn.execute("INSERT INTO categorias (nombre, tipo) VALUES ('Bench', 'ofertas')")
+    conn.executemany('INSERT INTO productos (id, nombre, precio, stock, categoria_id) VALUES (?, ?, 100, ?, 1)',
+                     [(i, f'Producto {i}', stock) for i in range(1, productos + 1)])
+    conn.commit()
+
+def comprar(conn, sesion, producto_id, cantidad, clave=None):
+    from pedidos import registrar_pedido
+    conn.execute('''
+        INSERT INTO carrito (session_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, 100)
+        ON CONFLICT DO NOTHING
+    ''', (sesion, producto_id, cantidad))
+    conn.commit()
+    return registrar_pedido(conn, None, sesion, {'nombre': 'Bench', 'telefono': '71234567', 'metodo_pago': 'whatsapp'},
+                            {'metodo': 'retiro', 'direccion': None, 'ciudad': None}, None, clave=clave)
+
+def comprador(numero, productos, resultados):
+    import database
+    from pedidos import StockInsuficiente
+
+    conn = database.get_db_connection()
+    rnd = random.Random(numero)
+    agotados, ordenes, rechazos = set(), 0, 0
+    while len(agotados) < productos:
+        producto_id = rnd.choice([i for i in range(1, productos + 1) if i not in agotados])
+        sesion = f'bench-{numero}-{ordenes + rechazos}'
+        try:
+            comprar(conn, sesion, producto_id, rnd.randint(1, 3))
+            ordenes += 1
+        except StockInsuficiente:
+            rechazos += 1
+            conn.execute('DELETE FROM carrito WHERE session_id = ?', (sesion,))
+            conn.commit()
+            if conn.execute('SELECT stock FROM productos WHERE id = ?', (producto_id,)).fetchone()[0] == 0:
+                agotados.add(producto_id)
+    conn.close()
+    resultados.put((ordenes, rechazos))
+
+def reenvio(numero, clave, resultados):
+    import database
+
+    conn = database.get_db_connection()
+    orden = comprar(conn, 'bench-reenvio', 1, 1, clave=clave)
+    conn.close()
+    resultados.put(orden['id'])
+
+def lanzar(contexto, cantidad, objetivo, argumentos):
+    resultados = contexto.Queue()
+    procesos = [contexto.Process(target=objetivo, args=(i, *argumentos, resultados)) for i in range(cantidad)]
+    for proceso in procesos:
+        proceso.start()
+    salida = [resultados.get(timeout=120) for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+    return salida
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--procesos', type=int, default=8)
+    parser.add_argument('--productos', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Los procesos hijos heredan el entorno: todos abren la misma base
+        os.environ['TIENDA_DB'] = os.path.join(tmp, 'bench.db')
+        import database
+        from migraciones import aplicar_migraciones
+        database.init_database()
+        aplicar_migraciones()
+
+        conn = database.get_db_connection()
+        poblar(conn, args.productos, args.stock)
+        contexto = get_context('spawn')
+
+        inicio = time.perf_counter()
+        salida = lanzar(contexto, args.procesos, comprador, (args.productos,))
+        segundos = time.perf_counter() - inicio
+        ordenes = sum(o for o, _ in salida)
+        rechazos = sum(r for _, r in salida)
+
+        negativos = conn.execute('SELECT COUNT(*) FROM productos WHERE stock < 0').fetchone()[0]
+        restante = conn.execute('SELECT SUM(stock) FROM productos').fetchone()[0]
+        vendidas = conn.execute('SELECT COALESCE(SUM(cantidad), 0) FROM orden_items').fetchone()[0]
+        print(f'{args.procesos} procesos: {ordenes} órdenes y {rechazos} rechazos por stock en {segundos:.2f}s '
+              f'({ordenes / segundos:.0f} órdenes/s)')
+        print(f'stock inicial {args.productos * args.stock}, vendido {vendidas}, restante {restante}, '
+              f'productos con stock negativo {negativos}')
+        assert negativos == 0, 'stock negativo'
+        assert restante == 0, 'quedó stock sin vender'
+        assert vendidas == args.productos * args.stock, 'las órdenes no cuadran con el stock descontado'
+
+        conn.execute('UPDATE productos SET stock = 100 WHERE id = 1')
+        conn.commit()
+        antes = conn.execute('SELECT COUNT(*) FROM ordenes').fetchone()[0]
+        ids = lanzar(contexto, args.procesos, reenvio, ('clave-bench-reenvio',))
+        nuevas = conn.execute('SELECT COUNT(*) FROM ordenes').fetchone()[0] - antes
+        stock = conn.execute('SELECT stock FROM productos WHERE id = 1').fetchone()[0]
+        print(f'reenvío con la misma clave desde {args.procesos} procesos: {nuevas} orden nueva, stock 100 -> {stock}')
+        assert nuevas == 1 and len(set(ids)) == 1 and stock == 99, 'la clave de idempotencia no evitó duplicados'
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark de los reportes de ventas: agregados de reportes.py vs consultas sobre ordenes.
+
+Genera un conjunto sintético de órdenes (por defecto un millón, repartidas en
+dos años, con una a tres líneas cada una), acumula los agregados y compara el
+tiempo de cada reporte leyendo ventas_diarias/ventas_mensuales contra la misma
+agregación sobre ordenes y orden_items. Mide también el costo incremental:
+acumular órdenes nuevas y recalcular los días de órdenes que cambiaron de estado.
+
+    python benchmarks/bench_reportes.py --ordenes 1000000
+    python benchmarks/bench_reportes.py --ordenes 200000 --db /tmp/ventas.db   # conservar la base
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TIPOS = ['hombres', 'mujeres', 'ninos', 'ofertas']
+METODOS = ['tigo_money', 'qr_simple', 'whatsapp']
+ESTADOS = ['pendiente', 'pagado', 'procesando', 'enviado', 'completado', 'cancelado']
+INICIO = datetime(2024, 1, 1)
+DIAS = 730
+
+def generar(conn, ordenes, productos=300, lote=50000, semilla=7):
+    """Insertar categorías, productos y órdenes sintéticas con sus líneas"""
+    rnd = random.Random(semilla)
+    conn.executemany('INSERT INTO categorias (nombre, tipo) VALUES (?, ?)',
+                     [(f'Categoria {i}', TIPOS[i % 4]) for i in range(12)])
+    precios = {i: float(rnd.randint(40, 600)) for i in range(1, productos + 1)}
+    conn.executemany('INSERT INTO productos (id, nombre, precio, stock, categoria_id) VALUES (?, ?, ?, 1000, ?)',
+                     [(i, f'Producto {i}', precio, rnd.randint(1, 12)) for i, precio in precios.items()])
+    conn.commit()
+
+    segundos = DIAS * 24 * 3600
+    for inicio in range(1, ordenes + 1, lote):
+        filas, items = [], []
+        for orden_id in range(inicio, min(inicio + lote, ordenes + 1)):
+            total = 0.0
+            for producto_id in rnd.sample(range(1, productos + 1), rnd.randint(1, 3)):
+                cantidad = rnd.randint(1, 3)
+                subtotal = precios[producto_id] * cantidad
+                total += subtotal
+                items.append((orden_id, producto_id, f'Producto {producto_id}', cantidad, precios[producto_id], subtotal))
+            envio = 20.0 if rnd.random() < 0.6 else 0.0
+            # Órdenes en orden cronológico, como en producción
+            fecha = INICIO + timedelta(seconds=segundos * orden_id // ordenes)
+            filas.append((orden_id, total + envio, rnd.choice(METODOS), rnd.choice(ESTADOS),
+                          fecha.strftime('%Y-%m-%d %H:%M:%S'), 'envio' if envio else 'retiro', envio))
+        conn.executemany('''
+            INSERT INTO ordenes (id, nombre_cliente, telefono_cliente, total, metodo_pago, estado, fecha,
+                                 entrega_metodo, envio_costo)
+            VALUES (?, 'Cliente', '71234567', ?, ?, ?, ?, ?, ?)
+        ''', filas)
+        conn.executemany('''
+            INSERT INTO orden_items (orden_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', items)
+        conn.commit()
+
+DIRECTAS = {
+    'dia': '''
+        SELECT date(fecha) AS clave, COUNT(*), SUM(total) FROM ordenes
+        WHERE fecha >= ? AND fecha < date(?, '+1 day') GROUP BY 1''',
+    'mes': '''
+        SELECT strftime('%Y-%m', fecha) AS clave, COUNT(*), SUM(total) FROM ordenes
+        WHERE fecha >= ? AND fecha < date(?, '+1 day') GROUP BY 1''',
+    'metodo_pago': '''
+        SELECT metodo_pago AS clave, COUNT(*), SUM(total) FROM ordenes
+        WHERE fecha >= ? AND fecha < date(?, '+1 day') GROUP BY 1''',
+    'tipo': '''
+        SELECT c.tipo AS clave, COUNT(DISTINCT o.id), SUM(i.subtotal)
+        FROM ordenes o JOIN orden_items i ON i.orden_id = o.id
+        JOIN productos p ON p.id = i.producto_id JOIN categorias c ON c.id = p.categoria_id
+        WHERE o.fecha >= ? AND o.fecha < date(?, '+1 day') GROUP BY 1''',
+}
+
+def cronometrar(funcion, repeticiones=3):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000, resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ordenes', type=int, default=1000000)
+    parser.add_argument('--db', help='ruta de la base a generar (por defecto un temporal)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['TIENDA_DB'] = args.db or os.path.join(tmp, 'bench.db')
+        import database
+        import reportes
+        database.init_database()
+        conn = database.get_db_connection()
+
+        inicio = time.perf_counter()
+        generar(conn, args.ordenes)
+        print(f'{args.ordenes} órdenes generadas en {time.perf_counter() - inicio:.1f}s')
+
+        inicio = time.perf_counter()
+        reportes.acumular(conn)
+        filas = conn.execute('SELECT COUNT(*) FROM ventas_diarias').fetchone()[0]
+        print(f'acumulación inicial: {time.perf_counter() - inicio:.1f}s ({filas} filas diarias)')
+
+        rangos = [('2025-03-01', '2025-03-31'), ('2024-01-01', '2024-12-31'), ('2024-02-10', '2025-11-20')]
+        print(f'{"agrupar":>12}{"rango":>25}{"ordenes ms":>12}{"agregados ms":>14}{"mejora":>9}')
+        for agrupar, sql in DIRECTAS.items():
+            for desde, hasta in rangos:
+                directa, esperado = cronometrar(lambda: conn.execute(sql, (desde, hasta)).fetchall(), 1)
+                agregada, filas = cronometrar(lambda: reportes.consultar(conn, desde, hasta, agrupar))
+                # Mismo resultado por los dos caminos
+                assert {(f[0], f[1], round(f[2], 2)) for f in esperado} == \
+                       {(f['clave'], f['ordenes'], round(f['ingresos'], 2)) for f in filas}, agrupar
+                print(f'{agrupar:>12}{desde + ".." + hasta:>25}{directa:>12.1f}{agregada:>14.2f}'
+                      f'{directa / agregada:>8.0f}x')
+
+        ultima = conn.execute('SELECT MAX(id) FROM ordenes').fetchone()[0]
+        conn.executemany('''
+            INSERT INTO ordenes (nombre_cliente, telefono_cliente, total, metodo_pago, estado)
+            VALUES ('Cliente', '71234567', 100, 'qr_simple', 'pendiente')
+        ''', [()] * 1000)
+        conn.commit()
+        ms, (ordenes, _) = cronometrar(lambda: reportes.acumular(conn), 1)
+        print(f'acumular 1000 órdenes nuevas: {ms:.1f} ms ({ordenes} órdenes)')
+
+        conn.execute("UPDATE ordenes SET estado = 'completado' WHERE id BETWEEN ? AND ?", (ultima - 9999, ultima))
+        conn.commit()
+        ms, (_, dias) = cronometrar(lambda: reportes.acumular(conn), 1)
+        print(f'recalcular tras cambiar el estado de 10000 órdenes: {ms:.1f} ms ({dias} días)')
+        conn.close()
+
+if __name__ == '__main__':
+    main()
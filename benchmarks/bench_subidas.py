@@ -0,0 +1,145 @@
+"""Benchmark de memoria del worker durante subidas concurrentes de imágenes.
+
+Levanta un worker (servidor Werkzeug con hilos) en un proceso hijo por modo y
+le envía subidas concurrentes de ~12MB:
+
+- legado: request.files + comprobación de extensión + almacenar(), como antes.
+- streaming: subidas.leer_formulario(), que escribe la imagen a disco por bloques.
+
+Se reporta el pico de memoria residente del worker (VmHWM en Linux,
+ru_maxrss en otros sistemas) y el tiempo total. El almacén va a un temporal.
+
+    python benchmarks/bench_subidas.py --concurrencia 8 --subidas 32 --mb 12
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import struct
+import sys
+import tempfile
+import time
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pico_rss_kb():
+    try:
+        with open('/proc/self/status') as status:
+            for linea in status:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo // 1024 if sys.platform == 'darwin' else maximo
+
+def png_sin_comprimir(mb):
+    """PNG válido de ~mb MB (datos IDAT sin comprimir) y dimensiones moderadas"""
+    ancho = 1500
+    alto = max(1, mb * 1024 * 1024 // (ancho * 3 + 1))
+
+    def bloque(tipo, datos):
+        return (struct.pack('>I', len(datos)) + tipo + datos +
+                struct.pack('>I', zlib.crc32(tipo + datos) & 0xffffffff))
+
+    filas = (b'\x00' + os.urandom(ancho * 3)) * alto
+    return (b'\x89PNG\r\n\x1a\n' +
+            bloque(b'IHDR', struct.pack('>IIBBBBB', ancho, alto, 8, 2, 0, 0, 0)) +
+            bloque(b'IDAT', zlib.compress(filas, 0)) +
+            bloque(b'IEND', b''))
+
+def worker(modo, puerto, almacen, listo):
+    from flask import Flask, jsonify, request
+    from werkzeug.serving import make_server
+
+    import imagenes
+    import subidas
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    imagenes.DIRECTORIO_ALMACEN = almacen
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+    subidas.init_app(app)
+
+    @app.post('/subir')
+    def subir():
+        if modo == 'legado':
+            archivo = request.files.get('imagen')
+            extension = archivo.filename.rsplit('.', 1)[1].lower()
+            if extension not in {'png', 'jpg', 'jpeg', 'gif', 'webp'}:
+                return jsonify({'success': False}), 400
+            url = imagenes.almacenar(archivo.stream, extension)
+        else:
+            form, imagen = subidas.leer_formulario()
+            url = imagen.guardar()
+        return jsonify({'success': True, 'url': url})
+
+    @app.get('/rss')
+    def rss():
+        return jsonify({'pico_kb': pico_rss_kb()})
+
+    servidor = make_server('127.0.0.1', puerto, app, threaded=True)
+    listo.set()
+    servidor.serve_forever()
+
+def cuerpo_multipart(imagen):
+    limite = 'bench-subidas-limite'
+    cuerpo = (f'--{limite}\r\nContent-Disposition: form-data; name="nombre"\r\n\r\nBench\r\n'
+              f'--{limite}\r\nContent-Disposition: form-data; name="imagen"; filename="bench.png"\r\n'
+              f'Content-Type: image/png\r\n\r\n').encode() + imagen + f'\r\n--{limite}--\r\n'.encode()
+    return cuerpo, f'multipart/form-data; boundary={limite}'
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def medir(modo, cuerpo, tipo, concurrencia, subidas):
+    contexto = get_context('spawn')
+    puerto = puerto_libre()
+    listo = contexto.Event()
+    with tempfile.TemporaryDirectory() as almacen:
+        proceso = contexto.Process(target=worker, args=(modo, puerto, almacen, listo), daemon=True)
+        proceso.start()
+        listo.wait(30)
+        url = f'http://127.0.0.1:{puerto}'
+        base = json.loads(urllib.request.urlopen(f'{url}/rss').read())['pico_kb']
+
+        def subir(_):
+            peticion = urllib.request.Request(f'{url}/subir', data=cuerpo, headers={'Content-Type': tipo})
+            with urllib.request.urlopen(peticion) as respuesta:
+                return respuesta.status
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(concurrencia) as ejecutor:
+            estados = list(ejecutor.map(subir, range(subidas)))
+        segundos = time.perf_counter() - inicio
+        assert estados == [200] * subidas, estados
+
+        pico = json.loads(urllib.request.urlopen(f'{url}/rss').read())['pico_kb']
+        proceso.terminate()
+        proceso.join()
+    return base, pico, segundos
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--subidas', type=int, default=32)
+    parser.add_argument('--mb', type=int, default=12)
+    args = parser.parse_args()
+
+    cuerpo, tipo = cuerpo_multipart(png_sin_comprimir(args.mb))
+    print(f'{len(cuerpo) / 1024 / 1024:.1f}MB por subida, {args.subidas} subidas, concurrencia {args.concurrencia}')
+    print(f'{"modo":>10}{"RSS base MB":>13}{"pico MB":>10}{"segundos":>10}')
+    for modo in ('legado', 'streaming'):
+        base, pico, segundos = medir(modo, cuerpo, tipo, args.concurrencia, args.subidas)
+        print(f'{modo:>10}{base / 1024:>13.1f}{pico / 1024:>10.1f}{segundos:>10.2f}')
+
+if __name__ == '__main__':
+    main()
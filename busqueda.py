@@ -0,0 +1,80 @@
+"""Búsqueda de productos con SQLite FTS5.
+
+La tabla virtual productos_fts (migración 4) indexa nombre y descripción con el
+tokenizador unicode61 sin diacríticos, así "pantalon" encuentra "Pantalón". Los
+triggers sobre productos la mantienen sincronizada.
+"""
+import re
+
+POR_PAGINA = 24
+# Peso de cada columna en bm25(): el nombre pesa más que la descripción
+PESOS_BM25 = (10.0, 1.0)
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+def construir_consulta(texto):
+    """Convertir el texto del usuario en una expresión MATCH segura.
+
+    Cada palabra se cita (no se interpretan operadores FTS5) y se busca por
+    prefijo; las palabras se combinan con AND.
+    """
+    tokens = _TOKEN.findall(texto or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+# Orden de los resultados; por defecto relevancia (BM25)
+ORDEN_SQL = {
+    'relevancia': 'relevancia, p.nombre',
+    'calificacion': 'p.calificacion_bayes DESC, p.calificacion_cantidad DESC, relevancia',
+    'popularidad': 'p.calificacion_cantidad DESC, p.calificacion_bayes DESC, relevancia',
+    'nombre': 'p.nombre',
+}
+
+def buscar_productos(conn, texto, tipo=None, pagina=1, por_pagina=POR_PAGINA, orden='relevancia'):
+    """Productos activos que coinciden con texto, ordenados por relevancia (BM25) u `orden`.
+
+    Devuelve (resultados de la página, total de coincidencias).
+    """
+    consulta = construir_consulta(texto)
+    if not consulta:
+        return [], 0
+
+    # CROSS JOIN fija el orden: FTS5 manda; si no, SQLite recorre productos por
+    # el índice de activo y evalúa MATCH fila por fila
+    filtro = '''
+        FROM productos_fts
+        CROSS JOIN productos p ON p.id = productos_fts.rowid
+        JOIN categorias c ON p.categoria_id = c.id
+        WHERE productos_fts MATCH ? AND p.activo = 1
+    '''
+    params = [consulta]
+    if tipo:
+        filtro += ' AND c.tipo = ?'
+        params.append(tipo)
+
+    total = conn.execute(f'SELECT COUNT(*) {filtro}', params).fetchone()[0]
+    pagina = max(1, pagina)
+    resultados = conn.execute(f'''
+        SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo,
+               bm25(productos_fts, {PESOS_BM25[0]}, {PESOS_BM25[1]}) as relevancia
+        {filtro}
+        ORDER BY {ORDEN_SQL.get(orden, ORDEN_SQL['relevancia'])}
+        LIMIT ? OFFSET ?
+    ''', params + [por_pagina, (pagina - 1) * por_pagina]).fetchall()
+    return resultados, total
+
+def sugerencias(conn, texto, limite=8):
+    """Autocompletado: nombres de productos activos que empiezan como lo escrito"""
+    consulta = construir_consulta(texto)
+    if not consulta:
+        return []
+
+    filas = conn.execute(f'''
+        SELECT p.id, p.nombre, p.precio, p.imagen, c.tipo as categoria_tipo
+        FROM productos_fts
+        CROSS JOIN productos p ON p.id = productos_fts.rowid
+        JOIN categorias c ON p.categoria_id = c.id
+        WHERE productos_fts MATCH ? AND p.activo = 1
+        ORDER BY bm25(productos_fts, {PESOS_BM25[0]}, {PESOS_BM25[1]}), p.nombre
+        LIMIT ?
+    ''', (f'nombre : ({consulta})', limite)).fetchall()
+    return [dict(fila) for fila in filas]
@@ -0,0 +1,44 @@
+"""Operaciones del carrito: fusión al iniciar sesión y conteo de unidades."""
+from database import ejecutar_escritura
+
+def fusionar_carrito(conn, session_id, usuario_id):
+    """Pasar el carrito anónimo de session_id al usuario al iniciar sesión.
+
+    Tres sentencias en una sola transacción BEGIN IMMEDIATE: suma las cantidades
+    de los productos que el usuario ya tenía, borra esas líneas anónimas y
+    re-asigna el resto. Es idempotente: si el login se repite ya no quedan
+    líneas anónimas y no cambia nada. Devuelve cuántas líneas anónimas se fusionaron.
+    """
+    def escribir(conn):
+        conn.execute('''
+            UPDATE carrito SET cantidad = cantidad + (
+                SELECT SUM(s.cantidad) FROM carrito s
+                WHERE s.session_id = ? AND s.usuario_id IS NULL AND s.producto_id = carrito.producto_id
+            )
+            WHERE usuario_id = ? AND producto_id IN (
+                SELECT producto_id FROM carrito WHERE session_id = ? AND usuario_id IS NULL
+            )
+        ''', (session_id, usuario_id, session_id))
+        sumadas = conn.execute('''
+            DELETE FROM carrito
+            WHERE session_id = ? AND usuario_id IS NULL AND producto_id IN (
+                SELECT producto_id FROM carrito WHERE usuario_id = ?
+            )
+        ''', (session_id, usuario_id)).rowcount
+        movidas = conn.execute('''
+            UPDATE carrito SET usuario_id = ?, session_id = NULL
+            WHERE session_id = ? AND usuario_id IS NULL
+        ''', (usuario_id, session_id)).rowcount
+        return sumadas + movidas
+
+    return ejecutar_escritura(conn, escribir)
+
+def contar_carrito(conn, usuario_id, session_id):
+    """Unidades en el carrito del usuario o, si no inició sesión, de la sesión anónima"""
+    if usuario_id:
+        total = conn.execute('SELECT SUM(cantidad) FROM carrito WHERE usuario_id = ?', (usuario_id,)).fetchone()[0]
+    else:
+        # Las filas ya fusionadas a un usuario conservan el session_id: no cuentan
+        total = conn.execute('SELECT SUM(cantidad) FROM carrito WHERE session_id = ? AND usuario_id IS NULL',
+                             (session_id,)).fetchone()[0]
+    return total or 0
@@ -0,0 +1,201 @@
+"""Caché en memoria del catálogo con invalidación por contador de generación.
+
+Los triggers de la migración 3 incrementan versiones.valor ('catalogo' cuando
+cambia productos/categorias, 'resenas' cuando cambian los comentarios). Cada
+worker de gunicorn guarda su propia instantánea y solo la reconstruye cuando la
+versión en la base es distinta a la que tiene en memoria.
+
+CacheFragmentos guarda además el HTML ya renderizado de las partes anónimas de
+las páginas (grilla del inicio, relacionados, reseñas) con la versión en la
+clave: al cambiar la versión la entrada vieja deja de pedirse y el LRU la expulsa.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+TIPOS_CATALOGO = ['hombres', 'mujeres', 'ninos', 'ofertas']
+VECINOS = 4
+
+# Órdenes disponibles para los listados; calificacion_bayes y calificacion_cantidad
+# vienen ya calculadas en productos (migraciones 8 y 9)
+ORDENES = {
+    'nombre': lambda p: p['nombre'],
+    'calificacion': lambda p: (-p['calificacion_bayes'], -p['calificacion_cantidad'], p['nombre']),
+    'popularidad': lambda p: (-p['calificacion_cantidad'], -p['calificacion_bayes'], p['nombre']),
+}
+
+class Instantanea:
+    """Vista inmutable del catálogo activo en una versión dada"""
+
+    def __init__(self, version, productos, categorias):
+        self.version = version
+        self.productos = productos
+        self.categorias = categorias
+        self.tipos = sorted({c['tipo'] for c in categorias})
+        self.por_id = {p['id']: p for p in productos}
+        self._ordenados = {}
+
+        self.por_tipo = {tipo: [] for tipo in TIPOS_CATALOGO}
+        self.por_categoria = {}
+        for producto in productos:
+            self.por_tipo.setdefault(producto['categoria_tipo'], []).append(producto)
+            self.por_categoria.setdefault(producto['categoria_id'], []).append(producto)
+        # Vecinos precalculados: los siguientes VECINOS de la misma categoría en
+        # orden alfabético (circular), así cada producto muestra relacionados distintos
+        self.vecinos = {}
+        for lista in self.por_categoria.values():
+            lista.sort(key=lambda p: p['nombre'])
+            cantidad = min(VECINOS, len(lista) - 1)
+            for i, producto in enumerate(lista):
+                self.vecinos[producto['id']] = tuple(lista[(i + j) % len(lista)] for j in range(1, cantidad + 1))
+
+    def productos_organizados(self, orden=None):
+        # Copia superficial: la plantilla no debe poder alterar la instantánea
+        if orden in ORDENES:
+            return {tipo: list(self.por_tipo_ordenados(tipo, orden)) for tipo in self.por_tipo}
+        return {tipo: list(productos) for tipo, productos in self.por_tipo.items()}
+
+    def por_tipo_ordenados(self, tipo=None, orden='nombre'):
+        """Productos de un tipo (o todos) en el orden pedido; cada orden se calcula una vez por versión"""
+        clave = (tipo or None, orden if orden in ORDENES else 'nombre')
+        lista = self._ordenados.get(clave)
+        if lista is None:
+            productos = self.productos if not tipo else self.por_tipo.get(tipo, [])
+            lista = self._ordenados[clave] = sorted(productos, key=ORDENES[clave[1]])
+        return lista
+
+    def relacionados(self, producto, limite=VECINOS):
+        return list(self.vecinos.get(producto['id'], ())[:limite])
+
+class CacheCatalogo:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalogo = None
+        self._resenas = None
+        self._metricas = {'aciertos': 0, 'fallos': 0, 'reconstrucciones_ms': 0.0}
+
+    def versiones(self, conn):
+        return {fila['clave']: fila['valor'] for fila in conn.execute('SELECT clave, valor FROM versiones')}
+
+    def catalogo(self, conn, versiones=None):
+        """Instantánea vigente del catálogo (se reconstruye si cambió la versión)"""
+        version = (versiones or self.versiones(conn)).get('catalogo', 0)
+        actual = self._catalogo
+        if actual is not None and actual.version == version:
+            self._metricas['aciertos'] += 1
+            return actual
+
+        with self._lock:
+            actual = self._catalogo
+            if actual is not None and actual.version == version:
+                self._metricas['aciertos'] += 1
+                return actual
+            self._metricas['fallos'] += 1
+            inicio = time.perf_counter()
+            productos = conn.execute('''
+                SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
+                FROM productos p
+                JOIN categorias c ON p.categoria_id = c.id
+                WHERE p.activo = 1
+                ORDER BY c.tipo, c.nombre, p.nombre
+            ''').fetchall()
+            categorias = conn.execute('SELECT * FROM categorias ORDER BY tipo, nombre').fetchall()
+            self._catalogo = Instantanea(version, productos, categorias)
+            self._metricas['reconstrucciones_ms'] += (time.perf_counter() - inicio) * 1000
+            return self._catalogo
+
+    def resenas_tienda(self, conn, versiones=None):
+        """Últimos comentarios aprobados sobre la tienda (sin producto)"""
+        version = (versiones or self.versiones(conn)).get('resenas', 0)
+        actual = self._resenas
+        if actual is not None and actual[0] == version:
+            self._metricas['aciertos'] += 1
+            return actual[1]
+
+        self._metricas['fallos'] += 1
+        filas = conn.execute('''
+            SELECT c.*, u.nombre as usuario_nombre
+            FROM comentarios c
+            JOIN usuarios u ON c.usuario_id = u.id
+            WHERE c.aprobado = 1 AND c.producto_id IS NULL
+            ORDER BY c.fecha DESC
+            LIMIT 5
+        ''').fetchall()
+        # "calificacion" se expone como "puntuacion" para el frontend
+        resenas = [{
+            'id': fila['id'],
+            'usuario_id': fila['usuario_id'],
+            'producto_id': fila['producto_id'],
+            'puntuacion': fila['calificacion'],
+            'comentario': fila['comentario'],
+            'fecha': fila['fecha'],
+            'aprobado': fila['aprobado'],
+            'usuario_nombre': fila['usuario_nombre'],
+        } for fila in filas]
+        self._resenas = (version, resenas)
+        return resenas
+
+    def estadisticas(self):
+        total = self._metricas['aciertos'] + self._metricas['fallos']
+        return dict(self._metricas,
+                    version_catalogo=self._catalogo.version if self._catalogo else None,
+                    version_resenas=self._resenas[0] if self._resenas else None,
+                    tasa_aciertos=round(self._metricas['aciertos'] / total, 4) if total else None)
+
+class CacheFragmentos:
+    """LRU de fragmentos HTML acotado por bytes (0 deshabilita la caché)"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._metricas = {'aciertos': 0, 'fallos': 0, 'expulsiones': 0, 'render_ms': 0.0}
+
+    def obtener(self, clave, renderizar):
+        """HTML del fragmento `clave`; si no está se llama a renderizar() y se guarda"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self._metricas['aciertos'] += 1
+                return entrada[0]
+
+        # Se renderiza fuera del lock: dos hilos pueden hacerlo a la vez, pero el resultado es el mismo
+        inicio = time.perf_counter()
+        html = Markup(renderizar())
+        tamano = len(html.encode('utf-8'))
+        with self._lock:
+            self._metricas['fallos'] += 1
+            self._metricas['render_ms'] += (time.perf_counter() - inicio) * 1000
+            if tamano > self.max_bytes:
+                return html
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[clave] = (html, tamano)
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                _, (_, expulsado) = self._entradas.popitem(last=False)
+                self._bytes -= expulsado
+                self._metricas['expulsiones'] += 1
+        return html
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        total = self._metricas['aciertos'] + self._metricas['fallos']
+        return dict(self._metricas,
+                    entradas=len(self._entradas),
+                    bytes=self._bytes,
+                    max_bytes=self.max_bytes,
+                    tasa_aciertos=round(self._metricas['aciertos'] / total, 4) if total else None)
+
+cache_catalogo = CacheCatalogo()
+cache_fragmentos = CacheFragmentos(int(float(os.environ.get('TIENDA_CACHE_FRAGMENTOS_MB', 8)) * 1024 * 1024))
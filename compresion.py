@@ -0,0 +1,205 @@
+"""Compresión de respuestas y GET condicional (ETag / Last-Modified).
+
+MiddlewareCompresion envuelve la app WSGI: a las respuestas HTML/JSON/CSS/JS
+con Content-Length por encima de MINIMO_COMPRESION les calcula un ETag débil
+(hash del cuerpo sin comprimir, el mismo para todas las codificaciones), responde
+304 si coincide con If-None-Match y si no las comprime con brotli o gzip según
+Accept-Encoding. Las respuestas sin Content-Length (streaming) o que ya traen
+Content-Encoding (static/dist) pasan intactas.
+
+El middleware igual tiene que renderizar la página para hashearla. El decorador
+@condicional evita también ese trabajo en las vistas que solo dependen de la
+tabla versiones: el ETag se arma con los contadores (y el usuario/carrito de la
+sesión, que se pinta en el navbar) y Last-Modified con versiones.actualizado,
+así que el 304 sale antes de ejecutar la vista.
+"""
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import g, make_response, request, session
+from werkzeug.datastructures import Headers
+from werkzeug.http import (generate_etag, http_date, parse_accept_header, parse_date,
+                           parse_etags, quote_etag, unquote_etag)
+
+from database import get_db
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+MINIMO_COMPRESION = int(os.environ.get('TIENDA_COMPRESION_MINIMO', 1024))
+MAXIMO_BUFFER = 8 * 1024 * 1024
+NIVEL_GZIP = 6
+CALIDAD_BROTLI = 5   # 11 es para los estáticos precompilados; por petición se prioriza la latencia
+TIPOS_COMPRIMIBLES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+def _no_modificado(environ, etag, ultima_modificacion):
+    """True si la petición condicional ya tiene esta versión (If-None-Match manda sobre If-Modified-Since)"""
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        return etag is not None and parse_etags(if_none_match).contains_weak(unquote_etag(etag)[0])
+    if_modified_since = parse_date(environ.get('HTTP_IF_MODIFIED_SINCE'))
+    return (if_modified_since is not None and ultima_modificacion is not None and
+            parse_date(ultima_modificacion) <= if_modified_since)
+
+def _codificacion(environ):
+    aceptadas = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+class MiddlewareCompresion:
+    """Middleware WSGI: ETag débil, 304 y compresión brotli/gzip de respuestas medianas"""
+
+    def __init__(self, app, minimo=MINIMO_COMPRESION):
+        self.app = app
+        self.minimo = minimo
+
+    def _procesable(self, environ, status, headers):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD') or not status.startswith('200'):
+            return False
+        if 'Content-Encoding' in headers or 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        longitud = headers.get('Content-Length', type=int)
+        if longitud is None or longitud > MAXIMO_BUFFER:
+            return False
+        tipo = headers.get('Content-Type', '')
+        return tipo.startswith(TIPOS_COMPRIMIBLES)
+
+    def __call__(self, environ, start_response):
+        capturado = {}
+
+        def capturar(status, headers, exc_info=None):
+            # Flask llama a start_response antes de devolver el cuerpo; se difiere
+            # hasta decidir si la respuesta se transforma
+            capturado['status'], capturado['headers'] = status, Headers(headers)
+            capturado['exc_info'] = exc_info
+            return lambda datos: None
+
+        app_iter = self.app(environ, capturar)
+        if 'status' not in capturado or not self._procesable(environ, capturado['status'], capturado['headers']):
+            if 'status' in capturado:
+                start_response(capturado['status'], capturado['headers'].to_wsgi_list(), capturado['exc_info'])
+            return app_iter
+
+        try:
+            cuerpo = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        status, headers = capturado['status'], capturado['headers']
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+        etag = headers.get('ETag')
+        if etag is None and environ['REQUEST_METHOD'] == 'GET':
+            etag = quote_etag(generate_etag(cuerpo), weak=True)
+            headers['ETag'] = etag
+
+        if _no_modificado(environ, etag, headers.get('Last-Modified')):
+            for cabecera in ('Content-Length', 'Content-Type'):
+                headers.pop(cabecera, None)
+            start_response('304 NOT MODIFIED', headers.to_wsgi_list())
+            return []
+
+        codificacion = _codificacion(environ) if len(cuerpo) >= self.minimo else None
+        if codificacion == 'br':
+            cuerpo = brotli.compress(cuerpo, quality=CALIDAD_BROTLI)
+        elif codificacion == 'gzip':
+            cuerpo = gzip.compress(cuerpo, compresslevel=NIVEL_GZIP, mtime=0)
+        if codificacion:
+            headers['Content-Encoding'] = codificacion
+            headers['Content-Length'] = str(len(cuerpo))
+            # Un ETag fuerte identifica bytes exactos: al comprimir pasa a débil
+            valor, debil = unquote_etag(etag) if etag else (None, True)
+            if not debil:
+                headers['ETag'] = quote_etag(valor, weak=True)
+        start_response(status, headers.to_wsgi_list())
+        return [cuerpo] if environ['REQUEST_METHOD'] == 'GET' else []
+
+# ========== GET CONDICIONAL POR VERSIÓN ==========
+
+def _revision():
+    """(huella, fecha) del código y las plantillas desplegadas.
+
+    Un deploy que cambia una plantilla no toca la tabla versiones: sin esto los
+    navegadores recibirían 304 con el HTML anterior. Todos los workers de un
+    mismo deploy calculan la misma huella.
+    """
+    base = os.path.dirname(os.path.abspath(__file__))
+    rutas = [os.path.join(base, 'static', 'dist', 'manifest.json')]
+    for carpeta in (base, os.path.join(base, 'templates')):
+        rutas += [os.path.join(carpeta, nombre) for nombre in os.listdir(carpeta)
+                  if nombre.endswith(('.py', '.html'))]
+    fechas = sorted((os.path.basename(ruta), os.path.getmtime(ruta)) for ruta in rutas if os.path.exists(ruta))
+    huella = hashlib.sha1(repr(fechas).encode()).hexdigest()[:8]
+    return huella, datetime.fromtimestamp(max(fecha for _, fecha in fechas), timezone.utc).replace(microsecond=0)
+
+REVISION, FECHA_REVISION = _revision()
+
+def _estado_sesion():
+    """Lo que la sesión aporta a la página (navbar); None si no se puede saber sin renderizar"""
+    if '_flashes' in session or 'carrito_count' not in session:
+        return None
+    return (session.get('user_id'), session.get('user_name'), session.get('user_role'),
+            session['carrito_count'])
+
+def condicional(*claves, por_sesion=True):
+    """Decorador: ETag/Last-Modified desde versiones; 304 sin ejecutar la vista.
+
+    claves son filas de versiones ('catalogo', 'resenas'). Con por_sesion el
+    ETag incluye el usuario y el contador del carrito y la respuesta es privada;
+    Last-Modified solo se envía sin usuario ni carrito, porque If-Modified-Since
+    no distingue entre visitantes.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            filas = get_db().execute(
+                f"SELECT clave, valor, actualizado FROM versiones WHERE clave IN ({','.join('?' * len(claves))})",
+                claves
+            ).fetchall()
+            g.versiones = {fila['clave']: fila['valor'] for fila in filas}
+
+            estado = _estado_sesion() if por_sesion else ()
+            if estado is None:
+                return vista(*args, **kwargs)
+            personal = any(estado)
+
+            firma = '-'.join([REVISION] + [f"{fila['clave']}{fila['valor']}" for fila in sorted(filas, key=lambda f: f['clave'])])
+            if personal:
+                firma += '-' + hashlib.sha1(repr(estado).encode()).hexdigest()[:12]
+            etag = quote_etag(firma, weak=True)
+            ultima = None
+            if not personal:
+                # versiones.actualizado es CURRENT_TIMESTAMP de SQLite (UTC)
+                fechas = [datetime.strptime(fila['actualizado'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+                          for fila in filas]
+                ultima = http_date(max(fechas + [FECHA_REVISION]))
+
+            if _no_modificado(request.environ, etag, ultima):
+                respuesta = make_response('', 304)
+            else:
+                respuesta = make_response(vista(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta
+            respuesta.headers['ETag'] = etag
+            if ultima:
+                respuesta.headers['Last-Modified'] = ultima
+            respuesta.headers['Cache-Control'] = 'private, no-cache' if por_sesion else 'public, no-cache'
+            return respuesta
+        return envoltura
+    return decorador
+
+def init_app(app):
+    app.wsgi_app = MiddlewareCompresion(app.wsgi_app)
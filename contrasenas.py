@@ -0,0 +1,118 @@
+"""Hash y verificación de contraseñas en un pool de hilos acotado.
+
+bcrypt tarda cientos de ms por llamada a propósito. Una ráfaga de logins no
+debe acaparar el CPU del worker: a lo sumo HILOS_BCRYPT cálculos corren a la
+vez, COLA_BCRYPT esperan, y el resto se rechaza con ContrasenasSaturadas para
+que la vista responda 503 en lugar de encolar sin límite. bcrypt libera el GIL,
+así que con workers gthread el catálogo sigue atendiéndose mientras tanto.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from database import BCRYPT_COSTO, hash_password, check_password
+
+HILOS_BCRYPT = int(os.environ.get('TIENDA_BCRYPT_HILOS', 2))
+COLA_BCRYPT = int(os.environ.get('TIENDA_BCRYPT_COLA', 8))
+TIMEOUT_BCRYPT = float(os.environ.get('TIENDA_BCRYPT_TIMEOUT', 10))
+
+class ContrasenasSaturadas(Exception):
+    """El pool de bcrypt tiene la cola llena o no respondió a tiempo; reintentar más tarde"""
+
+class PoolContrasenas:
+    """Ejecutor de bcrypt por proceso con límite de trabajos pendientes"""
+
+    def __init__(self, hilos=HILOS_BCRYPT, cola=COLA_BCRYPT, timeout=TIMEOUT_BCRYPT):
+        self.hilos = hilos
+        self.cola = cola
+        self.timeout = timeout
+        self._reiniciar()
+
+    def _reiniciar(self):
+        # Los hilos no sobreviven a un fork: cada worker crea su propio ejecutor
+        self._pid = os.getpid()
+        self._ejecutor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='bcrypt')
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._stats = {'verificaciones': 0, 'hashes': 0, 'rechazadas': 0, 'vencidas': 0, 'rehashes': 0}
+        self._latencias = {'verificar': deque(maxlen=500), 'hash': deque(maxlen=500)}
+
+    def _ejecutar(self, tipo, funcion, *args):
+        if os.getpid() != self._pid:
+            self._reiniciar()
+
+        with self._lock:
+            if self._pendientes >= self.hilos + self.cola:
+                self._stats['rechazadas'] += 1
+                raise ContrasenasSaturadas(f'{self._pendientes} operaciones de contraseña en curso')
+            self._pendientes += 1
+
+        inicio = time.perf_counter()
+        try:
+            futuro = self._ejecutor.submit(funcion, *args)
+        except BaseException:
+            self._liberar()
+            raise
+        # El cupo se libera cuando bcrypt termina, no cuando la vista deja de
+        # esperar: tras un timeout el cálculo sigue ocupando un hilo
+        futuro.add_done_callback(self._liberar)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturesTimeout:
+            # Si todavía estaba en cola no llega a ejecutarse
+            futuro.cancel()
+            with self._lock:
+                self._stats['vencidas'] += 1
+            raise ContrasenasSaturadas(f'La operación de contraseña superó {self.timeout:g}s')
+        finally:
+            # Incluye la espera en cola: es la latencia que percibe el login
+            self._latencias[tipo].append((time.perf_counter() - inicio) * 1000)
+
+    def _liberar(self, futuro=None):
+        with self._lock:
+            self._pendientes -= 1
+
+    def verificar(self, password, hashed):
+        self._stats['verificaciones'] += 1
+        return self._ejecutar('verificar', check_password, password, hashed)
+
+    def hash(self, password):
+        self._stats['hashes'] += 1
+        return self._ejecutar('hash', hash_password, password)
+
+    def registrar_rehash(self):
+        self._stats['rehashes'] += 1
+
+    def estadisticas(self):
+        latencias = {}
+        for tipo, valores in self._latencias.items():
+            ordenados = sorted(valores)
+            latencias[tipo] = {
+                'muestras': len(ordenados),
+                'p50_ms': round(ordenados[len(ordenados) // 2], 1) if ordenados else None,
+                'p95_ms': round(ordenados[int(len(ordenados) * 0.95) - 1], 1) if len(ordenados) >= 20 else None,
+            }
+        return dict(self._stats,
+                    pid=self._pid,
+                    costo=BCRYPT_COSTO,
+                    hilos=self.hilos,
+                    cola=self.cola,
+                    pendientes=self._pendientes,
+                    latencias=latencias)
+
+def necesita_rehash(hashed):
+    """True si el hash se generó con un costo distinto al configurado"""
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_COSTO
+    except (AttributeError, IndexError, ValueError):
+        return True
+
+_pool = None
+
+def get_pool_contrasenas():
+    global _pool
+    if _pool is None:
+        _pool = PoolContrasenas()
+    return _pool
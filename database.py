@@ -1,14 +1,229 @@
+import logging
+import os
+import queue
+import random
 import sqlite3
+import threading
+import time
 import bcrypt
 from datetime import datetime
+from flask import g
+
+DATABASE = os.environ.get('TIENDA_DB', 'tienda.db')
+POOL_SIZE = int(os.environ.get('TIENDA_DB_POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('TIENDA_DB_POOL_TIMEOUT', 10))
+# Factor de costo de bcrypt (2^costo rondas); los hashes viejos se regeneran al iniciar sesión
+BCRYPT_COSTO = int(os.environ.get('TIENDA_BCRYPT_COSTO', 12))
+
+logger = logging.getLogger(__name__)
+
+# Perfil de almacenamiento: journal_mode es persistente en el archivo y se fija
+# al iniciar; el resto de PRAGMAs son por conexión y se aplican al abrirla.
+PERFIL_ALMACENAMIENTO = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 64 * 1024 * 1024,
+    'cache_size': -16000,  # negativo = KiB (~16MB por conexión)
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,  # ms que SQLite espera un lock antes de fallar
+}
+
+# Política de reintentos para transacciones de escritura
+REINTENTOS_ESCRITURA = int(os.environ.get('TIENDA_DB_REINTENTOS', 5))
+ESPERA_BASE_REINTENTO = 0.05  # segundos, se duplica en cada intento
+
+_contencion = {'reintentos': 0, 'fallidas': 0}
+
+def aplicar_pragmas(conn, perfil=None):
+    perfil = PERFIL_ALMACENAMIENTO if perfil is None else perfil
+    for pragma, valor in perfil.items():
+        if pragma != 'journal_mode':
+            conn.execute(f'PRAGMA {pragma} = {valor}')
+
+def configurar_almacenamiento(conn, perfil=None):
+    """Fijar el modo de journal y devolver los valores efectivos del perfil"""
+    perfil = PERFIL_ALMACENAMIENTO if perfil is None else perfil
+    if 'journal_mode' in perfil:
+        conn.execute(f"PRAGMA journal_mode = {perfil['journal_mode']}")
+    aplicar_pragmas(conn, perfil)
+    return {pragma: conn.execute(f'PRAGMA {pragma}').fetchone()[0] for pragma in perfil}
 
 def get_db_connection():
-    conn = sqlite3.connect('tienda.db')
+    conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
+    aplicar_pragmas(conn)
     return conn
 
+def _es_contencion(error):
+    mensaje = str(error).lower()
+    return 'locked' in mensaje or 'busy' in mensaje
+
+def ejecutar_escritura(conn, escribir, intentos=REINTENTOS_ESCRITURA):
+    """Ejecutar escribir(conn) en una transacción BEGIN IMMEDIATE con reintentos.
+
+    Si la base está bloqueada por otro worker se hace rollback y se reintenta
+    con backoff exponencial (con jitter) hasta agotar los intentos.
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute('BEGIN IMMEDIATE')
+            resultado = escribir(conn)
+            conn.commit()
+            return resultado
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not _es_contencion(e) or intento == intentos:
+                if _es_contencion(e):
+                    _contencion['fallidas'] += 1
+                    logger.error('Escritura abandonada tras %d intentos: %s', intento, e)
+                raise
+            espera = ESPERA_BASE_REINTENTO * (2 ** (intento - 1))
+            espera += random.uniform(0, espera)
+            _contencion['reintentos'] += 1
+            logger.warning('Base de datos bloqueada (intento %d/%d), reintentando en %.0f ms',
+                           intento, intentos, espera * 1000)
+            time.sleep(espera)
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+def estadisticas_contencion():
+    return dict(_contencion)
+
+class PoolAgotado(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera"""
+
+class PoolConexiones:
+    """Pool de conexiones SQLite por proceso (un pool por worker de gunicorn)"""
+
+    def __init__(self, ruta, max_conexiones=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.ruta = ruta
+        self.max_conexiones = max_conexiones
+        self.timeout = timeout
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._abiertas = 0
+        self._stats = {
+            'checkouts': 0,
+            'esperas': 0,
+            'tiempo_espera_ms': 0.0,
+            'creadas': 0,
+            'descartadas': 0,
+            'agotado': 0
+        }
+
+    def _nueva_conexion(self):
+        conn = sqlite3.connect(self.ruta, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        aplicar_pragmas(conn)
+        self._stats['creadas'] += 1
+        return conn
+
+    def obtener(self):
+        # Las conexiones heredadas por fork (gunicorn --preload) no se comparten
+        if os.getpid() != self._pid:
+            self._reiniciar()
+
+        try:
+            conn = self._libres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                crear = self._abiertas < self.max_conexiones
+                if crear:
+                    self._abiertas += 1
+            if crear:
+                try:
+                    conn = self._nueva_conexion()
+                except Exception:
+                    with self._lock:
+                        self._abiertas -= 1
+                    raise
+            else:
+                self._stats['esperas'] += 1
+                inicio = time.perf_counter()
+                try:
+                    conn = self._libres.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._stats['agotado'] += 1
+                    raise PoolAgotado(f'Sin conexiones libres tras {self.timeout}s')
+                finally:
+                    self._stats['tiempo_espera_ms'] += (time.perf_counter() - inicio) * 1000
+
+        self._stats['checkouts'] += 1
+        return conn
+
+    def liberar(self, conn):
+        if os.getpid() != self._pid:
+            return
+        try:
+            # Nunca devolver al pool una transacción a medias
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._descartar(conn)
+            return
+        self._libres.put(conn)
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._abiertas -= 1
+        self._stats['descartadas'] += 1
+
+    def cerrar_todas(self):
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            self._descartar(conn)
+
+    def estadisticas(self):
+        libres = self._libres.qsize()
+        return dict(self._stats,
+                    pid=self._pid,
+                    max_conexiones=self.max_conexiones,
+                    abiertas=self._abiertas,
+                    libres=libres,
+                    en_uso=self._abiertas - libres)
+
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = PoolConexiones(DATABASE)
+    return _pool
+
+def get_db():
+    """Conexión del pool ligada al contexto de la aplicación (una por petición)"""
+    if 'db' not in g:
+        g.db = get_pool().obtener()
+    return g.db
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().liberar(conn)
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
 def init_database():
     conn = get_db_connection()
+    configurar_almacenamiento(conn)
     
     # Crear tablas
     conn.execute('''
@@ -90,10 +305,14 @@ def init_database():
     ''')
     
     conn.commit()
+    
+    # Cambios posteriores del esquema (índices, columnas nuevas...)
+    from migraciones import aplicar_migraciones
+    aplicar_migraciones(conn)
     conn.close()
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_COSTO)).decode('utf-8')
 
 def check_password(password, hashed):
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""Estadísticas materializadas del panel de administración.
+
+La tabla estadisticas (migración 5) guarda contadores por (clave, dimension) que
+los triggers mantienen en la misma transacción que cada escritura:
+
+    productos_activos        ''             productos con activo = 1
+    comentarios_pendientes   ''             comentarios con aprobado = 0
+    ordenes_estado           estado         órdenes por estado
+    ordenes_metodo           metodo_pago    órdenes por método de pago
+    ingresos_dia             YYYY-MM-DD     suma de total de las órdenes no canceladas
+
+Así el panel lee unas pocas filas en lugar de contar tablas completas.
+
+    python estadisticas.py               # recalcula y reporta diferencias
+    python estadisticas.py --solo-revisar
+"""
+import argparse
+import sys
+
+from database import get_db_connection, ejecutar_escritura
+
+# Misma definición que usan los triggers, escrita como agregados completos
+CONSULTAS_RECALCULO = [
+    "SELECT 'productos_activos', '', COUNT(*) FROM productos WHERE activo = 1",
+    "SELECT 'comentarios_pendientes', '', COUNT(*) FROM comentarios WHERE aprobado = 0",
+    "SELECT 'ordenes_estado', COALESCE(estado, ''), COUNT(*) FROM ordenes GROUP BY 1, 2",
+    "SELECT 'ordenes_metodo', COALESCE(metodo_pago, ''), COUNT(*) FROM ordenes GROUP BY 1, 2",
+    '''SELECT 'ingresos_dia', date(fecha), SUM(total) FROM ordenes
+       WHERE COALESCE(estado, '') <> 'cancelado' GROUP BY 1, 2''',
+]
+
+def _sumar(clave, dimension, valor):
+    # Sentencia para los triggers: suma valor al contador, creándolo si no existe
+    return f'''INSERT INTO estadisticas (clave, dimension, valor) VALUES ('{clave}', {dimension}, {valor})
+            ON CONFLICT(clave, dimension) DO UPDATE SET valor = valor + excluded.valor;'''
+
+def _ingreso(fila):
+    return f"CASE WHEN COALESCE({fila}.estado, '') <> 'cancelado' THEN {fila}.total ELSE 0 END"
+
+def _recalcular(conn):
+    """Reescribir la tabla desde cero; devuelve las diferencias encontradas.
+
+    Debe llamarse dentro de una transacción de escritura.
+    """
+    actuales = {(f['clave'], f['dimension']): f['valor']
+                for f in conn.execute('SELECT clave, dimension, valor FROM estadisticas')}
+    esperadas = {}
+    for sql in CONSULTAS_RECALCULO:
+        for clave, dimension, valor in conn.execute(sql):
+            esperadas[(clave, dimension or '')] = valor or 0
+
+    diferencias = []
+    for llave in sorted(set(actuales) | set(esperadas)):
+        antes, despues = actuales.get(llave, 0), esperadas.get(llave, 0)
+        if abs(antes - despues) > 0.005:
+            diferencias.append((llave[0], llave[1], antes, despues))
+
+    conn.execute('DELETE FROM estadisticas')
+    conn.executemany('INSERT INTO estadisticas (clave, dimension, valor) VALUES (?, ?, ?)',
+                     [(clave, dimension, valor) for (clave, dimension), valor in esperadas.items()])
+    return diferencias
+
+# Pasos de la migración 5
+MIGRACION = [
+    '''CREATE TABLE IF NOT EXISTS estadisticas (
+        clave TEXT NOT NULL,
+        dimension TEXT NOT NULL DEFAULT '',
+        valor REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (clave, dimension)
+    ) WITHOUT ROWID''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_productos_ins AFTER INSERT ON productos BEGIN
+        {_sumar('productos_activos', "''", '(NEW.activo = 1)')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_productos_upd AFTER UPDATE OF activo ON productos BEGIN
+        {_sumar('productos_activos', "''", '(NEW.activo = 1) - (OLD.activo = 1)')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_productos_del AFTER DELETE ON productos BEGIN
+        {_sumar('productos_activos', "''", '-(OLD.activo = 1)')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_comentarios_ins AFTER INSERT ON comentarios BEGIN
+        {_sumar('comentarios_pendientes', "''", '(NEW.aprobado = 0)')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_comentarios_upd AFTER UPDATE OF aprobado ON comentarios BEGIN
+        {_sumar('comentarios_pendientes', "''", '(NEW.aprobado = 0) - (OLD.aprobado = 0)')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_comentarios_del AFTER DELETE ON comentarios BEGIN
+        {_sumar('comentarios_pendientes', "''", '-(OLD.aprobado = 0)')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_ordenes_ins AFTER INSERT ON ordenes BEGIN
+        {_sumar('ordenes_estado', "COALESCE(NEW.estado, '')", 1)}
+        {_sumar('ordenes_metodo', "COALESCE(NEW.metodo_pago, '')", 1)}
+        {_sumar('ingresos_dia', 'date(NEW.fecha)', _ingreso('NEW'))}
+    END''',
+    # Una actualización equivale a retirar la fila vieja y sumar la nueva
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_ordenes_upd
+    AFTER UPDATE OF estado, metodo_pago, total, fecha ON ordenes BEGIN
+        {_sumar('ordenes_estado', "COALESCE(OLD.estado, '')", -1)}
+        {_sumar('ordenes_estado', "COALESCE(NEW.estado, '')", 1)}
+        {_sumar('ordenes_metodo', "COALESCE(OLD.metodo_pago, '')", -1)}
+        {_sumar('ordenes_metodo', "COALESCE(NEW.metodo_pago, '')", 1)}
+        {_sumar('ingresos_dia', 'date(OLD.fecha)', '-' + _ingreso('OLD'))}
+        {_sumar('ingresos_dia', 'date(NEW.fecha)', _ingreso('NEW'))}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_estadisticas_ordenes_del AFTER DELETE ON ordenes BEGIN
+        {_sumar('ordenes_estado', "COALESCE(OLD.estado, '')", -1)}
+        {_sumar('ordenes_metodo', "COALESCE(OLD.metodo_pago, '')", -1)}
+        {_sumar('ingresos_dia', 'date(OLD.fecha)', '-' + _ingreso('OLD'))}
+    END''',
+    _recalcular,
+]
+
+class _SoloRevision(Exception):
+    def __init__(self, diferencias):
+        super().__init__()
+        self.diferencias = diferencias
+
+def reconciliar(conn, corregir=True):
+    """Recalcular las estadísticas y devolver las diferencias (clave, dimension, antes, despues).
+
+    Con corregir=False la tabla queda como estaba.
+    """
+    def escribir(conn):
+        diferencias = _recalcular(conn)
+        if not corregir:
+            # Deshacer la reescritura sin perder las diferencias calculadas
+            raise _SoloRevision(diferencias)
+        return diferencias
+
+    try:
+        return ejecutar_escritura(conn, escribir)
+    except _SoloRevision as revision:
+        conn.rollback()
+        return revision.diferencias
+
+def resumen(conn, dia=None):
+    """Valores que muestra el panel de administración (ingresos del día en UTC, como ordenes.fecha)"""
+    valores = {}
+    for fila in conn.execute('''
+        SELECT clave, dimension, valor FROM estadisticas
+        WHERE clave IN ('productos_activos', 'comentarios_pendientes', 'ordenes_estado', 'ordenes_metodo')
+           OR (clave = 'ingresos_dia' AND dimension = COALESCE(?, date('now')))
+    ''', (dia,)):
+        valores.setdefault(fila['clave'], {})[fila['dimension']] = fila['valor']
+
+    ordenes_estado = {k: int(v) for k, v in valores.get('ordenes_estado', {}).items() if v}
+    return {
+        'total_productos': int(valores.get('productos_activos', {}).get('', 0)),
+        'comentarios_pendientes': int(valores.get('comentarios_pendientes', {}).get('', 0)),
+        'total_ordenes': sum(ordenes_estado.values()),
+        'ordenes_por_estado': ordenes_estado,
+        'ordenes_por_metodo': {k: int(v) for k, v in valores.get('ordenes_metodo', {}).items() if v},
+        'ingresos_hoy': next(iter(valores.get('ingresos_dia', {}).values()), 0),
+    }
+
+def ingresos_diarios(conn, desde, hasta):
+    """Ingresos por día entre dos fechas (YYYY-MM-DD, inclusivo)"""
+    return conn.execute('''
+        SELECT dimension as dia, valor as ingresos FROM estadisticas
+        WHERE clave = 'ingresos_dia' AND dimension BETWEEN ? AND ?
+        ORDER BY dimension
+    ''', (desde, hasta)).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconciliar las estadísticas del panel de administración')
+    parser.add_argument('--solo-revisar', action='store_true',
+                        help='reportar diferencias sin corregir la tabla')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    diferencias = reconciliar(conn, corregir=not args.solo_revisar)
+    conn.close()
+    for clave, dimension, antes, despues in diferencias:
+        print(f'{clave}[{dimension}]: {antes:g} -> {despues:g}')
+    if not diferencias:
+        print('Estadísticas al día, sin diferencias')
+    elif args.solo_revisar:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Cambios de estado de órdenes, individuales o en masa, con historial.
+
+TRANSICIONES define a qué estados puede pasar una orden desde cada estado; el
+servidor la aplica siempre, venga el cambio de un formulario o de la API.
+Un cambio en masa (miles de ids o un filtro como los de /ordenes) se hace en
+una sola transacción y con unas pocas sentencias: las órdenes se cargan en
+una tabla temporal con su estado actual (ids en trozos de WHERE id IN (...)),
+se descartan las transiciones no permitidas y el UPDATE de ordenes y el
+INSERT en ordenes_historial se hacen uniendo contra esa tabla, en lugar de
+una sentencia (o un commit) por orden.
+"""
+import time
+
+from database import ejecutar_escritura
+
+ESTADOS = ('pendiente', 'pagado', 'procesando', 'enviado', 'completado', 'cancelado')
+
+# estado actual -> estados a los que puede pasar
+TRANSICIONES = {
+    'pendiente': {'pagado', 'procesando', 'cancelado'},
+    'pagado': {'procesando', 'enviado', 'cancelado'},
+    'procesando': {'enviado', 'cancelado'},
+    'enviado': {'completado'},
+    'completado': set(),
+    'cancelado': set(),
+}
+IDS_POR_SENTENCIA = 500     # por debajo del límite de variables de SQLite antiguos
+MAX_IDS = 100000
+MAX_EJEMPLOS = 20           # ids rechazados que se devuelven como muestra
+
+# Pasos de la migración 13
+MIGRACION = [
+    '''CREATE TABLE IF NOT EXISTS ordenes_historial (
+        id INTEGER PRIMARY KEY,
+        orden_id INTEGER NOT NULL REFERENCES ordenes(id) ON DELETE CASCADE,
+        anterior TEXT,
+        estado TEXT NOT NULL,
+        usuario_id INTEGER,
+        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_ordenes_historial_orden ON ordenes_historial(orden_id, id)',
+]
+
+class CambioInvalido(ValueError):
+    """Estado desconocido o selección de órdenes vacía o demasiado grande"""
+
+def condicion_estado(estado):
+    """(condición, params) para filtrar por estado actual como lo ve cambiar_estado.
+
+    Las órdenes antiguas pueden tener estado NULL y cuentan como pendiente,
+    igual que el COALESCE de la tabla temporal, sin perder el índice de estado.
+    """
+    if estado == 'pendiente':
+        return '(estado = ? OR estado IS NULL)', [estado]
+    return 'estado = ?', [estado]
+
+def origenes(estado):
+    """Estados desde los que se puede pasar a estado"""
+    return sorted(actual for actual, destinos in TRANSICIONES.items() if estado in destinos)
+
+def cambiar_estado(conn, estado, ids=None, condiciones=(), params=(), usuario_id=None):
+    """Pasar a estado las órdenes ids (o las que cumplen condiciones) y devolver el resumen.
+
+    Las órdenes cuyo estado actual no permite la transición se dejan como
+    están y se cuentan en 'rechazadas' (por estado actual). Todo ocurre en una
+    transacción: o se aplican todos los cambios válidos o ninguno.
+    """
+    if estado not in ESTADOS:
+        raise CambioInvalido(f"estado debe ser uno de: {', '.join(ESTADOS)}")
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            raise CambioInvalido('Selecciona al menos una orden')
+        if len(ids) > MAX_IDS:
+            raise CambioInvalido(f'Se pueden cambiar hasta {MAX_IDS} órdenes por vez')
+    elif not condiciones:
+        # Sin filtro se cambiarían todas las órdenes
+        raise CambioInvalido('Indica ids o al menos un filtro')
+
+    inicio = time.perf_counter()
+    permitidos = origenes(estado)
+    marcas = ', '.join('?' * len(permitidos))
+
+    def escribir(conn):
+        conn.execute('''CREATE TEMP TABLE IF NOT EXISTS cambio_estado (
+            orden_id INTEGER PRIMARY KEY,
+            anterior TEXT NOT NULL
+        )''')
+        conn.execute('DELETE FROM temp.cambio_estado')
+        if ids is not None:
+            for i in range(0, len(ids), IDS_POR_SENTENCIA):
+                trozo = ids[i:i + IDS_POR_SENTENCIA]
+                conn.execute(f'''
+                    INSERT INTO temp.cambio_estado (orden_id, anterior)
+                    SELECT id, COALESCE(estado, 'pendiente') FROM ordenes
+                    WHERE id IN ({', '.join('?' * len(trozo))})
+                ''', trozo)
+        else:
+            conn.execute(f'''
+                INSERT INTO temp.cambio_estado (orden_id, anterior)
+                SELECT id, COALESCE(estado, 'pendiente') FROM ordenes WHERE {' AND '.join(condiciones)}
+            ''', list(params))
+
+        encontradas = conn.execute('SELECT COUNT(*) FROM temp.cambio_estado').fetchone()[0]
+        sin_cambio = conn.execute('SELECT COUNT(*) FROM temp.cambio_estado WHERE anterior = ?',
+                                  (estado,)).fetchone()[0]
+        excluir = f'anterior NOT IN ({marcas})' if permitidos else '1'
+        rechazadas = dict(conn.execute(f'''
+            SELECT anterior, COUNT(*) FROM temp.cambio_estado
+            WHERE anterior != ? AND {excluir} GROUP BY anterior
+        ''', [estado] + permitidos).fetchall())
+        ejemplos = [fila[0] for fila in conn.execute(f'''
+            SELECT orden_id FROM temp.cambio_estado
+            WHERE anterior != ? AND {excluir} ORDER BY orden_id LIMIT ?
+        ''', [estado] + permitidos + [MAX_EJEMPLOS])]
+
+        conn.execute(f'DELETE FROM temp.cambio_estado WHERE {excluir}', permitidos)
+        actualizadas = conn.execute('''
+            UPDATE ordenes SET estado = ? WHERE id IN (SELECT orden_id FROM temp.cambio_estado)
+        ''', (estado,)).rowcount
+        conn.execute('''
+            INSERT INTO ordenes_historial (orden_id, anterior, estado, usuario_id)
+            SELECT orden_id, anterior, ?, ? FROM temp.cambio_estado ORDER BY orden_id
+        ''', (estado, usuario_id))
+        conn.execute('DELETE FROM temp.cambio_estado')
+        return {
+            'estado': estado,
+            'solicitadas': len(ids) if ids is not None else encontradas,
+            'actualizadas': actualizadas,
+            'sin_cambio': sin_cambio,
+            'no_encontradas': len(ids) - encontradas if ids is not None else 0,
+            'rechazadas': rechazadas,
+            'ejemplos_rechazadas': ejemplos,
+        }
+
+    resultado = ejecutar_escritura(conn, escribir)
+    resultado['ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+    return resultado
+
+def historial(conn, orden_id):
+    """Cambios de estado de una orden, del más antiguo al más reciente"""
+    filas = conn.execute('''
+        SELECT anterior, estado, usuario_id, fecha FROM ordenes_historial
+        WHERE orden_id = ? ORDER BY id
+    ''', (orden_id,)).fetchall()
+    return [dict(fila) for fila in filas]
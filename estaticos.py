@@ -0,0 +1,275 @@
+"""CSS y JS precompilados: minificados, con hash en el nombre y precomprimidos.
+
+Flask servía static/css y static/js tal cual, con caché por defecto y (tras un
+proxy que comprime) gzip en cada petición. El paso de build deja en static/dist
+una copia minificada de cada archivo con el hash de su contenido en el nombre
+(css/custom.3f2a9c1e.css), sus variantes .gz y .br, y un manifest.json:
+
+    {"css/custom.css": {"archivo": "css/custom.3f2a9c1e.css", "gz": true, "br": true}, ...}
+
+Con el manifest cargado, url_for('static', filename='css/custom.css') devuelve
+/static/dist/css/custom.3f2a9c1e.css; esa ruta elige la variante según
+Accept-Encoding y la sirve con Cache-Control immutable, sin comprimir nada en
+el worker. Sin manifest (desarrollo) se sirven los originales. Brotli es
+opcional: sin el paquete solo se generan .gz. El JS se minifica con rjsmin
+(sin él se copia tal cual) y, si node está instalado, el build falla cuando
+el resultado no parsea.
+
+    python estaticos.py              # compila static/css y static/js
+    python estaticos.py --limpiar    # borra static/dist
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import time
+
+from flask import abort, request, send_from_directory
+
+from imagenes import CACHE_INMUTABLE
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # pragma: no cover - dependencia opcional
+    rjsmin = None
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_STATIC = os.path.join(BASE_DIR, 'static')
+DIRECTORIO_DIST = os.path.join(DIRECTORIO_STATIC, 'dist')
+MANIFEST = os.path.join(DIRECTORIO_DIST, 'manifest.json')
+CARPETAS = ('css', 'js')
+EXTENSIONES = ('.css', '.js')
+
+# ========== MINIFICACIÓN ==========
+
+def _partes(codigo):
+    """Partir CSS en ('codigo', texto), ('cadena', texto) y ('comentario', texto).
+
+    Las cadenas se copian intactas; solo se toca el espacio en blanco y los comentarios.
+    """
+    partes = []
+    i, inicio, n = 0, 0, len(codigo)
+    while i < n:
+        c = codigo[i]
+        fin = None
+        if c in '"\'':
+            fin = i + 1
+            while fin < n and codigo[fin] != c:
+                fin += 2 if codigo[fin] == '\\' else 1
+            fin, tipo = fin + 1, 'cadena'
+        elif codigo.startswith('/*', i):
+            fin, tipo = codigo.find('*/', i + 2), 'comentario'
+            fin = n if fin == -1 else fin + 2
+        if fin is None:
+            i += 1
+            continue
+        if inicio < i:
+            partes.append(('codigo', codigo[inicio:i]))
+        partes.append((tipo, codigo[i:fin]))
+        i = inicio = fin
+    if inicio < n:
+        partes.append(('codigo', codigo[inicio:]))
+    return partes
+
+def minificar_css(codigo):
+    salida = []
+    for tipo, texto in _partes(codigo):
+        if tipo == 'comentario':
+            continue
+        if tipo == 'codigo':
+            texto = re.sub(r'\s+', ' ', texto)
+            texto = re.sub(r'\s*([{};,>])\s*', r'\1', texto)
+            # Solo en declaraciones: en selectores "a :hover" el espacio importa
+            texto = re.sub(r'(?<=[;{])([\w-]+)\s*:\s*', r'\1:', texto)
+            texto = texto.replace(';}', '}')
+        salida.append(texto)
+    return ''.join(salida).strip()
+
+def minificar_js(codigo):
+    """rjsmin si está instalado; si no, el original tal cual (solo hash y compresión).
+
+    Distinguir una / de división de una expresión regular, o un // dentro de
+    una regex o una plantilla, requiere un tokenizador de verdad: no se
+    intenta con heurísticas propias.
+    """
+    if rjsmin is None:
+        return codigo
+    return rjsmin.jsmin(codigo, keep_bang_comments=True) + '\n'
+
+MINIFICADORES = {'.css': minificar_css, '.js': minificar_js}
+
+# ========== BUILD ==========
+
+def _escribir(ruta, datos):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'wb') as destino:
+        destino.write(datos)
+    os.replace(temporal, ruta)
+
+class ErrorBuild(Exception):
+    """Un archivo compilado no pasa la verificación; el build se aborta"""
+
+def verificar_js(ruta, original):
+    """Fallar si el JS minificado no parsea (node --check); sin node se omite con un aviso"""
+    node = shutil.which('node')
+    if node is None:
+        log.warning('node no está instalado: no se verificó la sintaxis de %s', original)
+        return
+    resultado = subprocess.run([node, '--check', ruta], capture_output=True, text=True)
+    if resultado.returncode == 0:
+        return
+    roto = subprocess.run([node, '--check', os.path.join(DIRECTORIO_STATIC, original)],
+                          capture_output=True).returncode != 0
+    causa = 'el original ya tiene errores de sintaxis' if roto else 'la versión minificada no parsea'
+    raise ErrorBuild(f'{original}: {causa}\n{resultado.stderr.strip()}')
+
+def compilar_archivo(relativa):
+    """Minificar, versionar y comprimir un archivo; devuelve su entrada del manifest"""
+    base, extension = os.path.splitext(relativa)
+    with open(os.path.join(DIRECTORIO_STATIC, relativa), 'rb') as origen:
+        datos = origen.read()
+    # Los .min.* ya vienen minificados
+    if not base.endswith('.min'):
+        datos = MINIFICADORES[extension](datos.decode('utf-8')).encode('utf-8')
+
+    huella = hashlib.sha256(datos).hexdigest()[:8]
+    archivo = f'{base}.{huella}{extension}'
+    destino = os.path.join(DIRECTORIO_DIST, archivo)
+    _escribir(destino, datos)
+    if extension == '.js' and not base.endswith('.min'):
+        try:
+            verificar_js(destino, relativa)
+        except ErrorBuild:
+            os.remove(destino)
+            raise
+
+    entrada = {'archivo': archivo, 'bytes': len(datos), 'gz': False, 'br': False}
+    # Solo se guarda la variante comprimida si realmente es más chica
+    comprimido = gzip.compress(datos, compresslevel=9, mtime=0)
+    if len(comprimido) < len(datos):
+        _escribir(f'{destino}.gz', comprimido)
+        entrada['gz'] = True
+    if brotli is not None:
+        comprimido = brotli.compress(datos, quality=11)
+        if len(comprimido) < len(datos):
+            _escribir(f'{destino}.br', comprimido)
+            entrada['br'] = True
+    return entrada
+
+def compilar():
+    """Compilar static/css y static/js en static/dist y escribir el manifest"""
+    manifest = {}
+    for carpeta in CARPETAS:
+        for raiz, _, archivos in os.walk(os.path.join(DIRECTORIO_STATIC, carpeta)):
+            for nombre in sorted(archivos):
+                if not nombre.endswith(EXTENSIONES):
+                    continue
+                relativa = os.path.relpath(os.path.join(raiz, nombre), DIRECTORIO_STATIC).replace(os.sep, '/')
+                manifest[relativa] = compilar_archivo(relativa)
+    _escribir(MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+# ========== SERVIR ==========
+
+_manifest = {}
+
+def cargar_manifest():
+    """Leer el manifest; se ignoran las entradas cuyo original cambió después del build"""
+    global _manifest
+    try:
+        with open(MANIFEST, encoding='utf-8') as archivo:
+            manifest = json.load(archivo)
+        generado = os.path.getmtime(MANIFEST)
+    except (OSError, ValueError):
+        _manifest = {}
+        return _manifest
+
+    vigentes = {}
+    for relativa, entrada in manifest.items():
+        try:
+            modificado = os.path.getmtime(os.path.join(DIRECTORIO_STATIC, relativa))
+        except OSError:
+            continue
+        if modificado > generado:
+            log.warning('%s cambió después del build; se sirve el original (python estaticos.py)', relativa)
+            continue
+        vigentes[relativa] = entrada
+    _manifest = vigentes
+    return _manifest
+
+def url_versionada(endpoint, values):
+    """url_defaults: url_for('static', filename=...) apunta a la versión compilada"""
+    if endpoint != 'static' or not _manifest:
+        return
+    entrada = _manifest.get(values.get('filename'))
+    if entrada:
+        values['filename'] = f"dist/{entrada['archivo']}"
+
+def servir_compilado(archivo):
+    """Servir un archivo de static/dist con la mejor variante precomprimida"""
+    if archivo.endswith(('.gz', '.br')) or archivo == 'manifest.json':
+        abort(404)
+    tipo = mimetypes.guess_type(archivo)[0] or 'application/octet-stream'
+
+    variante, codificacion = archivo, None
+    aceptadas = request.accept_encodings
+    for sufijo, nombre in (('.br', 'br'), ('.gz', 'gzip')):
+        if aceptadas[nombre] and os.path.exists(os.path.join(DIRECTORIO_DIST, archivo + sufijo)):
+            variante, codificacion = archivo + sufijo, nombre
+            break
+
+    respuesta = send_from_directory(DIRECTORIO_DIST, variante, mimetype=tipo)
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    respuesta.headers['Cache-Control'] = CACHE_INMUTABLE
+    respuesta.expires = time.time() + 365 * 24 * 3600
+    return respuesta
+
+def init_app(app):
+    cargar_manifest()
+    app.url_defaults(url_versionada)
+    # Más específica que /static/<path:filename>, así que tiene prioridad
+    app.add_url_rule('/static/dist/<path:archivo>', 'estatico_compilado', servir_compilado)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--limpiar', action='store_true', help='borrar static/dist')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.limpiar:
+        shutil.rmtree(DIRECTORIO_DIST, ignore_errors=True)
+        log.info('static/dist eliminado')
+        return
+
+    try:
+        manifest = compilar()
+    except ErrorBuild as e:
+        # El manifest anterior queda intacto: se siguen sirviendo los archivos de antes
+        parser.exit(1, f'{e}\n')
+    for relativa, entrada in sorted(manifest.items()):
+        original = os.path.getsize(os.path.join(DIRECTORIO_STATIC, relativa))
+        variantes = '+'.join(v for v in ('gz', 'br') if entrada[v]) or '-'
+        log.info('%-28s %7d -> %7d bytes  %s  %s', relativa, original, entrada['bytes'], variantes, entrada['archivo'])
+    if brotli is None:
+        log.info('brotli no está instalado: solo se generaron variantes .gz')
+    if rjsmin is None:
+        log.info('rjsmin no está instalado: el JS se versionó sin minificar')
+
+if __name__ == '__main__':
+    main()
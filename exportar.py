@@ -0,0 +1,114 @@
+"""Exportación en streaming (CSV o NDJSON) de órdenes, líneas de orden y productos.
+
+La respuesta es un generador: las filas se leen del cursor a medida que se
+envían (fetchmany) y se escriben en bloques de ~64KB, así que exportar
+500.000 órdenes usa la misma memoria que exportar diez y el primer byte sale
+apenas SQLite encuentra la primera fila. Cada exportación usa su propia
+conexión (no ocupa una del pool mientras el cliente descarga) y una sola
+sentencia, que en WAL lee una instantánea consistente.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import Response
+
+from database import get_db_connection
+
+FORMATOS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+FILAS_POR_LECTURA = 1000
+BLOQUE = 64 * 1024
+
+# Exportables: nombre -> (SELECT con {filtro}, ORDER BY). Los filtros de
+# filtros_ordenes() usan columnas de ordenes sin alias.
+CONSULTAS = {
+    'ordenes': ('''
+        SELECT id, fecha, estado, metodo_pago, usuario_id, nombre_cliente, telefono_cliente, total,
+               entrega_metodo, entrega_direccion, entrega_ciudad, envio_costo,
+               facturar, factura_nit, factura_ci
+        FROM ordenes {filtro}
+    ''', 'ORDER BY fecha, id'),
+    'orden_items': ('''
+        SELECT i.orden_id, o.fecha, o.estado, i.producto_id, i.producto_nombre, i.cantidad,
+               i.precio_unitario, i.subtotal
+        FROM ordenes o JOIN orden_items i ON i.orden_id = o.id {filtro}
+    ''', 'ORDER BY o.fecha, o.id, i.id'),
+    'productos': ('''
+        SELECT p.id, p.nombre, p.descripcion, p.precio, p.stock, c.nombre AS categoria,
+               c.tipo AS categoria_tipo, p.activo, p.fecha_creacion
+        FROM productos p LEFT JOIN categorias c ON c.id = p.categoria_id {filtro}
+    ''', 'ORDER BY p.id'),
+}
+
+class ExportacionInvalida(ValueError):
+    """Formato o tabla que no se puede exportar"""
+
+def _celda_csv(valor):
+    # Un texto que empieza con = + - @ se interpretaría como fórmula en Excel
+    if isinstance(valor, str) and valor[:1] in ('=', '+', '-', '@'):
+        return "'" + valor
+    return valor
+
+def _filas(sql, params):
+    """Generador de (columnas, filas) leyendo el cursor por partes"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(sql, params)
+        columnas = [d[0] for d in cursor.description]
+        yield columnas
+        while True:
+            filas = cursor.fetchmany(FILAS_POR_LECTURA)
+            if not filas:
+                break
+            yield filas
+    finally:
+        conn.close()
+
+def _csv(lectura):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM: Excel abre el archivo como UTF-8 (tildes en nombres y direcciones)
+    buffer.write('\ufeff')
+    escritor.writerow(next(lectura))
+    for filas in lectura:
+        escritor.writerows([_celda_csv(v) for v in fila] for fila in filas)
+        if buffer.tell() >= BLOQUE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def _ndjson(lectura):
+    columnas = next(lectura)
+    codificar = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    partes, tamano = [], 0
+    for filas in lectura:
+        for fila in filas:
+            linea = codificar(dict(zip(columnas, fila))) + '\n'
+            partes.append(linea)
+            tamano += len(linea)
+        if tamano >= BLOQUE:
+            yield ''.join(partes).encode('utf-8')
+            partes, tamano = [], 0
+    yield ''.join(partes).encode('utf-8')
+
+def exportar(nombre, formato='csv', condiciones=(), params=()):
+    """Response en streaming con la tabla exportable nombre filtrada por condiciones"""
+    if nombre not in CONSULTAS:
+        raise ExportacionInvalida(f'No se puede exportar {nombre}')
+    if formato not in FORMATOS:
+        raise ExportacionInvalida(f"formato debe ser uno de: {', '.join(FORMATOS)}")
+
+    sql, orden = CONSULTAS[nombre]
+    filtro = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+    lectura = _filas(f'{sql.format(filtro=filtro)} {orden}', list(params))
+    cuerpo = _csv(lectura) if formato == 'csv' else _ndjson(lectura)
+
+    archivo = f"{nombre}-{datetime.now().strftime('%Y%m%d-%H%M')}.{formato}"
+    return Response(cuerpo, content_type=FORMATOS[formato], headers={
+        'Content-Disposition': f'attachment; filename="{archivo}"',
+        'Cache-Control': 'no-store',
+        # Que un proxy (nginx) no acumule la respuesta antes de enviarla
+        'X-Accel-Buffering': 'no',
+    })
@@ -0,0 +1,358 @@
+"""Imágenes de productos: almacén por contenido y derivados responsivos.
+
+Cada imagen subida se guarda con el hash SHA-256 de su contenido como nombre
+(static/images/productos/almacen/ab/abcd....jpg): subir dos veces la misma foto
+no duplica el archivo, y como la URL cambia cuando cambia el contenido se sirve
+con Cache-Control immutable. Las imágenes que ningún producto referencia se
+borran con --gc.
+
+Las fotos que sube el admin suelen ser JPEG de WhatsApp de 100-200KB; la grilla
+del inicio no necesita más de ~480px. Al subir una imagen se encola la
+generación de los derivados en un hilo aparte (la petición no espera) y sus
+rutas quedan en productos.imagen_derivados como JSON:
+
+    {"card": {"ancho": 480, "jpg": "/static/.../foto.card.v1.jpg", "webp": "/static/.../foto.card.v1.webp"}, ...}
+
+Las plantillas arman srcset con la macro de templates/_imagen.html. Pillow es
+opcional: sin él no se generan derivados y se sigue sirviendo productos.imagen.
+
+    python imagenes.py --backfill            # genera los derivados que faltan
+    python imagenes.py --backfill --forzar   # los regenera todos
+    python imagenes.py --migrar              # pasa las imágenes antiguas al almacén
+    python imagenes.py --gc [--borrar]       # lista (o borra) imágenes sin referencias
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import request
+
+from database import get_db_connection, ejecutar_escritura
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - dependencia opcional
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DIRECTORIO_STATIC = os.path.realpath(os.path.join(BASE_DIR, 'static'))
+DIRECTORIO_PRODUCTOS = os.path.join(BASE_DIR, 'static', 'images', 'productos')
+DIRECTORIO_ALMACEN = os.path.join(DIRECTORIO_PRODUCTOS, 'almacen')
+URL_ALMACEN = '/static/images/productos/almacen/'
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+# nombre -> lado mayor en píxeles (nunca se amplía una imagen más chica)
+TAMANOS = {'thumb': 160, 'card': 480, 'detail': 1000}
+CALIDAD_JPEG = 82
+CALIDAD_WEBP = 78
+# Forma parte del nombre de los derivados: subirla si cambian TAMANOS o las
+# calidades, porque las URLs del almacén se cachean como inmutables
+VERSION_DERIVADOS = 1
+
+logger = logging.getLogger(__name__)
+
+def ruta_local(url):
+    """Ruta en disco de una URL /static/... (None si no apunta a static o sale de él con ..)"""
+    if not url or not url.startswith('/static/'):
+        return None
+    ruta = os.path.normpath(os.path.join(BASE_DIR, *url.lstrip('/').split('/')))
+    # realpath solo para comprobar: --gc compara contra las rutas de os.walk sin resolver
+    if os.path.commonpath([os.path.realpath(ruta), DIRECTORIO_STATIC]) != DIRECTORIO_STATIC:
+        return None
+    return ruta
+
+def _url_derivado(url, tamano, formato):
+    base, _ = os.path.splitext(url)
+    return f'{base}.{tamano}.v{VERSION_DERIVADOS}.{formato}'
+
+# ========== ALMACÉN POR CONTENIDO ==========
+
+def temporal_almacen():
+    """(descriptor, ruta) de un temporal dentro del almacén, para poder moverlo con os.replace"""
+    os.makedirs(DIRECTORIO_ALMACEN, exist_ok=True)
+    return tempfile.mkstemp(dir=DIRECTORIO_ALMACEN, suffix='.subiendo')
+
+def consolidar(temporal, digest, extension):
+    """Mover un temporal ya escrito a su nombre por contenido y devolver la URL.
+
+    os.replace es atómico: nunca se sirve un archivo a medio escribir. Si el
+    contenido ya existía, el temporal se descarta.
+    """
+    extension = extension.lower().lstrip('.')
+    # Mismo contenido, mismo nombre: .jpeg y .jpg son el mismo formato
+    extension = 'jpg' if extension == 'jpeg' else extension
+    nombre = digest[:32]
+    carpeta = os.path.join(DIRECTORIO_ALMACEN, nombre[:2])
+    os.makedirs(carpeta, exist_ok=True)
+    final = os.path.join(carpeta, f'{nombre}.{extension}')
+    url = f'{URL_ALMACEN}{nombre[:2]}/{nombre}.{extension}'
+    if os.path.exists(final):
+        try:
+            # Renovar el mtime: la gracia de sin_referencias() debe contar desde
+            # este uso, no desde la primera subida, o el GC podría borrarlo antes
+            # de que el producto que lo va a referenciar haga commit
+            os.utime(final)
+            os.remove(temporal)
+            return url
+        except FileNotFoundError:
+            pass  # el GC lo borró entre medio: se guarda el temporal
+    os.chmod(temporal, 0o644)
+    os.replace(temporal, final)
+    return url
+
+def _guardar_atomico(imagen, ruta, formato, **opciones):
+    """Guardar con Pillow en un temporal de la misma carpeta y moverlo con os.replace.
+
+    Las URLs de los derivados se sirven como inmutables: un lector concurrente
+    o una caída a mitad de la escritura no pueden dejar un archivo truncado.
+    """
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.subiendo')
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            imagen.save(destino, formato, **opciones)
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+def almacenar(flujo, extension, bloque=64 * 1024):
+    """Copiar el flujo al almacén con su hash como nombre y devolver la URL"""
+    digest = hashlib.sha256()
+    descriptor, temporal = temporal_almacen()
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            while True:
+                datos = flujo.read(bloque)
+                if not datos:
+                    break
+                digest.update(datos)
+                destino.write(datos)
+        return consolidar(temporal, digest.hexdigest(), extension)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+def cache_inmutable(respuesta):
+    """after_request: las URLs del almacén no cambian de contenido, nunca revalidar"""
+    if request.path.startswith(URL_ALMACEN) and respuesta.status_code in (200, 304):
+        respuesta.headers['Cache-Control'] = CACHE_INMUTABLE
+        respuesta.expires = time.time() + 365 * 24 * 3600
+    return respuesta
+
+def generar_derivados(url):
+    """Generar en disco los derivados de la imagen y devolver el dict para imagen_derivados.
+
+    Devuelve None si Pillow no está instalado o la imagen no existe.
+    """
+    origen = ruta_local(url)
+    if Image is None or not origen or not os.path.exists(origen):
+        return None
+
+    with Image.open(origen) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ('RGB', 'RGBA'):
+            imagen = imagen.convert('RGBA' if 'transparency' in imagen.info else 'RGB')
+
+        derivados = {}
+        for tamano, lado in TAMANOS.items():
+            copia = imagen.copy()
+            copia.thumbnail((lado, lado), Image.LANCZOS)
+
+            webp = _url_derivado(url, tamano, 'webp')
+            _guardar_atomico(copia, ruta_local(webp), 'WEBP', quality=CALIDAD_WEBP, method=4)
+
+            # JPEG no tiene transparencia: aplanar sobre blanco
+            if copia.mode == 'RGBA':
+                fondo = Image.new('RGB', copia.size, (255, 255, 255))
+                fondo.paste(copia, mask=copia.getchannel('A'))
+                copia = fondo
+            jpg = _url_derivado(url, tamano, 'jpg')
+            _guardar_atomico(copia, ruta_local(jpg), 'JPEG', quality=CALIDAD_JPEG, optimize=True, progressive=True)
+
+            derivados[tamano] = {'ancho': copia.width, 'jpg': jpg, 'webp': webp}
+    return derivados
+
+def guardar_derivados(conn, producto_id, url, derivados):
+    # Solo si el producto sigue teniendo esa imagen (pudo cambiar mientras se generaban)
+    ejecutar_escritura(conn, lambda conn: conn.execute(
+        'UPDATE productos SET imagen_derivados = ? WHERE id = ? AND imagen = ?',
+        (json.dumps(derivados), producto_id, url)))
+
+# ========== COLA EN SEGUNDO PLANO ==========
+
+_ejecutor = None
+_ejecutor_pid = None
+_lock = threading.Lock()
+
+def _procesar(producto_id, url):
+    try:
+        derivados = generar_derivados(url)
+        if derivados is None:
+            return
+        conn = get_db_connection()
+        try:
+            guardar_derivados(conn, producto_id, url, derivados)
+        finally:
+            conn.close()
+    except Exception:
+        logger.exception('No se pudieron generar los derivados de %s', url)
+
+def encolar_derivados(producto_id, url):
+    """Generar los derivados fuera del hilo de la petición"""
+    global _ejecutor, _ejecutor_pid
+    if Image is None or not url:
+        return None
+    with _lock:
+        # Un hilo por worker; los hilos no sobreviven a un fork
+        if _ejecutor is None or _ejecutor_pid != os.getpid():
+            _ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='imagenes')
+            _ejecutor_pid = os.getpid()
+    return _ejecutor.submit(_procesar, producto_id, url)
+
+# ========== PLANTILLAS ==========
+
+@lru_cache(maxsize=2048)
+def _cargar(valor):
+    try:
+        return json.loads(valor)
+    except (TypeError, ValueError):
+        return {}
+
+def derivados(producto):
+    """Filtro Jinja: dict de derivados de un producto (vacío si aún no existen)"""
+    try:
+        valor = producto['imagen_derivados']
+    except (KeyError, IndexError, TypeError):
+        return {}
+    return _cargar(valor) if valor else {}
+
+def srcset(derivados, formato):
+    """Filtro Jinja: "url 160w, url 480w, ..." para el formato pedido"""
+    anchos = {}
+    for datos in derivados.values():
+        anchos.setdefault(datos['ancho'], datos[formato])
+    return ', '.join(f'{url} {ancho}w' for ancho, url in sorted(anchos.items()))
+
+def init_app(app):
+    app.add_template_filter(derivados, 'derivados')
+    app.add_template_filter(srcset, 'srcset')
+    app.after_request(cache_inmutable)
+
+# ========== BACKFILL ==========
+
+def backfill(conn, forzar=False):
+    """Generar los derivados de las imágenes existentes; devuelve (generadas, omitidas)"""
+    condicion = '' if forzar else ' AND imagen_derivados IS NULL'
+    filas = conn.execute(f'SELECT id, imagen FROM productos WHERE imagen IS NOT NULL{condicion}').fetchall()
+
+    generadas = omitidas = 0
+    por_imagen = {}
+    for fila in filas:
+        # Varias filas pueden compartir archivo: se procesa una vez
+        if fila['imagen'] not in por_imagen:
+            por_imagen[fila['imagen']] = generar_derivados(fila['imagen'])
+        resultado = por_imagen[fila['imagen']]
+        if resultado is None:
+            omitidas += 1
+            continue
+        guardar_derivados(conn, fila['id'], fila['imagen'], resultado)
+        generadas += 1
+    return generadas, omitidas
+
+def migrar_al_almacen(conn):
+    """Pasar las imágenes con nombre antiguo (<nombre>_<timestamp>.jpg) al almacén.
+
+    Los archivos repetidos quedan como uno solo. Los originales no se borran
+    aquí: quedan sin referencias y los elimina --gc. Devuelve productos migrados.
+    """
+    filas = conn.execute('SELECT id, imagen FROM productos WHERE imagen IS NOT NULL').fetchall()
+    migrados = 0
+    for fila in filas:
+        origen = ruta_local(fila['imagen'])
+        if fila['imagen'].startswith(URL_ALMACEN) or not origen or not os.path.exists(origen):
+            continue
+        with open(origen, 'rb') as flujo:
+            url = almacenar(flujo, os.path.splitext(origen)[1])
+        ejecutar_escritura(conn, lambda conn: conn.execute(
+            'UPDATE productos SET imagen = ?, imagen_derivados = NULL WHERE id = ? AND imagen = ?',
+            (url, fila['id'], fila['imagen'])))
+        migrados += 1
+    return migrados
+
+def referenciadas(conn):
+    """Rutas en disco de todas las imágenes que usa algún producto (activo o no)"""
+    rutas = set()
+    for fila in conn.execute('SELECT imagen, imagen_derivados FROM productos WHERE imagen IS NOT NULL'):
+        urls = [fila['imagen']]
+        for datos in derivados(fila).values():
+            urls += [datos['jpg'], datos['webp']]
+        rutas.update(os.path.normpath(ruta_local(url)) for url in urls if ruta_local(url))
+    return rutas
+
+def sin_referencias(conn, gracia=3600):
+    """Archivos bajo las carpetas de productos que ningún producto usa.
+
+    Solo se miran subcarpetas (los archivos sueltos como default.jpg son de la
+    plantilla) y se ignoran los modificados hace menos de `gracia` segundos: una
+    subida en curso guarda el archivo antes de hacer commit del producto.
+    """
+    usadas = referenciadas(conn)
+    limite = time.time() - gracia
+    huerfanas = []
+    for raiz, _, archivos in os.walk(DIRECTORIO_PRODUCTOS):
+        if os.path.normpath(raiz) == os.path.normpath(DIRECTORIO_PRODUCTOS):
+            continue
+        for archivo in archivos:
+            ruta = os.path.normpath(os.path.join(raiz, archivo))
+            if ruta not in usadas and os.path.getmtime(ruta) < limite:
+                huerfanas.append(ruta)
+    return sorted(huerfanas)
+
+def main():
+    parser = argparse.ArgumentParser(description='Imágenes de productos: derivados, almacén y limpieza')
+    parser.add_argument('--backfill', action='store_true', help='generar los derivados que faltan')
+    parser.add_argument('--forzar', action='store_true', help='regenerar aunque ya existan')
+    parser.add_argument('--migrar', action='store_true', help='pasar las imágenes antiguas al almacén por contenido')
+    parser.add_argument('--gc', action='store_true', help='listar imágenes que ningún producto referencia')
+    parser.add_argument('--borrar', action='store_true', help='con --gc, borrarlas')
+    parser.add_argument('--gracia', type=int, default=60,
+                        help='con --gc, minutos en que una imagen nueva no se considera huérfana')
+    args = parser.parse_args()
+
+    if not (args.backfill or args.migrar or args.gc):
+        parser.print_help()
+        return
+
+    conn = get_db_connection()
+    if args.migrar:
+        print(f'{migrar_al_almacen(conn)} productos migrados al almacén')
+    if args.backfill:
+        if Image is None:
+            parser.exit(1, 'Pillow no está instalado: pip install Pillow\n')
+        generadas, omitidas = backfill(conn, args.forzar)
+        print(f'{generadas} productos con derivados, {omitidas} sin imagen local')
+    if args.gc:
+        huerfanas = sin_referencias(conn, args.gracia * 60)
+        liberados = 0
+        for ruta in huerfanas:
+            liberados += os.path.getsize(ruta)
+            if args.borrar:
+                os.remove(ruta)
+            print(os.path.relpath(ruta, BASE_DIR))
+        accion = 'borradas' if args.borrar else 'sin referencias (usar --borrar)'
+        print(f'{len(huerfanas)} imágenes {accion}, {liberados / 1024:.0f} KB')
+    conn.close()
+
+if __name__ == '__main__':
+    main()
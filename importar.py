@@ -0,0 +1,305 @@
+"""Importación masiva de productos desde CSV o JSONL, con las imágenes en un zip.
+
+Las filas se leen y validan de a una mientras se recorre el archivo (nunca se
+carga entero) y las válidas se insertan con executemany en lotes, cada lote en
+su propia transacción: una fila por transacción, como hace /api/productos,
+significa un fsync por producto. Las categorías se resuelven con un único
+diccionario cargado al empezar, y cada imagen del zip se valida con las mismas
+reglas que una subida y se guarda una sola vez aunque la usen varias filas.
+Las filas inválidas no detienen la importación: se informan con su número.
+
+Columnas: nombre, precio (obligatorias), descripcion, stock (100 por
+defecto), categoria_id o categoria (+ tipo si el nombre se repite entre
+tipos) e imagen (nombre del archivo dentro del zip o una URL /static/...).
+
+    python importar.py productos.csv --imagenes fotos.zip
+    python importar.py productos.jsonl --validar
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import posixpath
+import time
+import zipfile
+
+from database import ejecutar_escritura, get_db_connection
+from imagenes import encolar_derivados, ruta_local
+from subidas import SubidaRechazada, recibir_imagen
+
+FORMATOS = ('csv', 'jsonl')
+LOTE = 500
+MAX_ERRORES = 200                 # errores detallados en el resultado; el total se cuenta igual
+MAX_IMAGEN = 16 * 1024 * 1024     # tamaño descomprimido por imagen, como una subida
+MAX_NOMBRE = 200
+
+class ImportacionInvalida(ValueError):
+    """El archivo completo no se puede importar (formato, codificación, zip dañado)"""
+
+class FilaInvalida(ValueError):
+    """Una fila con datos que no se pueden importar"""
+
+def formato_de(nombre_archivo):
+    """Formato según la extensión del archivo (None si no se reconoce)"""
+    extension = os.path.splitext(nombre_archivo or '')[1].lower().lstrip('.')
+    if extension == 'ndjson':
+        return 'jsonl'
+    return extension if extension in FORMATOS else None
+
+def leer_filas(flujo, formato):
+    """Generador de (número de fila, dict o None si la línea no es un objeto JSON)"""
+    texto = io.TextIOWrapper(flujo, encoding='utf-8-sig', newline='' if formato == 'csv' else None)
+    if formato == 'csv':
+        # La fila 1 es la cabecera
+        yield from enumerate(csv.DictReader(texto), start=2)
+        return
+    for numero, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        yield numero, fila if isinstance(fila, dict) else None
+
+class Categorias:
+    """Búsqueda de categorías por id, por nombre o por (nombre, tipo), con una sola consulta"""
+
+    def __init__(self, conn):
+        self.ids = set()
+        self.por_tipo = {}
+        self.por_nombre = {}
+        for fila in conn.execute('SELECT id, nombre, tipo FROM categorias'):
+            nombre = fila['nombre'].strip().lower()
+            self.ids.add(fila['id'])
+            self.por_tipo[(nombre, fila['tipo'])] = fila['id']
+            # Un nombre repetido entre tipos (Pantalones, Chaquetas...) necesita el tipo
+            self.por_nombre[nombre] = None if nombre in self.por_nombre else fila['id']
+
+    def resolver(self, categoria_id, nombre, tipo):
+        if categoria_id:
+            try:
+                categoria_id = int(categoria_id)
+            except (ValueError, TypeError):
+                raise FilaInvalida('categoria_id debe ser un número')
+            if categoria_id not in self.ids:
+                raise FilaInvalida(f'La categoría {categoria_id} no existe')
+            return categoria_id
+        if not nombre:
+            raise FilaInvalida('La categoría es requerida (categoria_id o categoria)')
+        clave = nombre.lower()
+        if tipo:
+            if (clave, tipo) not in self.por_tipo:
+                raise FilaInvalida(f'La categoría {nombre!r} de {tipo!r} no existe')
+            return self.por_tipo[(clave, tipo)]
+        if clave not in self.por_nombre:
+            raise FilaInvalida(f'La categoría {nombre!r} no existe')
+        if self.por_nombre[clave] is None:
+            raise FilaInvalida(f'La categoría {nombre!r} existe en varios tipos: indique tipo')
+        return self.por_nombre[clave]
+
+class ImagenesZip:
+    """Imágenes de un zip por nombre de archivo; cada una se valida y guarda una sola vez"""
+
+    def __init__(self, flujo, temporales, guardar=True):
+        try:
+            self.zip = zipfile.ZipFile(flujo)
+        except (zipfile.BadZipFile, OSError):
+            raise ImportacionInvalida('El archivo de imágenes no es un zip válido')
+        self.temporales = temporales
+        self.guardar = guardar
+        self.miembros = {}
+        for info in self.zip.infolist():
+            nombre = posixpath.basename(info.filename)
+            if info.is_dir() or not nombre or info.filename.startswith('__MACOSX/'):
+                continue
+            self.miembros.setdefault(nombre, info)
+        self.urls = {}
+
+    def url(self, nombre):
+        nombre = posixpath.basename(nombre)
+        if nombre not in self.urls:
+            self.urls[nombre] = self._guardar(nombre)
+        resultado = self.urls[nombre]
+        if isinstance(resultado, FilaInvalida):
+            raise resultado
+        return resultado
+
+    def _guardar(self, nombre):
+        # El error también se recuerda: otra fila con la misma imagen falla igual
+        info = self.miembros.get(nombre)
+        if info is None:
+            return FilaInvalida(f'La imagen {nombre} no está en el zip')
+        if info.file_size > MAX_IMAGEN:
+            return FilaInvalida(f'La imagen {nombre} es demasiado grande')
+        try:
+            with self.zip.open(info) as flujo:
+                imagen = recibir_imagen(flujo, self.temporales)
+        except SubidaRechazada as e:
+            return FilaInvalida(f'{nombre}: {e.mensaje}')
+        except (zipfile.BadZipFile, OSError):
+            return FilaInvalida(f'La imagen {nombre} está dañada en el zip')
+        if imagen is None:
+            return FilaInvalida(f'La imagen {nombre} está vacía')
+        # Al solo validar el temporal se descarta y no llega al almacén
+        return imagen.guardar() if self.guardar else nombre
+
+    def guardadas(self):
+        return sum(1 for url in self.urls.values() if not isinstance(url, FilaInvalida))
+
+    def close(self):
+        self.zip.close()
+
+def _texto(valor):
+    return '' if valor is None else str(valor).strip()
+
+def validar(fila, categorias, imagenes):
+    """Tupla lista para el INSERT, con las mismas reglas que /api/productos; lanza FilaInvalida"""
+    if fila is None:
+        raise FilaInvalida('La línea no es un objeto JSON')
+    nombre = _texto(fila.get('nombre'))
+    if not nombre:
+        raise FilaInvalida('El nombre es requerido')
+    if len(nombre) > MAX_NOMBRE:
+        raise FilaInvalida(f'El nombre supera los {MAX_NOMBRE} caracteres')
+
+    try:
+        precio = float(_texto(fila.get('precio')))
+        if not precio > 0:
+            raise ValueError
+    except ValueError:
+        raise FilaInvalida('El precio debe ser un número válido mayor a 0')
+
+    stock = _texto(fila.get('stock')) or 100
+    try:
+        stock = int(stock)
+        if stock < 0:
+            raise ValueError
+    except ValueError:
+        raise FilaInvalida('El stock debe ser un número válido')
+
+    categoria_id = categorias.resolver(_texto(fila.get('categoria_id')), _texto(fila.get('categoria')),
+                                       _texto(fila.get('tipo')))
+
+    imagen = _texto(fila.get('imagen')) or None
+    if imagen and imagen.startswith('/static/'):
+        ruta = ruta_local(imagen)
+        if ruta is None:
+            raise FilaInvalida(f'La imagen {imagen} no está dentro de /static/')
+        if not os.path.isfile(ruta):
+            raise FilaInvalida(f'La imagen {imagen} no existe')
+    elif imagen:
+        if imagenes is None:
+            raise FilaInvalida(f'La imagen {imagen} requiere el zip de imágenes')
+        imagen = imagenes.url(imagen)
+
+    return (nombre, _texto(fila.get('descripcion')), precio, stock, categoria_id, imagen)
+
+def _insertar(conn, filas):
+    """Insertar un lote en una transacción; devuelve [(id, imagen)] de lo insertado"""
+    def escribir(conn):
+        # Con BEGIN IMMEDIATE nadie más inserta: todo id mayor al máximo es de este lote
+        ultimo = conn.execute('SELECT COALESCE(MAX(id), 0) FROM productos').fetchone()[0]
+        conn.executemany('''
+            INSERT INTO productos (nombre, descripcion, precio, stock, categoria_id, imagen)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', filas)
+        return conn.execute('SELECT id, imagen FROM productos WHERE id > ? ORDER BY id', (ultimo,)).fetchall()
+    return ejecutar_escritura(conn, escribir)
+
+def importar(conn, flujo, formato, imagenes=None, lote=LOTE, solo_validar=False):
+    """Importar productos desde flujo (binario) y devolver el resumen.
+
+    imagenes es un archivo zip (ruta o flujo con seek). Con solo_validar no se
+    inserta ni se guarda nada, pero las imágenes se validan igual.
+    """
+    if formato not in FORMATOS:
+        raise ImportacionInvalida(f"formato debe ser uno de: {', '.join(FORMATOS)}")
+
+    inicio = time.perf_counter()
+    temporales = []
+    zip_imagenes = ImagenesZip(imagenes, temporales, not solo_validar) if imagenes is not None else None
+    categorias = Categorias(conn)
+    filas = importados = 0
+    errores, total_errores = [], 0
+    pendientes, ids = [], []
+
+    def vaciar():
+        if not solo_validar:
+            ids.extend(_insertar(conn, pendientes))
+        pendientes.clear()
+
+    try:
+        for numero, fila in leer_filas(flujo, formato):
+            filas += 1
+            try:
+                pendientes.append(validar(fila, categorias, zip_imagenes))
+            except FilaInvalida as e:
+                total_errores += 1
+                if len(errores) < MAX_ERRORES:
+                    errores.append({'fila': numero, 'error': str(e)})
+                continue
+            if len(pendientes) >= lote:
+                importados += len(pendientes)
+                vaciar()
+        importados += len(pendientes)
+        vaciar()
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportacionInvalida(f'No se pudo leer el archivo después de la fila {filas}: {e}')
+    finally:
+        if zip_imagenes is not None:
+            zip_imagenes.close()
+        for temporal in temporales:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    for producto_id, imagen in ids:
+        encolar_derivados(producto_id, imagen)
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'filas': filas,
+        'importados': 0 if solo_validar else importados,
+        'validos': importados,
+        'errores': errores,
+        'total_errores': total_errores,
+        'imagenes': zip_imagenes.guardadas() if zip_imagenes is not None else 0,
+        'segundos': round(segundos, 3),
+        'filas_por_segundo': round(filas / segundos) if segundos else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Importar productos desde CSV o JSONL')
+    parser.add_argument('archivo', help='productos en CSV (con cabecera) o JSONL')
+    parser.add_argument('--imagenes', help='zip con las imágenes nombradas en la columna imagen')
+    parser.add_argument('--formato', choices=FORMATOS, help='por defecto, según la extensión')
+    parser.add_argument('--lote', type=int, default=LOTE, help='filas por transacción')
+    parser.add_argument('--validar', action='store_true', help='solo validar, sin insertar')
+    args = parser.parse_args()
+
+    formato = args.formato or formato_de(args.archivo)
+    if formato is None:
+        parser.error('no se reconoce el formato: use --formato')
+
+    from migraciones import aplicar_migraciones
+    conn = get_db_connection()
+    aplicar_migraciones(conn)
+    try:
+        with open(args.archivo, 'rb') as flujo:
+            resultado = importar(conn, flujo, formato, args.imagenes, args.lote, args.validar)
+    except ImportacionInvalida as e:
+        parser.exit(1, f'{e}\n')
+    finally:
+        conn.close()
+
+    for error in resultado['errores']:
+        print(f"fila {error['fila']}: {error['error']}")
+    if resultado['total_errores'] > len(resultado['errores']):
+        print(f"... y {resultado['total_errores'] - len(resultado['errores'])} errores más")
+    accion = 'válidas' if args.validar else 'importadas'
+    print(f"{resultado['validos']} de {resultado['filas']} filas {accion} en {resultado['segundos']}s "
+          f"({resultado['filas_por_segundo']} filas/s)")
+
+if __name__ == '__main__':
+    main()
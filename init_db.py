@@ -33,8 +33,7 @@ def populate_database():
         ('Ofertas', 'ofertas')
     ]
     
-    for nombre, tipo in categorias:
-        conn.execute('INSERT INTO categorias (nombre, tipo) VALUES (?, ?)', (nombre, tipo))
+    conn.executemany('INSERT INTO categorias (nombre, tipo) VALUES (?, ?)', categorias)
     
     # Usuario admin
     admin_password = hash_password('admin123')
@@ -120,9 +119,8 @@ def populate_database():
         ('Oferta: Conjunto Niños', 'Conjunto completo para niños', 280.00, 15, '/static/images/productos/ofertas/conjunto1.jpg'),
     ]
     
-    for nombre, descripcion, precio, categoria_id, imagen in productos:
-        conn.execute('''INSERT INTO productos (nombre, descripcion, precio, categoria_id, imagen) 
-                        VALUES (?, ?, ?, ?, ?)''', (nombre, descripcion, precio, categoria_id, imagen))
+    conn.executemany('''INSERT INTO productos (nombre, descripcion, precio, categoria_id, imagen) 
+                        VALUES (?, ?, ?, ?, ?)''', productos)
     
     conn.commit()
     conn.close()
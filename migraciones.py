@@ -0,0 +1,455 @@
+"""Migraciones versionadas del esquema de tienda.db.
+
+Cada migración se aplica una sola vez, dentro de su propia transacción, y queda
+registrada en la tabla schema_migraciones. Reemplaza a los scripts sueltos como
+el antiguo fix_db.py.
+
+    python migraciones.py                    # aplica las pendientes y muestra el estado
+    python migraciones.py --verificar-planes # falla si una consulta crítica hace full scan
+"""
+import argparse
+import sys
+
+from database import get_db_connection, ejecutar_escritura
+import estadisticas
+import estados
+import reportes
+
+def _comentarios_producto_opcional(conn):
+    # Antes hecho a mano con fix_db.py: los comentarios de la tienda no tienen producto
+    columnas = {c['name']: c for c in conn.execute('PRAGMA table_info(comentarios)')}
+    if not columnas['producto_id']['notnull']:
+        return
+    conn.execute('ALTER TABLE comentarios RENAME TO temp_comentarios')
+    conn.execute('''
+        CREATE TABLE comentarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            producto_id INTEGER,
+            calificacion INTEGER CHECK(calificacion >= 1 AND calificacion <= 5),
+            comentario TEXT CHECK(LENGTH(comentario) <= 250),
+            aprobado BOOLEAN DEFAULT 0,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id),
+            FOREIGN KEY (producto_id) REFERENCES productos(id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO comentarios (id, usuario_id, producto_id, calificacion, comentario, aprobado, fecha)
+        SELECT id, usuario_id, producto_id, calificacion, comentario, aprobado, fecha FROM temp_comentarios
+    ''')
+    conn.execute('DROP TABLE temp_comentarios')
+
+def _carrito_unico(conn):
+    # Fusionar duplicados previos (mismo dueño y producto) en la fila más antigua
+    for dueno, filtro in (('usuario_id', 'usuario_id IS NOT NULL'), ('session_id', 'usuario_id IS NULL')):
+        conn.execute(f'''
+            UPDATE carrito SET cantidad = (
+                SELECT SUM(d.cantidad) FROM carrito d
+                WHERE d.{dueno} = carrito.{dueno} AND d.producto_id = carrito.producto_id AND d.{filtro}
+            )
+            WHERE {filtro} AND id IN (
+                SELECT MIN(id) FROM carrito WHERE {filtro}
+                GROUP BY {dueno}, producto_id HAVING COUNT(*) > 1
+            )
+        ''')
+        conn.execute(f'''
+            DELETE FROM carrito
+            WHERE {filtro} AND id NOT IN (
+                SELECT MIN(id) FROM carrito WHERE {filtro} GROUP BY {dueno}, producto_id
+            )
+        ''')
+    # Una línea por producto: del usuario si hay sesión iniciada, si no de la sesión anónima
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS ux_carrito_usuario_producto
+                    ON carrito(usuario_id, producto_id) WHERE usuario_id IS NOT NULL''')
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS ux_carrito_sesion_producto
+                    ON carrito(session_id, producto_id) WHERE usuario_id IS NULL''')
+
+def _agregar_columna(tabla, columna, tipo):
+    # ALTER TABLE ADD COLUMN no admite IF NOT EXISTS
+    def paso(conn):
+        if columna not in {c['name'] for c in conn.execute(f'PRAGMA table_info({tabla})')}:
+            conn.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}')
+    return paso
+
+# Puntaje bayesiano: cada producto arranca con PRIOR_PESO reseñas ficticias de
+# PRIOR_MEDIA estrellas, así una sola reseña de 5 no supera a veinte de 4.6
+PRIOR_PESO = 5
+PRIOR_MEDIA = 3.5
+
+# (versión, descripción, pasos): los pasos son sentencias SQL o funciones que reciben la conexión
+MIGRACIONES = [
+    (1, 'comentarios.producto_id admite NULL (comentarios de la tienda)', _comentarios_producto_opcional),
+    (2, 'Índices secundarios para las consultas frecuentes', [
+        'CREATE INDEX IF NOT EXISTS idx_carrito_sesion ON carrito(session_id, producto_id)',
+        'CREATE INDEX IF NOT EXISTS idx_carrito_usuario ON carrito(usuario_id, producto_id)',
+        'CREATE INDEX IF NOT EXISTS idx_comentarios_producto ON comentarios(producto_id, aprobado, fecha)',
+        'CREATE INDEX IF NOT EXISTS idx_comentarios_aprobado ON comentarios(aprobado, fecha)',
+        'CREATE INDEX IF NOT EXISTS idx_productos_activo_categoria ON productos(activo, categoria_id)',
+        'CREATE INDEX IF NOT EXISTS idx_productos_activo_fecha ON productos(activo, fecha_creacion)',
+        'CREATE INDEX IF NOT EXISTS idx_ordenes_fecha ON ordenes(fecha)',
+        'CREATE INDEX IF NOT EXISTS idx_ordenes_estado_fecha ON ordenes(estado, fecha)',
+        'CREATE INDEX IF NOT EXISTS idx_ordenes_metodo_fecha ON ordenes(metodo_pago, fecha)',
+    ]),
+    (3, 'Contadores de generación del catálogo y reseñas (caché compartida entre workers)', [
+        '''CREATE TABLE IF NOT EXISTS versiones (
+            clave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "INSERT OR IGNORE INTO versiones (clave, valor) VALUES ('catalogo', 1), ('resenas', 1)",
+        # El stock no se muestra en el catálogo: cambiarlo no invalida la caché
+        '''CREATE TRIGGER IF NOT EXISTS trg_catalogo_productos_ins AFTER INSERT ON productos BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_catalogo_productos_upd
+        AFTER UPDATE OF nombre, descripcion, precio, categoria_id, imagen, activo ON productos BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_catalogo_productos_del AFTER DELETE ON productos BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_catalogo_categorias_ins AFTER INSERT ON categorias BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_catalogo_categorias_upd AFTER UPDATE ON categorias BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_catalogo_categorias_del AFTER DELETE ON categorias BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_resenas_ins AFTER INSERT ON comentarios BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'resenas';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_resenas_upd AFTER UPDATE ON comentarios BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'resenas';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_resenas_del AFTER DELETE ON comentarios BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'resenas';
+        END''',
+    ]),
+    (4, 'Índice de texto completo FTS5 para la búsqueda de productos', [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+            nombre, descripcion,
+            content='productos', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_productos_fts_ins AFTER INSERT ON productos BEGIN
+            INSERT INTO productos_fts (rowid, nombre, descripcion) VALUES (NEW.id, NEW.nombre, NEW.descripcion);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_productos_fts_del AFTER DELETE ON productos BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre, descripcion)
+            VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_productos_fts_upd AFTER UPDATE OF nombre, descripcion ON productos BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre, descripcion)
+            VALUES ('delete', OLD.id, OLD.nombre, OLD.descripcion);
+            INSERT INTO productos_fts (rowid, nombre, descripcion) VALUES (NEW.id, NEW.nombre, NEW.descripcion);
+        END''',
+        "INSERT INTO productos_fts (productos_fts) VALUES ('rebuild')",
+    ]),
+    (5, 'Estadísticas materializadas del panel de administración', estadisticas.MIGRACION),
+    (6, 'Una línea de carrito por (dueño, producto)', _carrito_unico),
+    (7, 'Rutas de los derivados de imagen (miniatura, tarjeta, detalle)', [
+        _agregar_columna('productos', 'imagen_derivados', 'TEXT'),
+        # Los derivados llegan después de crear el producto: deben invalidar la caché
+        'DROP TRIGGER IF EXISTS trg_catalogo_productos_upd',
+        '''CREATE TRIGGER trg_catalogo_productos_upd
+        AFTER UPDATE OF nombre, descripcion, precio, categoria_id, imagen, imagen_derivados, activo ON productos BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+    ]),
+    (8, 'Calificación acumulada por producto (suma y cantidad de comentarios aprobados)', [
+        _agregar_columna('productos', 'calificacion_suma', 'INTEGER NOT NULL DEFAULT 0'),
+        _agregar_columna('productos', 'calificacion_cantidad', 'INTEGER NOT NULL DEFAULT 0'),
+        # No están en trg_catalogo_productos_upd: un comentario ya incrementa 'resenas'
+        '''CREATE TRIGGER IF NOT EXISTS trg_calificacion_ins AFTER INSERT ON comentarios
+        WHEN NEW.aprobado = 1 AND NEW.producto_id IS NOT NULL BEGIN
+            UPDATE productos SET calificacion_suma = calificacion_suma + NEW.calificacion,
+                                 calificacion_cantidad = calificacion_cantidad + 1
+            WHERE id = NEW.producto_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_calificacion_upd
+        AFTER UPDATE OF aprobado, calificacion, producto_id ON comentarios BEGIN
+            UPDATE productos SET calificacion_suma = calificacion_suma - OLD.calificacion,
+                                 calificacion_cantidad = calificacion_cantidad - 1
+            WHERE id = OLD.producto_id AND OLD.aprobado = 1;
+            UPDATE productos SET calificacion_suma = calificacion_suma + NEW.calificacion,
+                                 calificacion_cantidad = calificacion_cantidad + 1
+            WHERE id = NEW.producto_id AND NEW.aprobado = 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_calificacion_del AFTER DELETE ON comentarios
+        WHEN OLD.aprobado = 1 AND OLD.producto_id IS NOT NULL BEGIN
+            UPDATE productos SET calificacion_suma = calificacion_suma - OLD.calificacion,
+                                 calificacion_cantidad = calificacion_cantidad - 1
+            WHERE id = OLD.producto_id;
+        END''',
+        '''UPDATE productos SET
+            calificacion_suma = (SELECT COALESCE(SUM(calificacion), 0) FROM comentarios
+                                 WHERE producto_id = productos.id AND aprobado = 1),
+            calificacion_cantidad = (SELECT COUNT(*) FROM comentarios
+                                     WHERE producto_id = productos.id AND aprobado = 1)''',
+    ]),
+    (9, 'Puntaje bayesiano de calificación e índices para ordenar por calificación y popularidad', [
+        # Columna generada VIRTUAL: se calcula al leer y la mantiene el índice, sin triggers extra
+        _agregar_columna('productos', 'calificacion_bayes',
+                         f'REAL GENERATED ALWAYS AS (({PRIOR_PESO} * {PRIOR_MEDIA} + calificacion_suma) '
+                         f'/ ({PRIOR_PESO} + calificacion_cantidad)) VIRTUAL'),
+        'CREATE INDEX IF NOT EXISTS idx_productos_calificacion ON productos(activo, calificacion_bayes DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_productos_popularidad ON productos(activo, calificacion_cantidad DESC)',
+        # La instantánea del catálogo guarda las calificaciones: deben invalidarla
+        'DROP TRIGGER IF EXISTS trg_catalogo_productos_upd',
+        '''CREATE TRIGGER trg_catalogo_productos_upd
+        AFTER UPDATE OF nombre, descripcion, precio, categoria_id, imagen, imagen_derivados, activo,
+                        calificacion_suma, calificacion_cantidad ON productos BEGIN
+            UPDATE versiones SET valor = valor + 1, actualizado = CURRENT_TIMESTAMP WHERE clave = 'catalogo';
+        END''',
+    ]),
+    (10, 'Clave de idempotencia de las órdenes (reenvíos del checkout)', [
+        _agregar_columna('ordenes', 'clave_idempotencia', 'TEXT'),
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_ordenes_clave_idempotencia ON ordenes(clave_idempotencia)
+        WHERE clave_idempotencia IS NOT NULL''',
+    ]),
+    (11, 'Líneas de orden (orden_items) y entrega/facturación en columnas de ordenes', [
+        '''CREATE TABLE IF NOT EXISTS orden_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            orden_id INTEGER NOT NULL REFERENCES ordenes(id) ON DELETE CASCADE,
+            producto_id INTEGER REFERENCES productos(id),
+            producto_nombre TEXT NOT NULL,
+            cantidad INTEGER NOT NULL CHECK(cantidad > 0),
+            precio_unitario REAL NOT NULL,
+            subtotal REAL NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_orden_items_orden ON orden_items(orden_id)',
+        # Cubre "unidades vendidas por producto" sin leer las filas de orden_items
+        'CREATE INDEX IF NOT EXISTS idx_orden_items_producto ON orden_items(producto_id, orden_id, cantidad)',
+        _agregar_columna('ordenes', 'entrega_metodo', 'TEXT'),
+        _agregar_columna('ordenes', 'entrega_direccion', 'TEXT'),
+        _agregar_columna('ordenes', 'entrega_ciudad', 'TEXT'),
+        _agregar_columna('ordenes', 'envio_costo', 'REAL NOT NULL DEFAULT 0'),
+        _agregar_columna('ordenes', 'facturar', 'BOOLEAN NOT NULL DEFAULT 0'),
+        _agregar_columna('ordenes', 'factura_nit', 'TEXT'),
+        _agregar_columna('ordenes', 'factura_ci', 'TEXT'),
+        # Progreso de procesos por lotes (último id procesado); los JSON existentes
+        # los migra pedidos.migrar_detalles() fuera de esta transacción
+        '''CREATE TABLE IF NOT EXISTS marcas_agua (
+            clave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0,
+            actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID''',
+        "INSERT OR IGNORE INTO marcas_agua (clave, valor) VALUES ('orden_items_backfill', 0)",
+    ]),
+    (12, 'Agregados diarios y mensuales de ventas para los reportes', reportes.MIGRACION),
+    (13, 'Historial de cambios de estado de las órdenes', estados.MIGRACION),
+]
+
+def version_actual(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            aplicada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migraciones').fetchone()[0]
+
+def aplicar_migraciones(conn=None):
+    """Aplicar en orden las migraciones pendientes; devuelve las versiones aplicadas"""
+    propia = conn is None
+    if propia:
+        conn = get_db_connection()
+
+    aplicadas = []
+    try:
+        version_actual(conn)
+        for version, descripcion, pasos in MIGRACIONES:
+            def migrar(conn):
+                # Otro worker pudo aplicarla mientras esperábamos el lock
+                if conn.execute('SELECT 1 FROM schema_migraciones WHERE version = ?', (version,)).fetchone():
+                    return False
+                for paso in (pasos if isinstance(pasos, list) else [pasos]):
+                    if callable(paso):
+                        paso(conn)
+                    else:
+                        conn.execute(paso)
+                conn.execute('INSERT INTO schema_migraciones (version, descripcion) VALUES (?, ?)',
+                             (version, descripcion))
+                return True
+
+            if ejecutar_escritura(conn, migrar):
+                aplicadas.append(version)
+    finally:
+        if propia:
+            conn.close()
+    return aplicadas
+
+# ========== PLANES DE CONSULTAS CRÍTICAS ==========
+
+# nombre -> (sql, parámetros de ejemplo, tablas pequeñas en las que se tolera un scan)
+CONSULTAS_CRITICAS = {
+    'catalogo_index': ('''
+        SELECT p.*, c.nombre as categoria_nombre, c.tipo as categoria_tipo
+        FROM productos p
+        JOIN categorias c ON p.categoria_id = c.id
+        WHERE p.activo = 1
+        ORDER BY c.tipo, c.nombre, p.nombre
+    ''', (), ('categorias',)),
+    'productos_relacionados': ('''
+        SELECT * FROM productos
+        WHERE categoria_id = ? AND id != ? AND activo = 1
+        LIMIT 4
+    ''', (1, 1), ()),
+    'comentarios_producto': ('''
+        SELECT c.*, u.nombre as usuario_nombre
+        FROM comentarios c
+        JOIN usuarios u ON c.usuario_id = u.id
+        WHERE c.producto_id = ? AND c.aprobado = 1
+        ORDER BY c.fecha DESC
+    ''', (1,), ()),
+    'comentarios_producto_pagina': ('''
+        SELECT comentarios.*, (SELECT nombre FROM usuarios WHERE id = comentarios.usuario_id) AS usuario_nombre
+        FROM comentarios WHERE producto_id = ? AND aprobado = 1 AND (fecha, id) < (?, ?)
+        ORDER BY fecha DESC, id DESC LIMIT ?
+    ''', (1, '2025-12-31', 1000, 11), ()),
+    'comentarios_propios_pendientes': ('''
+        SELECT * FROM comentarios WHERE producto_id = ? AND aprobado = 0 AND usuario_id = ?
+        ORDER BY fecha DESC
+    ''', (1, 1), ()),
+    'calificacion_producto': ('SELECT calificacion_suma, calificacion_cantidad FROM productos WHERE id = ?', (1,), ()),
+    'comentarios_tienda': ('''
+        SELECT c.*, u.nombre as usuario_nombre
+        FROM comentarios c
+        JOIN usuarios u ON c.usuario_id = u.id
+        WHERE c.aprobado = 1 AND c.producto_id IS NULL
+        ORDER BY c.fecha DESC
+        LIMIT 5
+    ''', (), ()),
+    'comentarios_pendientes': ('SELECT * FROM comentarios WHERE aprobado = 0 ORDER BY fecha DESC', (), ()),
+    'carrito_usuario': ('''
+        SELECT c.*, p.nombre, p.imagen, p.precio as precio_actual
+        FROM carrito c
+        JOIN productos p ON c.producto_id = p.id
+        WHERE c.usuario_id = ?
+        ORDER BY c.fecha DESC
+    ''', (1,), ()),
+    'carrito_sesion': ('''
+        SELECT c.*, p.nombre, p.imagen, p.precio as precio_actual
+        FROM carrito c
+        JOIN productos p ON c.producto_id = p.id
+        WHERE c.session_id = ? AND c.usuario_id IS NULL
+        ORDER BY c.fecha DESC
+    ''', ('x',), ()),
+    'carrito_count_usuario': ('SELECT SUM(cantidad) FROM carrito WHERE usuario_id = ?', (1,), ()),
+    'carrito_count_sesion': ('SELECT SUM(cantidad) FROM carrito WHERE session_id = ? AND usuario_id IS NULL',
+                             ('x',), ()),
+    'productos_recientes': ('SELECT * FROM productos WHERE activo = 1 ORDER BY fecha_creacion DESC', (), ()),
+    'orden_por_clave': ('SELECT * FROM ordenes WHERE clave_idempotencia = ?', ('clave',), ()),
+    'orden_items_orden': ('SELECT * FROM orden_items WHERE orden_id = ? ORDER BY id', (1,), ()),
+    'unidades_vendidas': ('''
+        SELECT i.producto_id, SUM(i.cantidad) AS unidades
+        FROM orden_items i JOIN ordenes o ON o.id = i.orden_id
+        WHERE o.estado != 'cancelado' AND i.producto_id IN (?, ?)
+        GROUP BY i.producto_id
+    ''', (1, 2), ()),
+    'migracion_detalles_lote': ('''
+        SELECT id, detalles FROM ordenes WHERE id > ? AND detalles IS NOT NULL ORDER BY id LIMIT ?
+    ''', (0, 500), ()),
+    'reporte_ventas_diarias': ('''
+        SELECT dia AS clave, ordenes, unidades, ingresos FROM ventas_diarias
+        WHERE dia BETWEEN ? AND ? AND tipo = ?
+    ''', ('2025-01-01', '2025-01-31', ''), ()),
+    'reporte_ventas_mensuales': ('''
+        SELECT metodo_pago AS clave, ordenes, unidades, ingresos FROM ventas_mensuales
+        WHERE mes BETWEEN ? AND ? AND tipo = ? AND estado = ?
+    ''', ('2025-01', '2025-12', '', 'pagado'), ()),
+    'reportes_recalcular_dia': ('''
+        SELECT COUNT(*) FROM ordenes o WHERE o.fecha >= ? AND o.fecha < ? AND o.id <= ?
+    ''', ('2025-01-01', '2025-01-02', 1000), ()),
+    'exportar_ordenes': ('SELECT * FROM ordenes WHERE estado = ? AND fecha >= ? ORDER BY fecha, id',
+                         ('pendiente', '2025-01-01'), ()),
+    'exportar_orden_items': ('''
+        SELECT i.* FROM ordenes o JOIN orden_items i ON i.orden_id = o.id
+        WHERE fecha >= ? ORDER BY o.fecha, o.id, i.id
+    ''', ('2025-01-01',), ()),
+    'cambio_estado_ids': ('SELECT id, estado FROM ordenes WHERE id IN (?, ?, ?)', (1, 2, 3), ()),
+    'cambio_estado_filtro': ('SELECT id, estado FROM ordenes WHERE (estado = ? OR estado IS NULL)',
+                             ('pendiente',), ()),
+    'historial_orden': ('SELECT * FROM ordenes_historial WHERE orden_id = ? ORDER BY id', (1,), ()),
+    'ordenes_recientes': ('SELECT * FROM ordenes ORDER BY fecha DESC LIMIT 5', (), ()),
+    'ordenes_por_estado': ('SELECT * FROM ordenes WHERE estado = ? ORDER BY fecha DESC', ('pendiente',), ()),
+    'ordenes_por_metodo': ('SELECT * FROM ordenes WHERE metodo_pago = ? ORDER BY fecha DESC', ('qr_simple',), ()),
+    'ordenes_por_fecha': ('SELECT * FROM ordenes WHERE fecha >= ? AND fecha <= ? ORDER BY fecha DESC',
+                          ('2025-01-01', '2025-12-31'), ()),
+    'productos_pagina_keyset': ('''
+        SELECT * FROM productos WHERE activo = 1 AND (fecha_creacion, id) < (?, ?)
+        ORDER BY fecha_creacion DESC, id DESC LIMIT ?
+    ''', ('2025-12-31', 1000, 51), ()),
+    'ordenes_pagina_keyset': ('''
+        SELECT * FROM ordenes WHERE estado = ? AND (fecha, id) < (?, ?)
+        ORDER BY fecha DESC, id DESC LIMIT ?
+    ''', ('pendiente', '2025-12-31', 1000, 51), ()),
+    'estadisticas_panel': ('''
+        SELECT clave, dimension, valor FROM estadisticas
+        WHERE clave IN ('productos_activos', 'comentarios_pendientes', 'ordenes_estado', 'ordenes_metodo')
+           OR (clave = 'ingresos_dia' AND dimension = ?)
+    ''', ('2025-01-01',), ()),
+    'productos_mejor_calificados': ('''
+        SELECT * FROM productos WHERE activo = 1 ORDER BY calificacion_bayes DESC LIMIT ?
+    ''', (24,), ()),
+    'productos_populares': ('''
+        SELECT * FROM productos WHERE activo = 1 ORDER BY calificacion_cantidad DESC LIMIT ?
+    ''', (24,), ()),
+    'login_usuario': ('SELECT * FROM usuarios WHERE correo = ?', ('admin@tienda.com',), ()),
+}
+
+def verificar_planes(conn, consultas=None):
+    """Devolver [(nombre, detalle)] de las consultas cuyo plan hace un full table scan"""
+    consultas = CONSULTAS_CRITICAS if consultas is None else consultas
+    fallas = []
+    for nombre, (sql, params, permitidas) in consultas.items():
+        for fila in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+            detalle = fila[3]
+            # "SCAN t" sin "USING ... INDEX" recorre la tabla completa
+            if detalle.startswith('SCAN ') and ' USING ' not in detalle:
+                tabla = detalle.split()[1]
+                if not _tabla_permitida(sql, tabla, permitidas):
+                    fallas.append((nombre, detalle))
+    return fallas
+
+def _tabla_permitida(sql, tabla, permitidas):
+    if tabla in permitidas:
+        return True
+    # Resolver alias ("categorias c") contra las tablas permitidas
+    tokens = sql.replace(',', ' ').split()
+    for i, token in enumerate(tokens[:-1]):
+        if tokens[i + 1] == tabla and token in permitidas:
+            return True
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description='Migraciones del esquema de tienda.db')
+    parser.add_argument('--verificar-planes', action='store_true',
+                        help='fallar si alguna consulta crítica hace un full table scan')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    aplicadas = aplicar_migraciones(conn)
+    for version in aplicadas:
+        print(f'Migración {version} aplicada')
+    print(f'Esquema en versión {version_actual(conn)}')
+
+    if args.verificar_planes:
+        fallas = verificar_planes(conn)
+        conn.close()
+        for nombre, detalle in fallas:
+            print(f'FULL SCAN en {nombre}: {detalle}')
+        if fallas:
+            sys.exit(1)
+        print(f'{len(CONSULTAS_CRITICAS)} consultas críticas usan índices')
+        return
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Paginación por cursor (keyset) para los listados grandes.
+
+En lugar de OFFSET, cada página continúa desde la última fila vista usando
+(fecha, id) como clave: el costo de una página es constante sin importar en qué
+parte de la tabla esté, y no se cargan más que `tamano` filas en memoria.
+"""
+import base64
+import json
+
+TAMANO_PAGINA = 50
+TAMANO_MAXIMO = 200
+
+def codificar_cursor(fecha, id_fila):
+    datos = json.dumps([fecha, id_fila], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(datos).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor):
+    """(fecha, id) a partir del cursor, o None si viene vacío o alterado"""
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        fecha, id_fila = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return str(fecha), int(id_fila)
+    except (ValueError, TypeError):
+        return None
+
+def tamano_pagina(valor, por_defecto=TAMANO_PAGINA):
+    try:
+        return max(1, min(int(valor), TAMANO_MAXIMO))
+    except (TypeError, ValueError):
+        return por_defecto
+
+def pagina_keyset(conn, tabla, columna_fecha, condiciones=(), params=(), cursor=None,
+                  tamano=TAMANO_PAGINA, columnas='*'):
+    """Una página de `tabla` ordenada por (columna_fecha, id) descendente.
+
+    Devuelve (filas, cursor de la página siguiente o None si es la última).
+    """
+    condiciones = list(condiciones)
+    params = list(params)
+    posicion = decodificar_cursor(cursor)
+    if posicion:
+        condiciones.append(f'({columna_fecha}, id) < (?, ?)')
+        params.extend(posicion)
+
+    where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ''
+    filas = conn.execute(f'''
+        SELECT {columnas} FROM {tabla}{where}
+        ORDER BY {columna_fecha} DESC, id DESC
+        LIMIT ?
+    ''', params + [tamano + 1]).fetchall()
+
+    siguiente = None
+    if len(filas) > tamano:
+        filas = filas[:tamano]
+        siguiente = codificar_cursor(filas[-1][columna_fecha], filas[-1]['id'])
+    return filas, siguiente
@@ -0,0 +1,324 @@
+"""Registro de pedidos: descuento de stock, orden y vaciado del carrito en una transacción.
+
+Todo ocurre dentro de un BEGIN IMMEDIATE, así que dos compradores no pueden
+intercalar sus lecturas y escrituras: el stock se descuenta con
+UPDATE ... WHERE stock >= cantidad y, si alguna línea no alcanza, se hace
+rollback completo (no queda stock descontado ni orden a medias).
+
+La clave de idempotencia viene del formulario de checkout (o del encabezado
+Idempotency-Key): si el navegador envía dos veces el mismo pedido, el segundo
+intento encuentra la orden ya registrada y la devuelve en lugar de crear otra.
+
+Las líneas van a orden_items y la entrega/facturación a columnas de ordenes
+(migración 11). Las órdenes anteriores guardaban todo en el JSON
+ordenes.detalles; migrar_detalles() las pasa al esquema nuevo por lotes:
+
+    python pedidos.py --migrar-detalles [--lote 500]
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+
+from database import ejecutar_escritura, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+ENVIO_COSTO = 20.0
+LOTE_MIGRACION = 500
+MARCA_MIGRACION = 'orden_items_backfill'
+
+class CarritoVacio(Exception):
+    """No hay líneas en el carrito al momento de confirmar"""
+
+class StockInsuficiente(Exception):
+    """Alguna línea del carrito pide más unidades de las disponibles"""
+
+    def __init__(self, productos):
+        super().__init__(', '.join(productos))
+        self.productos = productos
+
+class ClaveEnUso(Exception):
+    """La clave de idempotencia pertenece a una orden de otro usuario"""
+
+def _lineas_carrito(conn, usuario_id, session_id):
+    if usuario_id:
+        return conn.execute('''
+            SELECT c.producto_id, c.cantidad, c.precio_unitario, p.nombre
+            FROM carrito c JOIN productos p ON c.producto_id = p.id
+            WHERE c.usuario_id = ?
+        ''', (usuario_id,)).fetchall()
+    return conn.execute('''
+        SELECT c.producto_id, c.cantidad, c.precio_unitario, p.nombre
+        FROM carrito c JOIN productos p ON c.producto_id = p.id
+        WHERE c.session_id = ? AND c.usuario_id IS NULL
+    ''', (session_id,)).fetchall()
+
+def detalles_orden(conn, orden):
+    """Items, entrega y facturación de una orden con la forma del antiguo JSON detalles"""
+    items = conn.execute('''
+        SELECT producto_id, producto_nombre, cantidad, precio_unitario, subtotal
+        FROM orden_items WHERE orden_id = ? ORDER BY id
+    ''', (orden['id'],)).fetchall()
+    if not items and orden['detalles']:
+        # Orden anterior a orden_items que migrar_detalles() todavía no procesó
+        detalles = json.loads(orden['detalles'])
+        return {'items': detalles} if isinstance(detalles, list) else detalles
+    return {
+        'items': [{'producto_id': item['producto_id'], 'producto': item['producto_nombre'],
+                   'cantidad': item['cantidad'], 'precio_unitario': item['precio_unitario'],
+                   'subtotal': item['subtotal']} for item in items],
+        'entrega': {'metodo': orden['entrega_metodo'], 'direccion': orden['entrega_direccion'],
+                    'ciudad': orden['entrega_ciudad'], 'costo': orden['envio_costo']},
+        'facturacion': ({'facturar': True, 'nit': orden['factura_nit'], 'ci': orden['factura_ci']}
+                        if orden['facturar'] else None),
+    }
+
+def _orden_existente(conn, clave, usuario_id):
+    fila = conn.execute('SELECT * FROM ordenes WHERE clave_idempotencia = ?', (clave,)).fetchone()
+    if fila is None:
+        return None
+    if fila['usuario_id'] != usuario_id:
+        raise ClaveEnUso(clave)
+    # total es DECIMAL: SQLite lo devuelve entero si no tiene decimales
+    return dict(fila, total=float(fila['total']), detalles=detalles_orden(conn, fila), repetida=True)
+
+def registrar_pedido(conn, usuario_id, session_id, cliente, entrega, facturacion, clave=None):
+    """Confirmar el carrito como orden y devolver la orden (dict).
+
+    cliente: {'nombre', 'telefono', 'metodo_pago'}; entrega: {'metodo',
+    'direccion', 'ciudad'}; facturacion: {'nit', 'ci'} o None. La orden
+    devuelta trae 'repetida' en True si la clave ya se había usado.
+    Lanza CarritoVacio, StockInsuficiente o ClaveEnUso.
+    """
+    def escribir(conn):
+        if clave:
+            existente = _orden_existente(conn, clave, usuario_id)
+            if existente:
+                return existente
+
+        lineas = _lineas_carrito(conn, usuario_id, session_id)
+        if not lineas:
+            raise CarritoVacio()
+
+        # Descuento condicional: si otro comprador se llevó las unidades, rowcount es 0
+        agotados = []
+        for linea in lineas:
+            descontado = conn.execute('''
+                UPDATE productos SET stock = stock - ?
+                WHERE id = ? AND activo = 1 AND stock >= ?
+            ''', (linea['cantidad'], linea['producto_id'], linea['cantidad'])).rowcount
+            if not descontado:
+                agotados.append(linea['nombre'])
+        if agotados:
+            # La excepción hace rollback de los descuentos ya aplicados
+            raise StockInsuficiente(agotados)
+
+        envio_costo = ENVIO_COSTO if entrega['metodo'] == 'envio' else 0.0
+        items = [{'producto_id': linea['producto_id'], 'producto': linea['nombre'],
+                  'cantidad': linea['cantidad'],
+                  'precio_unitario': float(linea['precio_unitario']),
+                  'subtotal': float(linea['precio_unitario'] * linea['cantidad'])}
+                 for linea in lineas]
+        total = sum(item['subtotal'] for item in items) + envio_costo
+        factura = facturacion or {}
+
+        orden_id = conn.execute('''
+            INSERT INTO ordenes (usuario_id, nombre_cliente, telefono_cliente, total, metodo_pago, estado,
+                                 clave_idempotencia, entrega_metodo, entrega_direccion, entrega_ciudad,
+                                 envio_costo, facturar, factura_nit, factura_ci)
+            VALUES (?, ?, ?, ?, ?, 'pendiente', ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (usuario_id, cliente['nombre'], cliente['telefono'], total, cliente['metodo_pago'], clave,
+              entrega['metodo'], entrega['direccion'], entrega['ciudad'], envio_costo,
+              bool(factura), factura.get('nit'), factura.get('ci'))).lastrowid
+        conn.executemany('''
+            INSERT INTO orden_items (orden_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(orden_id, item['producto_id'], item['producto'], item['cantidad'],
+               item['precio_unitario'], item['subtotal']) for item in items])
+
+        if usuario_id:
+            conn.execute('DELETE FROM carrito WHERE usuario_id = ?', (usuario_id,))
+        else:
+            conn.execute('DELETE FROM carrito WHERE session_id = ? AND usuario_id IS NULL', (session_id,))
+
+        detalles = {
+            'items': items,
+            'entrega': dict(entrega, costo=envio_costo),
+            'facturacion': dict(facturacion, facturar=True) if facturacion else None,
+        }
+        return {'id': orden_id, 'usuario_id': usuario_id, 'nombre_cliente': cliente['nombre'],
+                'telefono_cliente': cliente['telefono'], 'total': total,
+                'metodo_pago': cliente['metodo_pago'], 'estado': 'pendiente',
+                'detalles': detalles, 'repetida': False}
+
+    return ejecutar_escritura(conn, escribir)
+
+def unidades_vendidas(conn, producto_ids=None):
+    """{producto_id: unidades} de las órdenes no canceladas (índice de orden_items por producto)"""
+    sql = '''
+        SELECT i.producto_id, SUM(i.cantidad) AS unidades
+        FROM orden_items i JOIN ordenes o ON o.id = i.orden_id
+        WHERE o.estado != 'cancelado' {filtro}
+        GROUP BY i.producto_id
+    '''
+    if producto_ids is None:
+        filas = conn.execute(sql.format(filtro='AND i.producto_id IS NOT NULL'))
+    else:
+        producto_ids = list(producto_ids)
+        if not producto_ids:
+            return {}
+        filtro = f"AND i.producto_id IN ({','.join('?' * len(producto_ids))})"
+        filas = conn.execute(sql.format(filtro=filtro), producto_ids)
+    return {fila['producto_id']: fila['unidades'] for fila in filas}
+
+# ========== MIGRACIÓN DE ordenes.detalles ==========
+
+def _numero(valor, tipo):
+    """valor convertido con tipo (int o float), o None si no es un número"""
+    try:
+        return tipo(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _estructurar(orden_id, detalles, productos):
+    """Filas de orden_items y columnas de la orden a partir del JSON detalles.
+
+    Los items sin cantidad positiva o con cantidad/precio no numéricos se
+    omiten con un aviso: orden_items exige cantidad > 0 y un item inválido no
+    puede hacer fallar el lote entero (se reintentaría para siempre).
+    """
+    if isinstance(detalles, list):
+        # Formato más antiguo: solo la lista de items
+        detalles = {'items': detalles}
+    if not isinstance(detalles, dict):
+        logger.warning('Orden %d: detalles no tiene un formato conocido, se omite', orden_id)
+        return [], None
+    items = []
+    for item in detalles.get('items') or []:
+        if not isinstance(item, dict):
+            logger.warning('Orden %d: item inválido %r, se omite', orden_id, item)
+            continue
+        nombre = item.get('producto') or ''
+        cantidad = _numero(item.get('cantidad'), int)
+        precio = _numero(item.get('precio_unitario') or 0, float)
+        if not cantidad or cantidad < 0 or precio is None:
+            logger.warning('Orden %d: item %r sin cantidad o precio válidos, se omite', orden_id, nombre)
+            continue
+        subtotal = _numero(item.get('subtotal', precio * cantidad), float)
+        # Los blobs antiguos solo guardaban el nombre del producto
+        items.append((orden_id, item.get('producto_id') or productos.get(nombre), nombre, cantidad, precio,
+                      precio * cantidad if subtotal is None else subtotal))
+    entrega = detalles.get('entrega') or {}
+    facturacion = detalles.get('facturacion') or {}
+    if not isinstance(entrega, dict):
+        entrega = {}
+    if not isinstance(facturacion, dict):
+        facturacion = {}
+    columnas = (entrega.get('metodo'), entrega.get('direccion'), entrega.get('ciudad'),
+                _numero(entrega.get('costo') or 0, float) or 0.0, bool(facturacion.get('facturar')),
+                facturacion.get('nit'), facturacion.get('ci'), orden_id)
+    return items, columnas
+
+def migrar_detalles(conn, lote=LOTE_MIGRACION, pausa=0.05):
+    """Pasar los JSON de ordenes.detalles a orden_items y columnas; devuelve las órdenes migradas.
+
+    Avanza por id en lotes, cada uno en su propia transacción corta (las
+    escrituras de la tienda se intercalan entre lotes). La marca en
+    marcas_agua avanza con cada lote, así que se puede interrumpir y retomar,
+    y varios workers pueden ejecutarla a la vez sin duplicar líneas. El JSON
+    original se conserva.
+    """
+    productos = {}
+    for fila in conn.execute('SELECT id, nombre FROM productos ORDER BY id DESC'):
+        productos[fila['nombre']] = fila['id']
+
+    def migrar_lote(conn):
+        desde = conn.execute('SELECT valor FROM marcas_agua WHERE clave = ?', (MARCA_MIGRACION,)).fetchone()[0]
+        filas = conn.execute('''
+            SELECT id, detalles FROM ordenes WHERE id > ? AND detalles IS NOT NULL ORDER BY id LIMIT ?
+        ''', (desde, lote)).fetchall()
+        if not filas:
+            return 0
+        items, columnas = [], []
+        for fila in filas:
+            try:
+                detalles = json.loads(fila['detalles']) or {}
+            except ValueError:
+                logger.warning('Orden %d: detalles no es JSON válido, se omite', fila['id'])
+                continue
+            lineas, orden = _estructurar(fila['id'], detalles, productos)
+            items += lineas
+            if orden is not None:
+                columnas.append(orden)
+        conn.executemany('''
+            INSERT INTO orden_items (orden_id, producto_id, producto_nombre, cantidad, precio_unitario, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', items)
+        conn.executemany('''
+            UPDATE ordenes SET entrega_metodo = ?, entrega_direccion = ?, entrega_ciudad = ?, envio_costo = ?,
+                               facturar = ?, factura_nit = ?, factura_ci = ?
+            WHERE id = ?
+        ''', columnas)
+        conn.execute('UPDATE marcas_agua SET valor = ?, actualizado = CURRENT_TIMESTAMP WHERE clave = ?',
+                     (filas[-1]['id'], MARCA_MIGRACION))
+        return len(filas)
+
+    migradas = 0
+    while True:
+        cantidad = ejecutar_escritura(conn, migrar_lote)
+        if not cantidad:
+            return migradas
+        migradas += cantidad
+        time.sleep(pausa)
+
+def detalles_pendientes(conn):
+    return conn.execute('''
+        SELECT COUNT(*) FROM ordenes
+        WHERE id > (SELECT valor FROM marcas_agua WHERE clave = ?) AND detalles IS NOT NULL
+    ''', (MARCA_MIGRACION,)).fetchone()[0]
+
+def _migrar_en_segundo_plano():
+    conn = get_db_connection()
+    try:
+        migradas = migrar_detalles(conn)
+        if migradas:
+            logger.info('%d órdenes migradas a orden_items', migradas)
+    except Exception:
+        logger.exception('No se pudo migrar ordenes.detalles a orden_items')
+    finally:
+        conn.close()
+
+def iniciar_migracion_detalles():
+    """Al arrancar el worker: migrar en un hilo las órdenes pendientes, sin demorar el arranque"""
+    conn = get_db_connection()
+    try:
+        pendientes = detalles_pendientes(conn)
+    finally:
+        conn.close()
+    if pendientes:
+        threading.Thread(target=_migrar_en_segundo_plano, name='migracion-detalles', daemon=True).start()
+    return pendientes
+
+def main():
+    parser = argparse.ArgumentParser(description='Pedidos de la tienda')
+    parser.add_argument('--migrar-detalles', action='store_true',
+                        help='pasar los JSON de ordenes.detalles a orden_items')
+    parser.add_argument('--lote', type=int, default=LOTE_MIGRACION)
+    args = parser.parse_args()
+    if not args.migrar_detalles:
+        parser.print_help()
+        return
+
+    from migraciones import aplicar_migraciones
+    conn = get_db_connection()
+    aplicar_migraciones(conn)
+    print(f'{detalles_pendientes(conn)} órdenes pendientes')
+    inicio = time.perf_counter()
+    migradas = migrar_detalles(conn, lote=args.lote)
+    print(f'{migradas} órdenes migradas en {time.perf_counter() - inicio:.2f}s')
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""Reportes de ventas sobre agregados diarios y mensuales.
+
+Las tablas ventas_diarias y ventas_mensuales (migración 12) guardan, por
+período, tipo de categoría, método de pago y estado:
+
+    ordenes    órdenes (en una fila de tipo, las que tienen algún producto de ese tipo)
+    unidades   unidades vendidas
+    ingresos   en tipo '' el total de las órdenes (con envío); por tipo, la suma de sus líneas
+
+La fila de tipo '' es la orden completa: sumar los tipos contaría dos veces
+una orden con productos de varias categorías.
+
+acumular() incorpora las órdenes nuevas a partir de la marca de agua
+'reportes_rollup' (último ordenes.id acumulado) en lotes cortos. Los cambios
+de estado, método, total o fecha de órdenes ya acumuladas marcan el día en
+ventas_pendientes (triggers) y acumular() recalcula esos días. Así un reporte
+de un año lee unas decenas de filas en lugar de recorrer ordenes y orden_items.
+En la app, iniciar_acumulacion() lo hace en un hilo al arrancar y cuando un
+reporte encuentra órdenes sin acumular.
+
+    python reportes.py                  # acumula lo pendiente
+    python reportes.py --reconstruir    # recalcula todo desde cero
+"""
+import argparse
+import calendar
+import logging
+import threading
+import time
+from datetime import date, timedelta
+
+from database import ejecutar_escritura, get_db_connection
+from pedidos import detalles_pendientes, migrar_detalles
+
+logger = logging.getLogger(__name__)
+
+MARCA = 'reportes_rollup'
+LOTE_ORDENES = 5000
+LOTE_DIAS = 31
+SIN_CATEGORIA = 'sin_categoria'
+AGRUPACIONES = ('dia', 'mes', 'tipo', 'metodo_pago', 'estado')
+
+class ReporteInvalido(ValueError):
+    """Parámetros del reporte fuera de rango o mal formados"""
+
+def _marcar_dia(fecha):
+    return f"INSERT OR IGNORE INTO ventas_pendientes (dia) VALUES (date({fecha}));"
+
+_ACUMULADA = f"(SELECT valor FROM marcas_agua WHERE clave = '{MARCA}')"
+
+# Pasos de la migración 12
+MIGRACION = [
+    '''CREATE TABLE IF NOT EXISTS ventas_diarias (
+        dia TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        metodo_pago TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        ordenes INTEGER NOT NULL DEFAULT 0,
+        unidades INTEGER NOT NULL DEFAULT 0,
+        ingresos REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (tipo, dia, metodo_pago, estado)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS ventas_mensuales (
+        mes TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        metodo_pago TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        ordenes INTEGER NOT NULL DEFAULT 0,
+        unidades INTEGER NOT NULL DEFAULT 0,
+        ingresos REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (tipo, mes, metodo_pago, estado)
+    ) WITHOUT ROWID''',
+    # La clave empieza por tipo (los reportes filtran tipo = '' y un rango de fechas);
+    # recalcular un día o un mes busca por fecha
+    'CREATE INDEX IF NOT EXISTS idx_ventas_diarias_dia ON ventas_diarias(dia)',
+    'CREATE INDEX IF NOT EXISTS idx_ventas_mensuales_mes ON ventas_mensuales(mes)',
+    'CREATE TABLE IF NOT EXISTS ventas_pendientes (dia TEXT PRIMARY KEY) WITHOUT ROWID',
+    f"INSERT OR IGNORE INTO marcas_agua (clave, valor) VALUES ('{MARCA}', 0)",
+    # Solo las órdenes ya acumuladas: las nuevas las toma acumular() con sus valores finales
+    f'''CREATE TRIGGER IF NOT EXISTS trg_ventas_ordenes_upd
+    AFTER UPDATE OF estado, metodo_pago, total, fecha ON ordenes WHEN OLD.id <= {_ACUMULADA} BEGIN
+        {_marcar_dia('OLD.fecha')}
+        {_marcar_dia('NEW.fecha')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_ventas_ordenes_del AFTER DELETE ON ordenes
+    WHEN OLD.id <= {_ACUMULADA} BEGIN
+        {_marcar_dia('OLD.fecha')}
+    END''',
+    # Líneas que llegan después de acumular la orden (migración de ordenes.detalles)
+    f'''CREATE TRIGGER IF NOT EXISTS trg_ventas_items_ins AFTER INSERT ON orden_items
+    WHEN NEW.orden_id <= {_ACUMULADA} BEGIN
+        {_marcar_dia('(SELECT fecha FROM ordenes WHERE id = NEW.orden_id)')}
+    END''',
+]
+
+# ========== ACUMULACIÓN ==========
+
+def _sumar_ordenes(conn, tabla, periodo, filtro, params):
+    """Sumar a tabla las órdenes que cumplen filtro (alias o), agrupadas por periodo"""
+    columna = 'dia' if tabla == 'ventas_diarias' else 'mes'
+    conflicto = f'''ON CONFLICT (tipo, {columna}, metodo_pago, estado) DO UPDATE SET
+            ordenes = ordenes + excluded.ordenes, unidades = unidades + excluded.unidades,
+            ingresos = ingresos + excluded.ingresos'''
+    conn.execute(f'''
+        INSERT INTO {tabla} ({columna}, tipo, metodo_pago, estado, ordenes, unidades, ingresos)
+        SELECT {periodo}, '', COALESCE(o.metodo_pago, ''), COALESCE(o.estado, ''), COUNT(*),
+               SUM((SELECT COALESCE(SUM(cantidad), 0) FROM orden_items WHERE orden_id = o.id)), SUM(o.total)
+        FROM ordenes o
+        WHERE {filtro}
+        GROUP BY 1, 3, 4
+        {conflicto}
+    ''', params)
+    conn.execute(f'''
+        INSERT INTO {tabla} ({columna}, tipo, metodo_pago, estado, ordenes, unidades, ingresos)
+        SELECT {periodo}, COALESCE(c.tipo, '{SIN_CATEGORIA}'), COALESCE(o.metodo_pago, ''),
+               COALESCE(o.estado, ''), COUNT(DISTINCT o.id), SUM(i.cantidad), SUM(i.subtotal)
+        FROM ordenes o
+        JOIN orden_items i ON i.orden_id = o.id
+        LEFT JOIN productos p ON p.id = i.producto_id
+        LEFT JOIN categorias c ON c.id = p.categoria_id
+        WHERE {filtro}
+        GROUP BY 1, 2, 3, 4
+        {conflicto}
+    ''', params)
+
+def _acumular_lote(conn, lote):
+    desde = conn.execute('SELECT valor FROM marcas_agua WHERE clave = ?', (MARCA,)).fetchone()[0]
+    hasta = conn.execute('SELECT MAX(id) FROM (SELECT id FROM ordenes WHERE id > ? ORDER BY id LIMIT ?)',
+                         (desde, lote)).fetchone()[0]
+    if hasta is None:
+        return 0
+    rango = (desde, hasta)
+    _sumar_ordenes(conn, 'ventas_diarias', 'date(o.fecha)', 'o.id > ? AND o.id <= ?', rango)
+    _sumar_ordenes(conn, 'ventas_mensuales', "strftime('%Y-%m', o.fecha)", 'o.id > ? AND o.id <= ?', rango)
+    conn.execute('UPDATE marcas_agua SET valor = ?, actualizado = CURRENT_TIMESTAMP WHERE clave = ?',
+                 (hasta, MARCA))
+    return conn.execute('SELECT COUNT(*) FROM ordenes WHERE id > ? AND id <= ?', rango).fetchone()[0]
+
+def _recalcular_dias(conn, lote):
+    """Rehacer los días marcados en ventas_pendientes y los meses que los contienen"""
+    dias = [fila[0] for fila in conn.execute('SELECT dia FROM ventas_pendientes ORDER BY dia LIMIT ?', (lote,))]
+    if not dias:
+        return 0
+    acumulada = conn.execute('SELECT valor FROM marcas_agua WHERE clave = ?', (MARCA,)).fetchone()[0]
+    for dia in dias:
+        siguiente = (date.fromisoformat(dia) + timedelta(days=1)).isoformat()
+        conn.execute('DELETE FROM ventas_diarias WHERE dia = ?', (dia,))
+        # ordenes.fecha es 'YYYY-MM-DD HH:MM:SS': el rango usa idx_ordenes_fecha
+        _sumar_ordenes(conn, 'ventas_diarias', 'date(o.fecha)', 'o.fecha >= ? AND o.fecha < ? AND o.id <= ?',
+                       (dia, siguiente, acumulada))
+    for mes in sorted({dia[:7] for dia in dias}):
+        conn.execute('DELETE FROM ventas_mensuales WHERE mes = ?', (mes,))
+        conn.execute('''
+            INSERT INTO ventas_mensuales (mes, tipo, metodo_pago, estado, ordenes, unidades, ingresos)
+            SELECT ?, tipo, metodo_pago, estado, SUM(ordenes), SUM(unidades), SUM(ingresos)
+            FROM ventas_diarias WHERE dia BETWEEN ? AND ?
+            GROUP BY tipo, metodo_pago, estado
+        ''', (mes, f'{mes}-01', f'{mes}-31'))
+    conn.executemany('DELETE FROM ventas_pendientes WHERE dia = ?', [(dia,) for dia in dias])
+    return len(dias)
+
+def pendiente(conn):
+    """True si hay órdenes sin acumular o días por recalcular"""
+    return bool(conn.execute(f'''
+        SELECT COALESCE((SELECT MAX(id) FROM ordenes), 0) > {_ACUMULADA}
+            OR EXISTS (SELECT 1 FROM ventas_pendientes)
+    ''').fetchone()[0])
+
+def acumular(conn, lote=LOTE_ORDENES):
+    """Incorporar las órdenes nuevas y recalcular los días marcados; devuelve (órdenes, días).
+
+    Cada lote es una transacción corta, así que se puede ejecutar con la
+    tienda en marcha y desde varios procesos a la vez.
+    """
+    if detalles_pendientes(conn):
+        # Sin sus líneas en orden_items las órdenes antiguas no aportarían unidades ni tipos
+        migrar_detalles(conn)
+    ordenes = dias = 0
+    while True:
+        cantidad = ejecutar_escritura(conn, lambda conn: _acumular_lote(conn, lote))
+        if not cantidad:
+            break
+        ordenes += cantidad
+    while True:
+        cantidad = ejecutar_escritura(conn, lambda conn: _recalcular_dias(conn, LOTE_DIAS))
+        if not cantidad:
+            break
+        dias += cantidad
+    return ordenes, dias
+
+_hilo = None
+_lock = threading.Lock()
+
+def _acumular_en_segundo_plano():
+    conn = get_db_connection()
+    try:
+        ordenes, dias = acumular(conn)
+        if ordenes or dias:
+            logger.info('%d órdenes acumuladas y %d días recalculados para los reportes', ordenes, dias)
+    except Exception:
+        logger.exception('No se pudieron acumular los agregados de ventas')
+    finally:
+        conn.close()
+
+def iniciar_acumulacion(conn=None):
+    """Acumular lo pendiente en un hilo (uno por worker a la vez); devuelve True si había algo pendiente.
+
+    La primera acumulación de un historial grande tarda minutos: no puede
+    correr dentro de una petición (timeout del worker, locks de escritura).
+    """
+    global _hilo
+    propia = conn is None
+    if propia:
+        conn = get_db_connection()
+    try:
+        hay = pendiente(conn)
+    finally:
+        if propia:
+            conn.close()
+    if hay:
+        with _lock:
+            # Los hilos no sobreviven a un fork: en el hijo is_alive() es False
+            if _hilo is None or not _hilo.is_alive():
+                _hilo = threading.Thread(target=_acumular_en_segundo_plano, name='acumular-reportes', daemon=True)
+                _hilo.start()
+    return hay
+
+def reconstruir(conn):
+    """Vaciar los agregados y acumular todas las órdenes desde cero"""
+    def vaciar(conn):
+        for tabla in ('ventas_diarias', 'ventas_mensuales', 'ventas_pendientes'):
+            conn.execute(f'DELETE FROM {tabla}')
+        conn.execute('UPDATE marcas_agua SET valor = 0, actualizado = CURRENT_TIMESTAMP WHERE clave = ?', (MARCA,))
+
+    ejecutar_escritura(conn, vaciar)
+    return acumular(conn)
+
+# ========== CONSULTA ==========
+
+def _fecha(valor, nombre):
+    try:
+        return date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise ReporteInvalido(f'{nombre} debe tener el formato YYYY-MM-DD')
+
+def _segmentos(desde, hasta):
+    """Partir [desde, hasta] en días sueltos de los bordes y meses completos"""
+    segmentos = []
+    inicio = desde
+    while inicio <= hasta:
+        fin_mes = inicio.replace(day=calendar.monthrange(inicio.year, inicio.month)[1])
+        if inicio.day == 1 and fin_mes <= hasta:
+            segmentos.append(('ventas_mensuales', 'mes', inicio.strftime('%Y-%m'), inicio.strftime('%Y-%m')))
+        else:
+            segmentos.append(('ventas_diarias', 'dia', inicio.isoformat(), min(fin_mes, hasta).isoformat()))
+        inicio = fin_mes + timedelta(days=1)
+    # Meses completos consecutivos en un solo rango
+    unidos = []
+    for segmento in segmentos:
+        if unidos and unidos[-1][0] == segmento[0] == 'ventas_mensuales':
+            unidos[-1] = (*unidos[-1][:3], segmento[3])
+        else:
+            unidos.append(segmento)
+    return unidos
+
+def consultar(conn, desde, hasta, agrupar='dia', tipo=None, metodo_pago=None, estado=None):
+    """Filas {clave, ordenes, unidades, ingresos} entre dos fechas (YYYY-MM-DD, inclusivo)"""
+    desde, hasta = _fecha(desde, 'desde'), _fecha(hasta, 'hasta')
+    if desde > hasta:
+        raise ReporteInvalido('desde no puede ser posterior a hasta')
+    if agrupar not in AGRUPACIONES:
+        raise ReporteInvalido(f"agrupar debe ser uno de: {', '.join(AGRUPACIONES)}")
+
+    if agrupar == 'dia':
+        segmentos = [('ventas_diarias', 'dia', desde.isoformat(), hasta.isoformat())]
+    else:
+        segmentos = _segmentos(desde, hasta)
+
+    condiciones, filtros = [], []
+    if agrupar == 'tipo':
+        condiciones.append("tipo != ''")
+    if agrupar != 'tipo' or tipo:
+        condiciones.append('tipo = ?')
+        filtros.append(tipo or '')
+    for columna, valor in (('metodo_pago', metodo_pago), ('estado', estado)):
+        if valor:
+            condiciones.append(f'{columna} = ?')
+            filtros.append(valor)
+
+    consultas, params = [], []
+    for tabla, columna, inicio, fin in segmentos:
+        if agrupar == 'mes':
+            clave = 'substr(dia, 1, 7)' if columna == 'dia' else 'mes'
+        else:
+            clave = columna if agrupar == 'dia' else agrupar
+        consultas.append(f'''
+            SELECT {clave} AS clave, ordenes, unidades, ingresos FROM {tabla}
+            WHERE {columna} BETWEEN ? AND ? AND {' AND '.join(condiciones)}
+        ''')
+        params += [inicio, fin] + filtros
+    filas = conn.execute(f'''
+        SELECT clave, SUM(ordenes) AS ordenes, SUM(unidades) AS unidades, ROUND(SUM(ingresos), 2) AS ingresos
+        FROM ({' UNION ALL '.join(consultas)})
+        GROUP BY clave ORDER BY clave
+    ''', params).fetchall()
+    return [dict(fila) for fila in filas]
+
+def main():
+    parser = argparse.ArgumentParser(description='Agregados de ventas para los reportes')
+    parser.add_argument('--reconstruir', action='store_true', help='vaciar los agregados y recalcular todo')
+    args = parser.parse_args()
+
+    from migraciones import aplicar_migraciones
+    conn = get_db_connection()
+    aplicar_migraciones(conn)
+    inicio = time.perf_counter()
+    ordenes, dias = reconstruir(conn) if args.reconstruir else acumular(conn)
+    conn.close()
+    print(f'{ordenes} órdenes acumuladas y {dias} días recalculados en {time.perf_counter() - inicio:.2f}s')
+
+if __name__ == '__main__':
+    main()
@@ -711,9 +711,17 @@ function setupAnimations() {
 }
 
 /**
- * Actualizar contador del carrito
- */
-function actualizarContadorCarrito() {
+ * Actualizar contador del carrito (si se conoce el total se pinta sin consultar al servidor)
+ */
+function actualizarContadorCarrito(count) {
+    if (typeof count === 'number') {
+        const contador = document.getElementById('carrito-count');
+        if (contador) {
+            contador.textContent = count;
+            contador.style.display = count > 0 ? 'block' : 'none';
+        }
+        return;
+    }
     fetch('/api/carrito/count')
         .then(res => res.json())
         .then(data => {
@@ -742,7 +750,7 @@ function agregarAlCarritoGlobal(productoId, cantidad = 1) {
             Swal.close();
             if (data.success) {
                 Swal.fire({ icon: 'success', title: '¡Agregado!', text: data.message, timer: 2000, showConfirmButton: false, toast: true, position: 'top-end', backdrop: false });
-                actualizarContadorCarrito();
+                actualizarContadorCarrito(data.count);
             } else {
                 Swal.fire({ icon: 'error', title: 'Error', text: data.message || 'No se pudo agregar' });
             }
@@ -802,6 +810,4 @@ console.log(`
 🌐 Proyecto DataCraft SQLite y Render
 🔍 UAT System: Timer inactividad solo con actividad real
 ===================================================
-`);
-
-document.addEventListener('DOMContentLoaded', () => setTimeout(actualizarContadorCarrito, 1000));
\ No newline at end of file
+`);
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""Lectura en streaming de formularios multipart con una imagen.
+
+request.files obliga a Werkzeug a leer el cuerpo completo (hasta 16MB) antes
+de que la vista pueda validar nada, y solo se validaba la extensión. Aquí el
+cuerpo se consume en bloques con el decodificador multipart de Werkzeug: la
+imagen va directo a un temporal dentro del almacén, se reconoce por sus
+primeros bytes (no por la extensión) y sus dimensiones se leen de la cabecera
+en cuanto llegan. Si algo no cuadra se corta antes de leer el resto del cuerpo.
+Al guardar, el temporal se mueve atómicamente a su nombre por contenido.
+"""
+import hashlib
+import os
+
+from flask import g, request
+from werkzeug.datastructures import ImmutableMultiDict
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from imagenes import consolidar, temporal_almacen
+
+try:
+    from PIL import Image, ImageFile
+except ImportError:  # pragma: no cover - dependencia opcional
+    ImageFile = None
+
+BLOQUE = 64 * 1024
+MAX_CAMPO = 64 * 1024            # bytes por campo de texto
+MAX_PARTES = 100
+MAX_LADO = int(os.environ.get('TIENDA_IMAGEN_MAX_LADO', 6000))
+MAX_PIXELES = int(os.environ.get('TIENDA_IMAGEN_MAX_PIXELES', 24_000_000))
+
+# Firmas de los formatos aceptados: (desplazamiento, bytes) -> extensión
+FIRMAS = [
+    ((0, b'\xff\xd8\xff'), 'jpg'),
+    ((0, b'\x89PNG\r\n\x1a\n'), 'png'),
+    ((0, b'GIF87a'), 'gif'),
+    ((0, b'GIF89a'), 'gif'),
+    ((8, b'WEBP'), 'webp'),
+]
+BYTES_FIRMA = 12
+
+class SubidaRechazada(Exception):
+    """La subida no es una imagen aceptable; `status` es el código HTTP a devolver"""
+
+    def __init__(self, mensaje, status=400):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+
+def detectar_formato(cabecera):
+    for (desplazamiento, firma), extension in FIRMAS:
+        if cabecera[desplazamiento:desplazamiento + len(firma)] == firma:
+            if extension == 'webp' and not cabecera.startswith(b'RIFF'):
+                continue
+            return extension
+    return None
+
+class ImagenSubida:
+    """Imagen ya validada en un temporal; guardar() la mueve al almacén"""
+
+    def __init__(self, temporal, digest, extension, tamano, dimensiones):
+        self.temporal = temporal
+        self.digest = digest
+        self.extension = extension
+        self.tamano = tamano
+        self.dimensiones = dimensiones
+
+    def guardar(self):
+        url = consolidar(self.temporal, self.digest, self.extension)
+        self.temporal = None
+        return url
+
+class _Receptor:
+    """Escribe la parte del archivo a disco validándola a medida que llega.
+
+    El temporal se anota en temporales para borrarlo si no se llega a guardar.
+    """
+
+    def __init__(self, temporales):
+        self.descriptor, self.temporal = temporal_almacen()
+        temporales.append(self.temporal)
+        self.archivo = os.fdopen(self.descriptor, 'wb')
+        self.digest = hashlib.sha256()
+        self.tamano = 0
+        self.cabecera = b''
+        self.extension = None
+        self.dimensiones = None
+        self.parser = ImageFile.Parser() if ImageFile is not None else None
+
+    def recibir(self, datos):
+        self.archivo.write(datos)
+        self.digest.update(datos)
+        self.tamano += len(datos)
+
+        if self.extension is None:
+            self.cabecera += datos[:BYTES_FIRMA]
+            if len(self.cabecera) < BYTES_FIRMA:
+                return
+            self.extension = detectar_formato(self.cabecera)
+            if self.extension is None:
+                raise SubidaRechazada('El archivo no es una imagen JPEG, PNG, GIF o WebP', 415)
+
+        # Pillow conoce el tamaño apenas tiene la cabecera; no hace falta el resto
+        if self.parser is not None and self.dimensiones is None:
+            try:
+                self.parser.feed(datos)
+            except Image.DecompressionBombError:
+                raise SubidaRechazada('La imagen es demasiado grande', 413)
+            except Exception:
+                raise SubidaRechazada('La imagen está dañada')
+            if self.parser.image is not None:
+                self.dimensiones = self.parser.image.size
+                self.parser = None
+                ancho, alto = self.dimensiones
+                if max(ancho, alto) > MAX_LADO or ancho * alto > MAX_PIXELES:
+                    raise SubidaRechazada(f'La imagen es demasiado grande ({ancho}x{alto}px)', 413)
+
+    def terminar(self):
+        self.archivo.close()
+        if self.tamano == 0:
+            return None
+        if self.extension is None:
+            raise SubidaRechazada('El archivo no es una imagen JPEG, PNG, GIF o WebP', 415)
+        return ImagenSubida(self.temporal, self.digest.hexdigest(), self.extension,
+                            self.tamano, self.dimensiones)
+
+def leer_formulario(campo_imagen='imagen'):
+    """(formulario, ImagenSubida o None) leyendo el cuerpo de la petición en bloques.
+
+    Los demás archivos del formulario se ignoran. Si la petición no es
+    multipart se usa request.form tal cual.
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return request.form, None
+
+    # El límite por campo se controla aquí: el del decodificador cuenta también
+    # lo que queda en su búfer de la parte del archivo
+    decodificador = MultipartDecoder(boundary.encode('latin-1'), max_parts=MAX_PARTES)
+    campos = []
+    actual = None       # ['campo', nombre, [bytes], tamaño], ['imagen', receptor] o None si se ignora
+    imagen = None
+    fin = False
+
+    try:
+        while True:
+            evento = decodificador.next_event()
+            if isinstance(evento, NeedData):
+                if fin:
+                    raise SubidaRechazada('El formulario llegó incompleto')
+                bloque = request.stream.read(BLOQUE)
+                fin = not bloque
+                decodificador.receive_data(bloque or None)
+            elif isinstance(evento, Field):
+                actual = ['campo', evento.name, [], 0]
+            elif isinstance(evento, File):
+                if evento.name == campo_imagen and evento.filename and imagen is None:
+                    actual = ['imagen', _Receptor(g.setdefault('subidas_temporales', []))]
+                else:
+                    actual = None
+            elif isinstance(evento, Data):
+                if actual is not None:
+                    if actual[0] == 'campo':
+                        actual[2].append(evento.data)
+                        actual[3] += len(evento.data)
+                        if actual[3] > MAX_CAMPO:
+                            raise SubidaRechazada(f'El campo {actual[1]} es demasiado largo', 413)
+                    else:
+                        actual[1].recibir(evento.data)
+                if not evento.more_data and actual is not None:
+                    if actual[0] == 'campo':
+                        campos.append((actual[1], b''.join(actual[2]).decode('utf-8', 'replace')))
+                    else:
+                        imagen = actual[1].terminar()
+                    actual = None
+            elif isinstance(evento, Epilogue):
+                break
+    except ValueError as error:
+        raise SubidaRechazada(f'Formulario inválido: {error}')
+    finally:
+        if actual is not None and actual[0] == 'imagen':
+            actual[1].archivo.close()
+
+    return ImmutableMultiDict(campos), imagen
+
+def recibir_imagen(flujo, temporales):
+    """ImagenSubida (o None si está vacío) leyendo flujo por bloques, con las mismas validaciones.
+
+    Para imágenes que no llegan en un formulario, como las de un zip de
+    importación. Lanza SubidaRechazada.
+    """
+    receptor = _Receptor(temporales)
+    try:
+        while True:
+            datos = flujo.read(BLOQUE)
+            if not datos:
+                break
+            receptor.recibir(datos)
+    finally:
+        receptor.archivo.close()
+    return receptor.terminar()
+
+def limpiar_temporales(exception=None):
+    """teardown: borrar temporales de subidas rechazadas o no guardadas"""
+    for temporal in g.pop('subidas_temporales', []):
+        if temporal and os.path.exists(temporal):
+            os.remove(temporal)
+
+def init_app(app):
+    app.teardown_request(limpiar_temporales)
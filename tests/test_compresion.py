@@ -0,0 +1,166 @@
+"""Cabeceras de compresion.py: ETag/304, If-Modified-Since, brotli/gzip, Vary y @condicional."""
+import gzip
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# La base de las pruebas es un temporal; DATABASE se lee al importar database
+os.environ['TIENDA_DB'] = os.path.join(tempfile.mkdtemp(), 'pruebas.db')
+
+import pytest
+from flask import Flask, Response
+
+import compresion
+import database
+from compresion import MiddlewareCompresion, condicional
+
+HTML = '<html><body>' + 'producto ' * 400 + '</body></html>'
+ULTIMA_MODIFICACION = 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+@pytest.fixture(scope='module')
+def app():
+    database.init_database()
+    app = Flask(__name__)
+    app.secret_key = 'pruebas'
+    database.init_app(app)
+    app.wsgi_app = MiddlewareCompresion(app.wsgi_app)
+
+    @app.route('/pagina')
+    def pagina():
+        return HTML
+
+    @app.route('/fechada')
+    def fechada():
+        respuesta = Response(HTML, content_type='text/html; charset=utf-8')
+        respuesta.headers['Last-Modified'] = ULTIMA_MODIFICACION
+        return respuesta
+
+    @app.route('/streaming')
+    def streaming():
+        return Response((HTML for _ in range(3)), content_type='text/html; charset=utf-8')
+
+    @app.route('/catalogo')
+    @condicional('catalogo', por_sesion=False)
+    def catalogo():
+        return HTML
+
+    @app.route('/personal')
+    @condicional('catalogo')
+    def personal():
+        return HTML
+
+    return app
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+def subir_version(clave='catalogo'):
+    conn = database.get_db_connection()
+    conn.execute("UPDATE versiones SET valor = valor + 1, actualizado = datetime('now', '+1 second') WHERE clave = ?",
+                 (clave,))
+    conn.commit()
+    conn.close()
+
+def test_200_y_luego_304_con_if_none_match(cliente):
+    primera = cliente.get('/pagina')
+    assert primera.status_code == 200
+    etag = primera.headers['ETag']
+    assert etag.startswith('W/"')
+
+    segunda = cliente.get('/pagina', headers={'If-None-Match': etag})
+    assert segunda.status_code == 304
+    assert segunda.data == b''
+    assert segunda.headers['ETag'] == etag
+    assert 'Content-Length' not in segunda.headers
+
+def test_if_none_match_distinto_devuelve_200(cliente):
+    assert cliente.get('/pagina', headers={'If-None-Match': 'W/"otro"'}).status_code == 200
+
+def test_if_modified_since(cliente):
+    assert cliente.get('/fechada', headers={'If-Modified-Since': ULTIMA_MODIFICACION}).status_code == 304
+    anterior = 'Tue, 31 Dec 2024 00:00:00 GMT'
+    assert cliente.get('/fechada', headers={'If-Modified-Since': anterior}).status_code == 200
+
+def test_if_none_match_manda_sobre_if_modified_since(cliente):
+    respuesta = cliente.get('/fechada', headers={'If-None-Match': 'W/"otro"',
+                                                 'If-Modified-Since': ULTIMA_MODIFICACION})
+    assert respuesta.status_code == 200
+
+def test_condicional_304_sin_ejecutar_la_vista(app, cliente):
+    primera = cliente.get('/catalogo')
+    assert primera.status_code == 200
+    assert primera.headers['Cache-Control'] == 'public, no-cache'
+    etag, ultima = primera.headers['ETag'], primera.headers['Last-Modified']
+
+    assert cliente.get('/catalogo', headers={'If-None-Match': etag}).status_code == 304
+    assert cliente.get('/catalogo', headers={'If-Modified-Since': ultima}).status_code == 304
+
+def test_etag_nuevo_tras_subir_versiones(cliente):
+    primera = cliente.get('/catalogo')
+    etag, ultima = primera.headers['ETag'], primera.headers['Last-Modified']
+
+    subir_version()
+    segunda = cliente.get('/catalogo', headers={'If-None-Match': etag})
+    assert segunda.status_code == 200
+    assert segunda.headers['ETag'] != etag
+    assert cliente.get('/catalogo', headers={'If-Modified-Since': ultima}).status_code == 200
+
+@pytest.mark.skipif(compresion.brotli is None, reason='brotli no instalado')
+def test_brotli_si_se_acepta(cliente):
+    respuesta = cliente.get('/pagina', headers={'Accept-Encoding': 'gzip, br'})
+    assert respuesta.headers['Content-Encoding'] == 'br'
+    assert compresion.brotli.decompress(respuesta.data).decode() == HTML
+    assert int(respuesta.headers['Content-Length']) == len(respuesta.data)
+
+def test_gzip_si_no_se_acepta_brotli(cliente):
+    respuesta = cliente.get('/pagina', headers={'Accept-Encoding': 'gzip'})
+    assert respuesta.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(respuesta.data).decode() == HTML
+
+def test_sin_accept_encoding_no_comprime(cliente):
+    respuesta = cliente.get('/pagina')
+    assert 'Content-Encoding' not in respuesta.headers
+    assert respuesta.data.decode() == HTML
+
+def test_mismo_etag_para_todas_las_codificaciones(cliente):
+    etags = {cliente.get('/pagina', headers={'Accept-Encoding': codificacion}).headers['ETag']
+             for codificacion in ('', 'gzip', 'br')}
+    assert len(etags) == 1
+
+def test_vary_accept_encoding(cliente):
+    for cabeceras in ({}, {'Accept-Encoding': 'gzip'}):
+        assert 'Accept-Encoding' in cliente.get('/pagina', headers=cabeceras).headers['Vary']
+
+def test_streaming_pasa_sin_comprimir(cliente):
+    respuesta = cliente.get('/streaming', headers={'Accept-Encoding': 'gzip, br'})
+    assert respuesta.status_code == 200
+    assert 'Content-Length' not in respuesta.headers
+    assert 'Content-Encoding' not in respuesta.headers
+    assert 'ETag' not in respuesta.headers
+    assert respuesta.data.decode() == HTML * 3
+
+def test_por_sesion_etag_distinto_por_usuario(app):
+    etags = []
+    for usuario in (1, 2):
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['user_id'] = usuario
+            sesion['carrito_count'] = 0
+        respuesta = cliente.get('/personal')
+        assert respuesta.headers['Cache-Control'] == 'private, no-cache'
+        # Con usuario, If-Modified-Since no sirve: no se envía Last-Modified
+        assert 'Last-Modified' not in respuesta.headers
+        etags.append(respuesta.headers['ETag'])
+        assert cliente.get('/personal', headers={'If-None-Match': etags[-1]}).status_code == 304
+    assert etags[0] != etags[1]
+
+def test_por_sesion_cambia_con_el_carrito(app):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['carrito_count'] = 0
+    etag = cliente.get('/personal').headers['ETag']
+    with cliente.session_transaction() as sesion:
+        sesion['carrito_count'] = 3
+    assert cliente.get('/personal', headers={'If-None-Match': etag}).status_code == 200
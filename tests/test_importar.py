@@ -0,0 +1,49 @@
+"""Validación de filas de importar.py: URLs /static/ que salen de static con .."""
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIENDA_DB', os.path.join(tempfile.mkdtemp(), 'pruebas.db'))
+
+import pytest
+
+import imagenes
+import importar
+from importar import FilaInvalida, validar
+
+@pytest.fixture
+def categorias():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE categorias (id INTEGER PRIMARY KEY, nombre TEXT, tipo TEXT)')
+    conn.execute("INSERT INTO categorias (id, nombre, tipo) VALUES (1, 'Camisas', 'hombres')")
+    resultado = importar.Categorias(conn)
+    conn.close()
+    return resultado
+
+def fila(imagen):
+    return {'nombre': 'Camisa', 'precio': '100', 'categoria_id': '1', 'imagen': imagen}
+
+@pytest.mark.parametrize('url', [
+    '/static/../importar.py',
+    '/static/../../../../../../etc/passwd',
+    '/static/images/../../requirements.txt',
+])
+def test_imagen_fuera_de_static_se_rechaza(categorias, url):
+    assert imagenes.ruta_local(url) is None
+    with pytest.raises(FilaInvalida, match='no está dentro de /static/'):
+        validar(fila(url), categorias, None)
+
+def test_imagen_dentro_de_static_se_acepta(categorias, tmp_path, monkeypatch):
+    directorio = tmp_path / 'static' / 'images'
+    directorio.mkdir(parents=True)
+    (directorio / 'foto.jpg').write_bytes(b'jpg')
+    monkeypatch.setattr(imagenes, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(imagenes, 'DIRECTORIO_STATIC', os.path.realpath(tmp_path / 'static'))
+
+    # Un .. que no sale de static es válido y se guarda tal cual
+    url = '/static/images/../images/foto.jpg'
+    assert imagenes.ruta_local(url) == str(directorio / 'foto.jpg')
+    assert validar(fila(url), categorias, None)[5] == url